@@ -4,5 +4,7 @@
 """
 # 注册 GenericExtractor
 from . import extract_generic  # noqa: F401
+# 注册 ComputedExtractor（不调用 LLM 的确定性计算）
+from . import extract_computed  # noqa: F401
 # 注册 GenericParagraphGenerator（通过 generate/__init__.py 间接导入 base）
 from . import generate  # noqa: F401
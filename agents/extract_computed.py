@@ -0,0 +1,223 @@
+"""
+ComputedExtractor：不调用 LLM，直接在解析后的 DataFrame 上计算确定性的 key。
+
+sheet_tasks.yaml 示例：
+    sum_total:
+      prompt: extract/extract_subject_info.txt
+      names:                              # 命名区域（可选），在 compute 中按名字引用
+        subjects: A10:A15
+      compute:                            # 只列出可直接计算的 key，其余 key 仍交给 LLM
+        sum_subjects: count(subjects)
+        cum_recov_rate_feces: C16
+        total_max: max(col("总值"))
+      keys:
+        ...
+
+表达式是 Python 语法的一个白名单子集（用 ast 解析，不执行任意代码）：
+- 单元格：C16 或 cell("C16")（Excel 坐标，第 1 行为表头，与 xls.parse 的结果对齐）
+- 区域：A10:C15 或 range("A10:C15")、names 中声明的名字
+- 整列：col("表头名") 或 col("C")
+- 聚合：sum / mean / max / min / count（非空个数）/ nunique / first / last / rows()（非空行数）
+- 运算：+ - * /、一元负号、数字/字符串常量、round(x, n)；列与列之间按元素（向量化）计算
+"""
+from __future__ import annotations
+import ast, logging, re
+import pandas as pd
+
+from agents.registry import register_extractor
+
+SYS_LOG    = logging.getLogger("system")
+USER_LOG   = logging.getLogger("user")
+CONFIG_LOG = logging.getLogger("config")
+
+_CELL_RE  = re.compile(r"^([A-Z]{1,3})([1-9]\d*)$")
+_RANGE_RE = re.compile(r"^([A-Z]{1,3})([1-9]\d*):([A-Z]{1,3})([1-9]\d*)$")
+_BARE_RANGE_RE = re.compile(r"(?<![\w\"'])([A-Z]{1,3}[1-9]\d*:[A-Z]{1,3}[1-9]\d*)(?![\w\"'])")
+
+def _col_index(letters: str) -> int:
+    n = 0
+    for ch in letters:
+        n = n * 26 + (ord(ch) - 64)
+    return n - 1
+
+def _numeric(v):
+    if isinstance(v, pd.DataFrame):
+        return v.apply(pd.to_numeric, errors="coerce")
+    if isinstance(v, pd.Series):
+        return pd.to_numeric(v, errors="coerce")
+    if isinstance(v, str):
+        return float(v.replace(",", "").replace("%", "").strip())
+    return v
+
+def _flat(v) -> pd.Series:
+    if isinstance(v, pd.DataFrame):
+        return pd.Series(v.to_numpy().ravel())
+    if isinstance(v, pd.Series):
+        return v
+    return pd.Series([v])
+
+def _non_blank(s: pd.Series) -> pd.Series:
+    return s[s.notna() & s.astype(str).str.strip().ne("")]
+
+def _first(v):
+    s = _non_blank(_flat(v))
+    return s.iloc[0] if s.size else None
+
+def _last(v):
+    s = _non_blank(_flat(v))
+    return s.iloc[-1] if s.size else None
+
+def _scalar(v):
+    """numpy 标量 → Python 原生值，便于 JSON/日志/coerce。"""
+    if hasattr(v, "item"):
+        try:
+            return v.item()
+        except (ValueError, AttributeError):
+            pass
+    return v
+
+_AGGREGATES = {
+    "sum":     lambda v: _numeric(_flat(v)).sum(),
+    "mean":    lambda v: _numeric(_flat(v)).mean(),
+    "max":     lambda v: _numeric(_flat(v)).max(),
+    "min":     lambda v: _numeric(_flat(v)).min(),
+    "count":   lambda v: int(_non_blank(_flat(v)).size),
+    "nunique": lambda v: int(_non_blank(_flat(v)).nunique()),
+    "first":   _first,
+    "last":    _last,
+}
+
+_BINOPS = {
+    ast.Add:  lambda a, b: a + b,
+    ast.Sub:  lambda a, b: a - b,
+    ast.Mult: lambda a, b: a * b,
+    ast.Div:  lambda a, b: a / b,
+}
+
+# 各函数允许的参数个数（最少, 最多）；未列出的为 1 个
+_ARITY = {"rows": (0, 0), "round": (1, 2)}
+
+class ComputeError(ValueError):
+    pass
+
+def parse_expr(expr: str) -> ast.AST:
+    """解析并做白名单检查；不合法时抛 ComputeError（验证器也复用）。"""
+    # 允许直接写区域 A1:B3（不是合法的 Python 表达式），先改写成 range("A1:B3")
+    src = _BARE_RANGE_RE.sub(r'range("\1")', str(expr).strip())
+    try:
+        tree = ast.parse(src, mode="eval")
+    except SyntaxError as e:
+        raise ComputeError(f"表达式语法错误：{expr}（{e.msg}）") from e
+    allowed_calls = set(_AGGREGATES) | {"cell", "range", "col", "rows", "round"}
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Call):
+            if not isinstance(node.func, ast.Name) or node.func.id not in allowed_calls or node.keywords:
+                raise ComputeError(f"不支持的函数调用：{ast.unparse(node)}")
+            lo, hi = _ARITY.get(node.func.id, (1, 1))
+            if not lo <= len(node.args) <= hi:
+                want = str(lo) if lo == hi else f"{lo}~{hi}"
+                raise ComputeError(f"{node.func.id}() 需要 {want} 个参数：{ast.unparse(node)}")
+        elif not isinstance(node, (ast.Expression, ast.BinOp, ast.UnaryOp, ast.USub, ast.UAdd,
+                                   ast.Name, ast.Constant, ast.Load) + tuple(_BINOPS)):
+            raise ComputeError(f"表达式包含不支持的语法：{type(node).__name__}（{expr}）")
+    return tree
+
+@register_extractor
+class ComputedExtractor:
+    """
+    DataFrame + compute 表达式  →  JSON（不调用 LLM）
+    """
+
+    def __init__(self, df: pd.DataFrame, keys: dict, compute: dict, names: dict | None = None,
+                 sheet_name: str | None = None):
+        self.df         = df
+        self.keys       = keys                  # 只含需要计算的 key → 类型
+        self.compute    = compute or {}
+        self.names      = names or {}
+        self.sheet_name = sheet_name or "UNKNOWN"
+
+    # ---------- 引用解析 ----------
+    def _cell(self, ref: str):
+        m = _CELL_RE.match(ref.strip().upper())
+        if not m:
+            raise ComputeError(f"非法单元格：{ref}")
+        c, r = _col_index(m.group(1)), int(m.group(2))
+        if c >= self.df.shape[1]:
+            return None
+        if r == 1:
+            return self.df.columns[c]
+        return self.df.iat[r - 2, c] if r - 2 < len(self.df) else None
+
+    def _range(self, ref: str) -> pd.DataFrame:
+        m = _RANGE_RE.match(ref.strip().upper())
+        if not m:
+            raise ComputeError(f"非法区域：{ref}")
+        c0, r0, c1, r1 = _col_index(m.group(1)), int(m.group(2)), _col_index(m.group(3)), int(m.group(4))
+        # 表头行（第 1 行）不参与区域计算
+        block = self.df.iloc[max(r0, 2) - 2:r1 - 1, c0:c1 + 1]
+        return block.iloc[:, 0] if block.shape[1] == 1 else block
+
+    def _col(self, name: str) -> pd.Series:
+        if name in self.df.columns:
+            return self.df[name]
+        if re.fullmatch(r"[A-Z]{1,3}", name):
+            idx = _col_index(name)
+            if idx >= self.df.shape[1]:
+                raise ComputeError(f"列超出范围：{name}（共 {self.df.shape[1]} 列）")
+            return self.df.iloc[:, idx]
+        raise ComputeError(f"列不存在：{name}")
+
+    def _name(self, ident: str):
+        if ident in self.names:
+            ref = str(self.names[ident])
+            return self._range(ref) if ":" in ref else self._cell(ref)
+        if _CELL_RE.match(ident):
+            return self._cell(ident)
+        return self._col(ident)
+
+    # ---------- 求值 ----------
+    def _eval(self, node):
+        if isinstance(node, ast.Expression):
+            return self._eval(node.body)
+        if isinstance(node, ast.Constant):
+            return node.value
+        if isinstance(node, ast.Name):
+            return self._name(node.id)
+        if isinstance(node, ast.UnaryOp):
+            v = _numeric(self._eval(node.operand))
+            return -v if isinstance(node.op, ast.USub) else v
+        if isinstance(node, ast.BinOp):
+            return _BINOPS[type(node.op)](_numeric(self._eval(node.left)), _numeric(self._eval(node.right)))
+        # ast.Call（parse_expr 已做白名单）
+        fn, args = node.func.id, node.args
+        if fn == "rows":
+            return int(self.df.notna().any(axis=1).sum())
+        if fn in ("cell", "range", "col"):
+            arg = self._eval(args[0])
+            return {"cell": self._cell, "range": self._range, "col": self._col}[fn](str(arg))
+        if fn == "round":
+            v = _numeric(self._eval(args[0]))
+            return round(v, int(self._eval(args[1])) if len(args) > 1 else 0)
+        return _AGGREGATES[fn](self._eval(args[0]))
+
+    def evaluate(self, expr: str):
+        v = self._eval(parse_expr(expr))
+        if isinstance(v, (pd.Series, pd.DataFrame)):
+            raise ComputeError(f"表达式结果不是单个值（请用 sum/max/count 等聚合）：{expr}")
+        if v is not None and pd.isna(v):
+            return None
+        return _scalar(v)
+
+    # ---------- public ----------
+    def extract(self) -> dict:
+        out = {}
+        for k in self.keys:
+            expr = self.compute.get(k)
+            try:
+                out[k] = self.evaluate(expr)
+            except Exception as e:
+                out[k] = None
+                SYS_LOG.warning(f"[COMPUTE-FAIL] {self.sheet_name}.{k} = {expr}：{e}")
+        CONFIG_LOG.debug(f"[COMPUTE-VALUES] sheet={self.sheet_name} exprs={self.compute} values={out}")
+        USER_LOG.info(f"[计算完成] {self.sheet_name} → " + ", ".join(f"{k}={v}" for k, v in out.items()))
+        return out
@@ -1,8 +1,12 @@
 from pathlib import Path
+from core.context_pool import ContextThreadPoolExecutor
 import json, os, pandas as pd, logging
-from jinja2 import Template
 from agents.registry import register_extractor
 from llm_client import apply_provider
+from core.router import Route, routed_invoke
+from core.prompts import render_prompt
+from utils.tokens import estimate_tokens
+from utils.table_text import clean_table, render_table
 from logging.handlers import TimedRotatingFileHandler
 
 # -------------------- 日志兜底初始化（仅当外部未配置时） --------------------
@@ -40,14 +44,59 @@ SYS_LOG    = logging.getLogger("system")
 CONFIG_LOG = logging.getLogger("config")
 # -----------------------------------------------------------------------
 
+# 分块抽取时追加在各块 Prompt 之后：每块只含部分行，缺失的字段应返回 null 而不是猜测
+CHUNK_NOTE = "\n\n注意：本次提供的表格只是完整表格的第 {i}/{n} 块（表头已保留）。若某个字段的值不在本块中，请返回 null，不要推测或编造。"
+
 TYPE_MAP = {
     "number": {"type": "number"},
     "string": {"type": "string"},
     "array[string]": {"type": "array", "items": {"type": "string"}},
 }
 
-def df_to_text(df: pd.DataFrame) -> str:
-    return df.to_csv(index=False)
+def df_to_text(df: pd.DataFrame, fmt: str = "csv") -> str:
+    """fmt=csv 为原样 CSV；其它格式（compact_csv/tsv/markdown）要求 df 已经过 clean_table。"""
+    return render_table(df, fmt)
+
+# ---------------- 分块抽取：各块结果的按键合并规则 ----------------
+def _to_number(v):
+    s = str(v).strip()
+    pct = s.endswith("%")
+    return float(s.replace(",", "").replace("%", "").strip()), pct
+
+def _reduce_first(vals):
+    return vals[0]
+
+def _reduce_sum(vals):
+    nums = [_to_number(v) for v in vals]
+    total = sum(n for n, _ in nums)
+    return f"{total:g}%" if all(p for _, p in nums) else total
+
+def _reduce_max(vals):
+    return max(vals, key=lambda v: _to_number(v)[0])
+
+def _reduce_min(vals):
+    return min(vals, key=lambda v: _to_number(v)[0])
+
+def _reduce_concat(vals):
+    if any(isinstance(v, list) for v in vals):
+        out = []
+        for v in vals:
+            for x in (v if isinstance(v, list) else [v]):
+                if x not in out:
+                    out.append(x)
+        return out
+    return "；".join(dict.fromkeys(str(v) for v in vals))
+
+REDUCERS = {
+    "first":  _reduce_first,     # 第一个非空值（默认）
+    "sum":    _reduce_sum,
+    "max":    _reduce_max,
+    "min":    _reduce_min,
+    "concat": _reduce_concat,    # 列表去重拼接 / 字符串用“；”拼接
+}
+
+# 全局默认表格 token 预算（0 = 不分块）；sheet_tasks.yaml 的 chunking.max_tokens 优先
+EXTRACT_TOKEN_BUDGET = int(os.getenv("EXTRACT_TOKEN_BUDGET", "0"))
 
 def _truncate(txt: str, limit: int = 4000) -> str:
     return txt if len(txt) <= limit else (txt[:limit] + "\n...[truncated]")
@@ -78,7 +127,7 @@ def _kv_summary(d: dict, maxlen: int = 300) -> str:
 class GenericExtractor:
     """
     DataFrame + prompt + keys  →  JSON
-    provider 缺省看环境变量 LLM_PROVIDER，默认 openai
+    provider 缺省看环境变量 LLM_PROVIDER，默认 openai；可为列表/加权字典（见 core/router.py）
     """
 
     def __init__(
@@ -86,20 +135,45 @@ class GenericExtractor:
         df,
         keys: dict,
         prompt_path: str | Path,
-        provider: str | None = None,
+        provider: str | list | dict | None = None,
         config_dir: Path = Path(""),
         sheet_name: str | None = None,          # ← 便于日志标注
+        cache=None,                             # ← core.llm_cache.LLMCache；None 表示不走缓存
+        chunking: dict | None = None,           # ← {max_tokens, head_rows, reducers}；超预算时分块抽取
+        table_format: str = "csv",              # ← csv / compact_csv / tsv / markdown
+        float_digits: int | None = None,        # ← 非 csv 格式下浮点保留的小数位
+        on_call=None,                           # ← 每次 LLM 调用结束时回调一条调用记录（重试/对冲次数等）
+        failover_after: float | None = None,    # ← 多 provider 时，超过该秒数未返回即切换到下一个
     ):
-        self.df          = df
+        self.raw_df      = df
+        self.table_format = table_format or "csv"
+        # csv 保持原样；其它格式先清洗（去空行/列、规范表头、数值格式化），分块也基于清洗后的表
+        self.df          = df if self.table_format == "csv" else clean_table(df, float_digits)
         self.keys        = keys
         self.prompt_path = Path(prompt_path)
         self.sheet_name  = sheet_name or "UNKNOWN"
-        provider         = provider or os.getenv("LLM_PROVIDER", "openai")
-        self.client, self.model_name = apply_provider(provider, config_dir)
+        self.cache       = cache
+        self.on_call     = on_call
+        chunking         = chunking or {}
+        self.max_tokens  = int(chunking.get("max_tokens") or EXTRACT_TOKEN_BUDGET)
+        self.head_rows   = int(chunking.get("head_rows", 0))
+        self.reducers    = dict(chunking.get("reducers") or {})
+        self.route       = Route.parse(provider or os.getenv("LLM_PROVIDER", "openai"), failover_after)
+        self.provider    = self.route.label         # 单个 provider 时即其名称（缓存键/日志用）
+        self.config_dir  = config_dir
+        self.client, self.model_name = apply_provider(self.route.primary, config_dir)
+        self._prompt     = None                     # 整表 Prompt（规划批量时估算 token 已渲染过，抽取时复用）
 
     # ---------- helpers ----------
-    def _build_schema(self):
-        props = {k: TYPE_MAP.get(t, {"type": "string"}) for k, t in self.keys.items()}
+    def _build_schema(self, namespace: str | None = None, nullable: bool = False):
+        """
+        namespace 非空时字段名加前缀 "<namespace>.<key>"（多 Sheet 批量抽取用）。
+        nullable=True 时各字段允许 null（分块抽取：值不在本块中时返回 null，由合并阶段取其它块的值）。
+        """
+        prefix = f"{namespace}." if namespace else ""
+        props = {f"{prefix}{k}": TYPE_MAP.get(t, {"type": "string"}) for k, t in self.keys.items()}
+        if nullable:
+            props = {k: {**v, "type": [v["type"], "null"]} for k, v in props.items()}
         return {
             "name": "extract",
             "parameters": {"type": "object",
@@ -107,43 +181,202 @@ class GenericExtractor:
                            "required": list(props)}
         }
 
-    def _render_prompt(self) -> str:
-        tpl = Template(self.prompt_path.read_text(encoding="utf-8"))
-        return tpl.render(table=df_to_text(self.df), keys=list(self.keys))
+    def _render_prompt(self, table: str | None = None) -> str:
+        """table 为 None 时渲染整表（结果缓存在实例上）；否则用给定的表格文本（分块）。"""
+        if table is None:
+            if self._prompt is None:
+                self._prompt = self._render_prompt(df_to_text(self.df, self.table_format))
+            return self._prompt
+        return render_prompt(self.prompt_path, self.config_dir, table=table, keys=list(self.keys))
 
-    # ---------- public ----------
-    def extract(self) -> dict:
-        prompt  = self._render_prompt()
-        schema  = self._build_schema()
+    def _split_chunks(self) -> list[str]:
+        """
+        按 token 预算把表格行贪心打包成若干块；每块都带表头和前 head_rows 行（标题/单位等上下文）。
+        单行超过预算时单独成块。
+        """
+        head, body = self.df.iloc[:self.head_rows], self.df.iloc[self.head_rows:]
+        base = estimate_tokens(df_to_text(head, self.table_format))
+        row_tokens = [estimate_tokens(line) + 1 for line in body.astype(str).agg(",".join, axis=1)]
 
-        # 【配置级】记录融合后的提示词 & Schema（注意可能包含敏感数据）
-        CONFIG_LOG.debug(f"[EXTRACT-PROMPT] sheet={self.sheet_name}, model={self.model_name}\n{_truncate(prompt)}")
-        CONFIG_LOG.debug(f"[EXTRACT-SCHEMA]  sheet={self.sheet_name} keys={list(self.keys)} schema={schema}")
+        chunks, start, used = [], 0, base
+        for i, n in enumerate(row_tokens):
+            if i > start and used + n > self.max_tokens:
+                chunks.append((start, i)); start, used = i, base
+            used += n
+        if start < len(row_tokens) or not chunks:
+            chunks.append((start, len(row_tokens)))
+        return [df_to_text(pd.concat([head, body.iloc[a:b]]), self.table_format) for a, b in chunks]
+
+    def _merge(self, parts: list[dict]) -> dict:
+        merged = {}
+        for k in self.keys:
+            vals = [p.get(k) for p in parts if p.get(k) not in (None, "", [])]
+            if not vals:
+                merged[k] = None
+                continue
+            name = self.reducers.get(k, "first")
+            try:
+                merged[k] = REDUCERS.get(name, _reduce_first)(vals)
+            except (TypeError, ValueError) as e:
+                SYS_LOG.warning(f"分块合并失败：{self.sheet_name}.{k} reducer={name}（{e}），改用 first")
+                merged[k] = vals[0]
+        return merged
 
-        tools = [{"type": "function", "function": schema}]
-        tool_choices = {"type": "function", "function": {"name": "extract"}}
+    def _log_table_size(self, table: str):
+        """记录序列化前（原样 CSV）/后的字符数与估算 token 数，便于每次运行量化节省。"""
+        if self.table_format == "csv":
+            SYS_LOG.info(f"表格序列化：sheet={self.sheet_name}, format=csv, chars={len(table)}, tokens≈{estimate_tokens(table)}")
+            return
+        raw = df_to_text(self.raw_df)
+        c0, c1 = len(raw), len(table)
+        t0, t1 = estimate_tokens(raw), estimate_tokens(table)
+        saved = f"{(1 - t1 / t0) * 100:.1f}%" if t0 else "-"
+        SYS_LOG.info(f"表格序列化：sheet={self.sheet_name}, format={self.table_format}, "
+                     f"chars {c0}→{c1}, tokens≈{t0}→{t1}（节省 {saved}）")
+
+    def _lookup(self, prompt: str, schema: dict, label: str):
+        """记录 Prompt/Schema 并查缓存，返回 (cache_key, cached)。"""
+        # 【配置级】记录融合后的提示词 & Schema（注意可能包含敏感数据）
+        CONFIG_LOG.debug(f"[EXTRACT-PROMPT] sheet={label}, model={self.model_name}\n{_truncate(prompt)}")
+        CONFIG_LOG.debug(f"[EXTRACT-SCHEMA]  sheet={label} keys={list(self.keys)} schema={schema}")
 
-        SYS_LOG.info(f"调用抽取 LLM：sheet={self.sheet_name}, model={self.model_name}")  # 【系统级】
+        if self.cache is None:
+            return None, None
+        cache_key = self.cache.make_key("extract", self.provider, self.model_name, prompt, schema)
+        cached = self.cache.get(cache_key)
+        if cached is not None:
+            SYS_LOG.info(f"抽取命中缓存：sheet={label}, model={self.model_name}")
+            CONFIG_LOG.debug(f"[EXTRACT-VALUES] sheet={label} (cached)\n{_pp_json(cached)}")
+            USER_LOG.info(f"[抽取完成] {label} → {_kv_summary(cached)}（缓存）")
+        return cache_key, cached
 
-        resp = self.client.chat.completions.create(
+    def _request(self, prompt: str, schema: dict) -> dict:
+        return dict(
             model        = self.model_name,
             messages     = [{"role": "system", "content": prompt}],
-            tools        = tools,
-            tool_choice  = tool_choices,
+            tools        = [{"type": "function", "function": schema}],
+            tool_choice  = {"type": "function", "function": {"name": "extract"}},
         )
 
+    def _parse(self, resp, label: str, cache_key) -> dict:
         # 返回第一个工具调用的参数
         if resp.choices[0].message.tool_calls:
             for tool_call in resp.choices[0].message.tool_calls:
                 arguments = json.loads(tool_call.function.arguments)
 
                 # ✅【配置级】记录“完整变量值 JSON”
-                CONFIG_LOG.debug(f"[EXTRACT-VALUES] sheet={self.sheet_name}\n{_pp_json(arguments)}")
+                CONFIG_LOG.debug(f"[EXTRACT-VALUES] sheet={label}\n{_pp_json(arguments)}")
 
                 # ✅【用户级】记录“变量摘要”便于快速查阅
-                USER_LOG.info(f"[抽取完成] {self.sheet_name} → {_kv_summary(arguments)}")
+                USER_LOG.info(f"[抽取完成] {label} → {_kv_summary(arguments)}")
+                if cache_key is not None:
+                    self.cache.put(cache_key, arguments)
                 return arguments
 
         # 若没有 tool_calls（极少见），给出系统日志
-        SYS_LOG.warning(f"抽取无返回 tool_calls：sheet={self.sheet_name}")
+        SYS_LOG.warning(f"抽取无返回 tool_calls：sheet={label}")
         return {}
+
+    def _call(self, prompt: str, schema: dict, label: str) -> dict:
+        """一次抽取调用（含缓存）；label 用于日志标注（sheet 或 sheet#块号）。"""
+        cache_key, cached = self._lookup(prompt, schema, label)
+        if cached is not None:
+            return cached
+
+        SYS_LOG.info(f"调用抽取 LLM：sheet={label}, model={self.model_name}")  # 【系统级】
+        req  = self._request(prompt, schema)
+        resp, model = routed_invoke(self.route, self.config_dir,
+                                    lambda c, model: (c.chat.completions.create(**{**req, "model": model}), model),
+                                    kind="extract", label=label, on_call=self.on_call, tokens=estimate_tokens(prompt))
+        if cache_key is not None and model != self.model_name:
+            # 缓存键按主 provider 的模型计算；故障切换到其他模型的结果不能记在它名下
+            SYS_LOG.info(f"抽取结果来自故障切换（model={model}），不写入缓存：sheet={label}")
+            cache_key = None
+        return self._parse(resp, label, cache_key)
+
+    # ---------- public ----------
+    def _plan(self):
+        """返回 (schema, 各次调用的 (prompt, label) 列表)；多于一项时为分块抽取。"""
+        table  = df_to_text(self.df, self.table_format)
+        self._log_table_size(table)
+
+        # 未配置预算，或整表在预算内：单次调用
+        if not self.max_tokens or estimate_tokens(table) <= self.max_tokens:
+            prompt = self._prompt if self._prompt is not None else self._render_prompt(table)
+            return self._build_schema(), [(prompt, self.sheet_name)]
+
+        # 超预算：分块 → 并行抽取 → 按键合并（map-reduce）
+        chunks = self._split_chunks()
+        SYS_LOG.info(f"分块抽取：sheet={self.sheet_name}，约 {estimate_tokens(table)} tokens > 预算 {self.max_tokens}，"
+                     f"切分为 {len(chunks)} 块")
+        return self._build_schema(nullable=True), [(self._render_prompt(c) + CHUNK_NOTE.format(i=i + 1, n=len(chunks)),
+                                                    f"{self.sheet_name}#{i + 1}") for i, c in enumerate(chunks)]
+
+    def _finish_chunks(self, parts: list[dict]) -> dict:
+        merged = self._merge(parts)
+        CONFIG_LOG.debug(f"[EXTRACT-MERGED] sheet={self.sheet_name} reducers={self.reducers}\n{_pp_json(merged)}")
+        USER_LOG.info(f"[抽取完成] {self.sheet_name} → {_kv_summary(merged)}（{len(parts)} 块合并）")
+        return merged
+
+    def extract(self) -> dict:
+        schema, calls = self._plan()
+        if len(calls) == 1:
+            return self._call(calls[0][0], schema, calls[0][1])
+        with ContextThreadPoolExecutor(max_workers=min(len(calls), 8), thread_name_prefix="chunk") as pool:
+            parts = list(pool.map(lambda c: self._call(c[0], schema, c[1]), calls))
+        return self._finish_chunks(parts)
+
+
+@register_extractor
+class BatchExtractor(GenericExtractor):
+    """
+    多个小 Sheet 合并成一次工具调用：
+    - Schema 字段名为 "<sheet>.<key>"（复用各成员的 _build_schema(namespace=sheet)）
+    - Prompt 为各成员 Prompt 依次拼接
+    - extract() 返回 {sheet: {key: value}}，缺失的 Sheet 不出现在结果中（由调用方回退单独抽取）
+    成员须为同一 provider（路由）的 GenericExtractor。
+    """
+
+    def __init__(self, members: list[GenericExtractor], cache=None):
+        first            = members[0]
+        self.on_call     = first.on_call
+        self.members     = members
+        self.sheet_name  = "+".join(m.sheet_name for m in members)
+        self.keys        = {f"{m.sheet_name}.{k}": t for m in members for k, t in m.keys.items()}
+        # Schema 字段名 → (Sheet, key)；按精确字段名拆分，Sheet 名互为点号前缀（如 财务 / 财务.附表）时也不会错配
+        self._fields     = {f"{m.sheet_name}.{k}": (m.sheet_name, k) for m in members for k in m.keys}
+        self.cache       = cache
+        self.route       = first.route
+        self.provider    = first.provider
+        self.config_dir  = first.config_dir
+        self.client, self.model_name = first.client, first.model_name
+
+    def _build_schema(self, namespace: str | None = None):
+        props = {}
+        for m in self.members:
+            props.update(m._build_schema(namespace=m.sheet_name)["parameters"]["properties"])
+        return {
+            "name": "extract",
+            "parameters": {"type": "object",
+                           "properties": props,
+                           "required": list(props)}
+        }
+
+    def _render_prompt(self, table: str | None = None) -> str:
+        names = "、".join(m.sheet_name for m in self.members)
+        head  = (f"下面包含 {len(self.members)} 个相互独立的表格抽取任务（{names}）。"
+                 f"请分别完成每个任务，并把结果一次性填入函数 \"extract\" 的参数，"
+                 f"参数名为“Sheet名.字段名”（例如 {next(iter(self.keys))}）。")
+        parts = [f"===== 任务：{m.sheet_name} =====\n{m._render_prompt()}" for m in self.members]
+        return "\n\n".join([head] + parts)
+
+    def extract(self) -> dict:
+        return self._split(self._call(self._render_prompt(), self._build_schema(), self.sheet_name))
+
+    def _split(self, flat: dict) -> dict:
+        out: dict[str, dict] = {}
+        for name, v in flat.items():
+            pair = self._fields.get(name)
+            if pair is not None:
+                out.setdefault(pair[0], {})[pair[1]] = v
+        return {m.sheet_name: out[m.sheet_name] for m in self.members if m.sheet_name in out}
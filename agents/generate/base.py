@@ -1,7 +1,9 @@
 import os, logging
-from jinja2 import Template
 from agents.registry import register_generator
 from llm_client import apply_provider
+from core.router import Route, routed_invoke
+from core.prompts import render_prompt
+from utils.tokens import estimate_tokens
 from logging.handlers import TimedRotatingFileHandler
 
 # -------------------- 日志兜底初始化（仅当外部未配置时） --------------------
@@ -47,31 +49,97 @@ class GenericParagraphGenerator:
     prompt_path + context  → 段落文本
     """
 
-    def __init__(self, prompt_path: str, context: dict, provider: str | None = None, config_dir: str = "", paragraph_id: str | None = None):
+    def __init__(self, prompt_path: str, context: dict, provider: str | list | dict | None = None, config_dir: str = "", paragraph_id: str | None = None,
+                 cache=None, on_call=None, failover_after: float | None = None):
         self.prompt_path  = prompt_path
         self.context      = context                 # 这里通常是 extracted（变量命名空间）
         self.paragraph_id = paragraph_id or "UNKNOWN"
-        provider          = provider or os.getenv("LLM_PROVIDER", "openai")
-        self.client, self.model_name = apply_provider(provider, config_dir)
+        self.cache        = cache                   # core.llm_cache.LLMCache；None 表示不走缓存
+        self.on_call      = on_call                 # 每次 LLM 调用结束时回调一条调用记录（重试/对冲次数等）
+        self.route        = Route.parse(provider or os.getenv("LLM_PROVIDER", "openai"), failover_after)
+        self.provider     = self.route.label        # 单个 provider 时即其名称（缓存键/日志用）
+        self.config_dir   = config_dir
+        self.client, self.model_name = apply_provider(self.route.primary, config_dir)
 
     # ---------- core ----------
-    def generate(self) -> str:
-        prompt = Template(open(self.prompt_path, encoding="utf-8").read()).render(**self.context)
+    def _prepare(self):
+        """渲染 Prompt 并查缓存，返回 (prompt, cache_key, cached)。"""
+        prompt = render_prompt(self.prompt_path, self.config_dir, **self.context)
 
         # ✅【配置级】记录融合后的生成 Prompt
         CONFIG_LOG.debug(f"[GEN-PROMPT] pid={self.paragraph_id}, model={self.model_name}\n{_truncate(prompt)}")
 
-        SYS_LOG.info(f"调用生成 LLM：pid={self.paragraph_id}, model={self.model_name}")  # 【系统级】
-
-        resp = self.client.chat.completions.create(
-            model    = self.model_name,
-            messages = [{"role": "system", "content": prompt}]
-        )
-        text = resp.choices[0].message.content.strip()
+        if self.cache is None:
+            return prompt, None, None
+        cache_key = self.cache.make_key("generate", self.provider, self.model_name, prompt)
+        cached = self.cache.get(cache_key)
+        if cached is not None:
+            SYS_LOG.info(f"生成命中缓存：pid={self.paragraph_id}, model={self.model_name}")
+            CONFIG_LOG.debug(f"[GEN-TEXT] pid={self.paragraph_id} (cached)\n{_truncate(cached)}")
+        return prompt, cache_key, cached
 
+    def _done(self, text: str, cache_key) -> str:
         # ✅【配置级】记录完整生成文本
         CONFIG_LOG.debug(f"[GEN-TEXT] pid={self.paragraph_id}\n{_truncate(text)}")
 
         # ✅【用户级】记录摘要（前 200 字）
         USER_LOG.info(f"[生成完成] {self.paragraph_id}：{(text[:200] + '...') if len(text)>200 else text}")
+        if cache_key is not None and text:
+            self.cache.put(cache_key, text)
         return text
+
+    def generate(self, stream: bool = False, on_token=None) -> str:
+        """
+        stream=True 时以流式方式调用 LLM，每收到一段增量文本就回调 on_token(paragraph_id, delta)；
+        返回值与非流式相同（完整文本，已 strip）。
+        """
+        prompt, cache_key, cached = self._prepare()
+        if cached is not None:
+            if on_token:
+                on_token(self.paragraph_id, cached)
+            return cached
+
+        SYS_LOG.info(f"调用生成 LLM：pid={self.paragraph_id}, model={self.model_name}")  # 【系统级】
+
+        if stream:
+            # 流式：已推送过 token 后不再重试（否则客户端会收到重复文本），也不对冲
+            emitted = []
+            def _tok(pid, delta):
+                emitted.append(len(delta))
+                if on_token:
+                    on_token(pid, delta)
+            text, model = routed_invoke(self.route, self.config_dir,
+                                        lambda c, model: (self._stream(prompt, _tok, c, model), model),
+                                        kind="generate", label=self.paragraph_id, on_call=self.on_call, stream=True,
+                                        hedge=False, can_retry=lambda: not emitted, tokens=estimate_tokens(prompt))
+            text = text.strip()
+        else:
+            resp, model = routed_invoke(self.route, self.config_dir,
+                                        lambda c, model: (c.chat.completions.create(
+                                            model    = model,
+                                            messages = [{"role": "system", "content": prompt}]
+                                        ), model),
+                                        kind="generate", label=self.paragraph_id, on_call=self.on_call,
+                                        tokens=estimate_tokens(prompt))
+            text = resp.choices[0].message.content.strip()
+        if cache_key is not None and model != self.model_name:
+            # 缓存键按主 provider 的模型计算；故障切换到其他模型的结果不能记在它名下
+            SYS_LOG.info(f"生成结果来自故障切换（model={model}），不写入缓存：pid={self.paragraph_id}")
+            cache_key = None
+        return self._done(text, cache_key)
+
+    def _stream(self, prompt: str, on_token=None, client=None, model: str | None = None) -> str:
+        parts = []
+        for chunk in (client or self.client).chat.completions.create(
+            model    = model or self.model_name,
+            messages = [{"role": "system", "content": prompt}],
+            stream   = True,
+        ):
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content or ""
+            if delta:
+                parts.append(delta)
+                if on_token:
+                    on_token(self.paragraph_id, delta)
+        return "".join(parts)
@@ -1,31 +1,63 @@
 from __future__ import annotations
-import os, io, uuid, traceback, json
+import os, io, uuid, traceback, json, logging, threading, time
+from contextlib import asynccontextmanager
 from pathlib import Path
 from datetime import datetime
-from typing import Optional, Dict, Any
-from concurrent.futures import ThreadPoolExecutor, Future
+from typing import Optional, Dict, Any, Literal
 
-from fastapi import FastAPI, HTTPException, Body, Query
-from fastapi.responses import FileResponse, PlainTextResponse, JSONResponse
+from fastapi import FastAPI, HTTPException, Body, Query, Header
+from fastapi.responses import FileResponse, PlainTextResponse, JSONResponse, StreamingResponse
 from pydantic import BaseModel, Field
 
 # ==== 引擎模块（来自你的项目） ====
 from orchestrator import run_pipeline
+from batch_runner import discover_workbooks, run_batch
 from validator.validate import validate_configs
 from validator.report import write_report_files
-from io_utils.loaders import load_excel_first
+from io_utils.loaders import load_inputs, load_yaml_strict
+from core.events import EventStream
+from core.logging_setup import job_logs
+from io_utils.log_tail import tail_lines, LogFollower
+from core.job_store import JobStore
+from core.job_queue import JobQueue, QueueFull
+from llm_client import limiter_stats
+from core.prompts import prompt_cache_stats
+from io_utils.template_pool import template_pool_stats
 
 # -------------------- 配置 --------------------
 API_MAX_WORKERS = int(os.getenv("API_MAX_WORKERS", "4"))
 WORKSPACES_ROOT = os.getenv("WORKSPACES_ROOT")  # 可选：限制所有项目必须在这个根目录下
+JOB_CLEANUP_INTERVAL_S = float(os.getenv("JOB_CLEANUP_INTERVAL_S", "600"))
+# 结束作业的实时事件流（含全部 token）在内存中保留多久；作业记录本身按 JOB_RETENTION_HOURS 保留在 SQLite 中
+JOB_EVENTS_RETENTION_S = float(os.getenv("JOB_EVENTS_RETENTION_MIN", "60")) * 60
+LOG_POLL_S = float(os.getenv("LOG_STREAM_POLL_S", "0.25"))   # 日志跟读时没有新行的轮询间隔
 # ------------------------------------------------
 
-app = FastAPI(title="Report Pipeline API", version="1.0.0")
-EXECUTOR = ThreadPoolExecutor(max_workers=API_MAX_WORKERS)
+# ---- 作业表（SQLite，重启后可查）+ 有界优先级队列 ----
+# 在 lifespan 中创建，而不是导入时：批量模式的 spawn worker 会重新导入 __main__（直接运行本文件时即本模块），
+# 导入时建队列/启动清理线程/标记 interrupted 会在 worker 里多开线程，并把正在运行的作业误标为中断
+STORE: Optional[JobStore] = None
+QUEUE: Optional[JobQueue] = None
+EVENTS: Dict[str, EventStream] = {}   # job_id -> 事件流（SSE 推送段落 token，仅内存）
 
-# ---- 内存作业表 ----
-JOBS: Dict[str, Dict[str, Any]] = {}  # job_id -> info
-FUTURES: Dict[str, Future] = {}
+def _on_job_start(job_id: str, wait_s: float):
+    STORE.update(job_id, status="running", started_at=_now(), wait_s=round(wait_s, 3))
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global STORE, QUEUE
+    STORE = JobStore()
+    STORE.mark_interrupted(_now())        # 上次进程退出时未完成的作业
+    QUEUE = JobQueue(API_MAX_WORKERS, on_start=_on_job_start)
+    stop = threading.Event()
+    threading.Thread(target=_cleanup_loop, args=(stop,), name="job-cleanup", daemon=True).start()
+    try:
+        yield
+    finally:
+        stop.set()
+        QUEUE.stop()
+
+app = FastAPI(title="Report Pipeline API", version="1.0.0", lifespan=lifespan)
 
 # -------------------- 数据模型 --------------------
 class ProjectRef(BaseModel):
@@ -38,6 +70,15 @@ class ValidateRequest(ProjectRef):
 
 class RunRequest(ProjectRef):
     report_name: str = Field("生成报告文件", description="输出 docx 文件名（不带扩展名）")
+    priority: Literal["interactive", "bulk"] = Field("interactive", description="排队优先级：interactive 先于 bulk 出队")
+    stream: bool = Field(False, description="是否逐 token 流式生成段落；缺省只在有 /jobs/{id}/stream 客户端时流式（非流式可对冲与超时切换 provider）")
+
+class BatchRequest(ProjectRef):
+    input_rel_path: str = Field("configs/input", description="项目下的 Excel 目录/文件/通配符（相对路径），每个 Excel 生成一份报告")
+    workers: Optional[int] = Field(None, ge=1, description="worker 进程数（缺省 BATCH_WORKERS）")
+    llm_limit: Optional[int] = Field(None, ge=0, description="所有 worker 合计的 LLM 在途请求上限（缺省 BATCH_LLM_LIMIT；0 不限）")
+    full: bool = Field(False, description="全量重跑：不复用上次运行的抽取/生成结果")
+    priority: Literal["interactive", "bulk"] = Field("bulk", description="排队优先级：interactive 先于 bulk 出队")
 
 # -------------------- 工具函数 --------------------
 def _now() -> str:
@@ -82,31 +123,41 @@ def scan_latest_docx(output_dir: Path) -> Optional[Path]:
     files = sorted(output_dir.glob("*.docx"), key=lambda p: p.stat().st_mtime, reverse=True)
     return files[0] if files else None
 
-def tail_file(path: Path, lines: int = 200) -> str:
-    if not path.exists():
-        return ""
-    # 简单安全的 tail（适合中小日志）
-    with open(path, "r", encoding="utf-8", errors="ignore") as f:
-        data = f.read().splitlines()
-        return "\n".join(data[-lines:])
-
 def job_status(job_id: str) -> Dict[str, Any]:
-    if job_id not in JOBS:
+    info = STORE.get(job_id)
+    if info is None:
         raise HTTPException(404, "job not found")
-    info = JOBS[job_id]
-    # 更新 Future 状态
-    fut = FUTURES.get(job_id)
-    if fut and info["status"] in ("queued", "running"):
-        if fut.done():
-            exc = fut.exception()
-            info["ended_at"] = _now()
-            if exc:
-                info["status"] = "failed"
-                info["error"]  = "".join(traceback.format_exception(type(exc), exc, exc.__traceback__))
-            else:
-                info["status"] = "succeeded"
     return info
 
+def _format_exc(e: Exception) -> str:
+    return "".join(traceback.format_exception(type(e), e, e.__traceback__))
+
+def enqueue_job(job: Dict[str, Any], task, priority: str):
+    """作业写入作业表并排队；队列满时撤销并返回 429（带 Retry-After）。"""
+    STORE.create(job)
+    try:
+        QUEUE.submit(job["job_id"], task, priority)
+    except QueueFull as e:
+        STORE.delete(job["job_id"])
+        EVENTS.pop(job["job_id"], None)
+        raise HTTPException(429, str(e), headers={"Retry-After": str(e.retry_after)})
+
+def _cleanup_once():
+    for job_id in STORE.cleanup():
+        EVENTS.pop(job_id, None)
+    cutoff = time.time() - JOB_EVENTS_RETENTION_S
+    for job_id, ev in list(EVENTS.items()):
+        if ev.closed_at is not None and ev.closed_at < cutoff:
+            EVENTS.pop(job_id, None)
+
+def _cleanup_loop(stop: threading.Event):
+    while not stop.is_set():
+        try:
+            _cleanup_once()
+        except Exception as e:
+            logging.getLogger("system").warning(f"作业清理失败：{e}")
+        stop.wait(JOB_CLEANUP_INTERVAL_S)
+
 # -------------------- 验证（同步） --------------------
 @app.post("/validate")
 def validate_endpoint(req: ValidateRequest):
@@ -120,18 +171,21 @@ def validate_endpoint(req: ValidateRequest):
     paths = ensure_project_layout(project_root)
     config_dir = paths["config_dir"]
 
-    # 读取 Excel（取第一个 *.xls*）
-    xls = None
-    try:
-        xls = load_excel_first(config_dir / "input")
-    except Exception as e:
-        # Excel 缺失不抛死，交给验证器记录警告/错误
+    # 本请求的日志写入 <project_root>/logs/（不影响并发作业）
+    with job_logs(paths["logs_dir"]):
+        # 读取 Excel（input 下第一个 *.xls*，以及 sheet_tasks.yaml 中 source 引用的工作簿）
         xls = None
+        try:
+            sheet_cfg = load_yaml_strict(config_dir / "business_configs" / "sheet_tasks.yaml")[0]
+            xls = load_inputs(config_dir / "input", sheet_cfg, snapshot_root=project_root)
+        except Exception as e:
+            # Excel 缺失不抛死，交给验证器记录警告/错误
+            xls = None
 
-    # 验证（不写 docx、不调 LLM）
-    report = validate_configs(config_dir, xls, simulate_render=req.simulate_render)
-    # 写报告到 logs/
-    write_report_files(report, project_root, project_root / "logs")
+        # 验证（不写 docx、不调 LLM）
+        report = validate_configs(config_dir, xls, simulate_render=req.simulate_render)
+        # 写报告到 logs/
+        write_report_files(report, project_root, project_root / "logs")
 
     return {
         "project": str(project_root),
@@ -159,58 +213,198 @@ def run_endpoint(req: RunRequest):
     config_dir = paths["config_dir"]
 
     job_id = str(uuid.uuid4())
-    JOBS[job_id] = {
+    job = {
         "job_id": job_id,
         "type": "run",
         "status": "queued",
+        "priority": req.priority,
         "project_root": str(project_root),
-        "started_at": None,
-        "ended_at": None,
-        "error": None,
+        "created_at": _now(),
         "artifacts": {"docx": None},
+        "params": {"report_name": req.report_name},
     }
 
+    events = EVENTS[job_id] = EventStream(stream_tokens=req.stream)
+
     def _task():
-        JOBS[job_id]["status"] = "running"
-        JOBS[job_id]["started_at"] = _now()
+        events.publish({"type": "job_start", "job_id": job_id})
+        fields: Dict[str, Any] = {"status": "failed"}
         try:
             # 关键：把 root 指到项目根，这样你的引擎就会把 logs 写到 <project_root>/logs/
-            run_pipeline(config_dir=config_dir, report_name=req.report_name, root=project_root)
+            run_pipeline(config_dir=config_dir, report_name=req.report_name, root=project_root,
+                         on_event=events.publish, stream=events.wants_tokens)
             # 找产物
             out = scan_latest_docx(config_dir / "output")
-            JOBS[job_id]["artifacts"]["docx"] = str(out) if out else None
+            fields.update(status="succeeded", artifacts={"docx": str(out) if out else None})
         except Exception as e:
-            JOBS[job_id]["error"]  = "".join(traceback.format_exception(type(e), e, e.__traceback__))
-            raise
+            fields["error"] = _format_exc(e)
         finally:
-            JOBS[job_id]["ended_at"] = _now()
-
-    fut = EXECUTOR.submit(_task)
-    FUTURES[job_id] = fut
+            STORE.update(job_id, ended_at=_now(), **fields)
+            events.publish({"type": "job_end", "status": fields["status"]})
+            events.close()
 
+    enqueue_job(job, _task, req.priority)
     return {"job_id": job_id, "status": "queued", "project_root": str(project_root)}
 
+# -------------------- 批量运行（异步） --------------------
+@app.post("/batch")
+def batch_endpoint(req: BatchRequest):
+    """
+    异步批量运行：input_rel_path 下每个 Excel 生成一份报告，多进程并行。
+    - 各工作簿的日志/运行摘要写入 <project_root>/batch/<名称>/logs/，汇总写入 <project_root>/batch/batch_summary.json
+    - 产物写入 <project_root>/configs/output/<名称>.docx
+    - 事件流推送每个工作簿的 workbook_done 事件与最终的 batch_summary
+    """
+    project_root = resolve_project_root(req.workspace_path, req.project_rel_path)
+    paths = ensure_project_layout(project_root)
+    config_dir = paths["config_dir"]
+    source = (project_root / req.input_rel_path).resolve()
+    if not source.is_relative_to(project_root):
+        raise HTTPException(400, "input_rel_path must stay inside the project")
+    inputs = discover_workbooks(source)
+    if not inputs:
+        raise HTTPException(400, f"no Excel found: {req.input_rel_path}")
+
+    job_id = str(uuid.uuid4())
+    job = {
+        "job_id": job_id,
+        "type": "batch",
+        "status": "queued",
+        "priority": req.priority,
+        "project_root": str(project_root),
+        "created_at": _now(),
+        "artifacts": {"docx": None, "reports": [], "batch_summary": None},
+        "params": {"input_rel_path": req.input_rel_path, "workbooks": len(inputs)},
+    }
+
+    events = EVENTS[job_id] = EventStream()
+
+    def _task():
+        events.publish({"type": "job_start", "job_id": job_id, "workbooks": len(inputs)})
+        fields: Dict[str, Any] = {"status": "failed"}
+        try:
+            with job_logs(project_root / "logs"):
+                summary = run_batch(config_dir, inputs, root=project_root, workers=req.workers,
+                                    llm_limit=req.llm_limit, incremental=False if req.full else None,
+                                    on_event=events.publish)
+            fields.update(status="succeeded", artifacts={
+                "docx": None,
+                "reports": [it["output"] for it in summary["items"] if it.get("output")],
+                "batch_summary": str(Path(summary["batch_root"]) / "batch_summary.json"),
+            })
+        except Exception as e:
+            fields["error"] = _format_exc(e)
+        finally:
+            STORE.update(job_id, ended_at=_now(), **fields)
+            events.publish({"type": "job_end", "status": fields["status"]})
+            events.close()
+
+    enqueue_job(job, _task, req.priority)
+    return {"job_id": job_id, "status": "queued", "project_root": str(project_root), "workbooks": len(inputs)}
+
 # -------------------- 作业状态 --------------------
 @app.get("/jobs/{job_id}")
 def get_job(job_id: str):
     return job_status(job_id)
 
+# -------------------- 实时事件流（SSE） --------------------
+def _sse(ev: dict) -> str:
+    return f"id: {ev['id']}\nevent: {ev['type']}\ndata: {json.dumps(ev, ensure_ascii=False)}\n\n"
+
+@app.get("/jobs/{job_id}/stream")
+def stream_job(job_id: str, last_event_id: int = Query(-1, alias="from", ge=-1)):
+    """
+    Server-Sent Events：推送作业的阶段变化与各段落生成的 token。
+    - 事件类型：job_start / stage / paragraph_start / token / paragraph_done / paragraph_error / summary / job_end
+    - token 事件：{"paragraph": 段落ID, "text": 增量文本}
+    - ?from=N：从事件 id > N 处续传（断线重连用）
+    - 有客户端连着时，之后开始生成的段落改为流式逐 token 推送；没有客户端时整段生成后一次推送
+    """
+    job_status(job_id)
+    events = EVENTS.get(job_id)
+    if events is None:
+        raise HTTPException(404, "event stream not available for this job")
+
+    def _gen():
+        cursor = last_event_id + 1
+        events.subscribe()
+        try:
+            while True:
+                batch = events.read_from(cursor, timeout=15.0)
+                for ev in batch:
+                    yield _sse(ev)
+                cursor += len(batch)
+                if events.closed and not events.read_from(cursor, timeout=0):
+                    break
+                if not batch:
+                    yield ": keep-alive\n\n"   # 心跳，防止代理断开空闲连接
+        finally:
+            events.unsubscribe()
+
+    return StreamingResponse(_gen(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
 # -------------------- 拉取日志尾部 --------------------
+LOG_FILES = {
+    "user":   "user.log",
+    "system": "system.log",
+    "config": "config.log",
+    "exec":   "exec.log",  # 预留：如果未来你用子进程跑 main.py，可把 stdout/stderr 写到 exec.log
+}
+
 @app.get("/jobs/{job_id}/logs", response_class=PlainTextResponse)
 def get_logs(job_id: str,
              kind: str = Query("user", regex="^(user|system|config|exec)$"),
              tail: int = Query(200, ge=1, le=5000)):
+    """日志尾部（从文件末尾按块倒读，不把整个文件读进内存）；响应头 X-Log-Offset 为文件末尾的字节偏移，可作为 /logs/stream 的 from 续读。"""
     info = job_status(job_id)
-    project_root = Path(info["project_root"])
-    logs_dir = project_root / "logs"
-    fname = {
-        "user":   "user.log",
-        "system": "system.log",
-        "config": "config.log",
-        "exec":   "exec.log",  # 预留：如果未来你用子进程跑 main.py，可把 stdout/stderr 写到 exec.log
-    }[kind]
-    content = tail_file(logs_dir / fname, lines=tail)
-    return content or "(empty)"
+    logs_dir = Path(info["project_root"]) / "logs"
+    content, end = tail_lines(logs_dir / LOG_FILES[kind], tail)
+    return PlainTextResponse(content or "(empty)", headers={"X-Log-Offset": str(end)})
+
+@app.get("/jobs/{job_id}/logs/stream")
+def stream_logs(job_id: str,
+                kind: str = Query("user", regex="^(user|system|config|exec)$"),
+                offset: int = Query(-1, alias="from", ge=-1),
+                last_event_id: Optional[str] = Header(None)):
+    """
+    Server-Sent Events：跟读作业所在项目的日志文件。
+    - ?from=<字节偏移>：从该处开始（缺省 -1 = 从当前末尾开始，只推新行）；断线重连时浏览器会带 Last-Event-ID，优先使用
+    - log 事件：{"offset": 下一次续读的偏移, "lines": [...]}，事件 id 即该偏移
+    - 作业结束且已读到末尾后推送 end 事件并结束
+    """
+    path = Path(job_status(job_id)["project_root"]) / "logs" / LOG_FILES[kind]
+    if last_event_id and last_event_id.isdigit():
+        offset = int(last_event_id)
+
+    def _gen():
+        follower = LogFollower(path, offset)
+        idle = 0.0
+        try:
+            while True:
+                lines, pos = follower.read()
+                if lines:
+                    idle = 0.0
+                    yield f"id: {pos}\nevent: log\ndata: {json.dumps({'offset': pos, 'lines': lines}, ensure_ascii=False)}\n\n"
+                    continue
+                job = STORE.get(job_id)
+                if job is None or job["status"] not in ("queued", "running"):
+                    lines, pos = follower.read()          # 作业结束：再读一次，确保最后几行已推送
+                    if not lines:
+                        yield f"id: {pos}\nevent: end\ndata: {json.dumps({'offset': pos})}\n\n"
+                        break
+                    yield f"id: {pos}\nevent: log\ndata: {json.dumps({'offset': pos, 'lines': lines}, ensure_ascii=False)}\n\n"
+                    continue
+                time.sleep(LOG_POLL_S)
+                idle += LOG_POLL_S
+                if idle >= 15.0:
+                    idle = 0.0
+                    yield ": keep-alive\n\n"   # 心跳，防止代理断开空闲连接
+        finally:
+            follower.close()
+
+    return StreamingResponse(_gen(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
 # -------------------- 下载产物 --------------------
 @app.get("/jobs/{job_id}/artifact")
@@ -244,6 +438,12 @@ def get_reports(job_id: str):
             out["run_summary"] = json.loads(rs.read_text(encoding="utf-8"))
         except Exception:
             out["run_summary"] = {"_error": "failed to parse run_summary.json"}
+    bs = info.get("artifacts", {}).get("batch_summary")
+    if bs and Path(bs).exists():
+        try:
+            out["batch_summary"] = json.loads(Path(bs).read_text(encoding="utf-8"))
+        except Exception:
+            out["batch_summary"] = {"_error": "failed to parse batch_summary.json"}
     if not out:
         raise HTTPException(404, "no reports found")
     return JSONResponse(out)
@@ -251,7 +451,12 @@ def get_reports(job_id: str):
 # -------------------- 健康检查 --------------------
 @app.get("/healthz")
 def healthz():
-    return {"ok": True, "workers": API_MAX_WORKERS}
+    # llm：各 provider 的自适应并发上限、在途数、近期 p50/p95 延迟与错误率
+    # prompt_cache：共享 Jinja Environment 的模板缓存命中计数（进程累计）
+    # template_pool：预解析 Word 模板池（模板数、占用字节、命中/载入/淘汰次数）
+    # queue：各优先级排队深度、执行中数量、近期排队等待时长；jobs：作业表中各状态的作业数
+    return {"ok": True, "workers": API_MAX_WORKERS, "llm": limiter_stats(), "prompt_cache": prompt_cache_stats(),
+            "template_pool": template_pool_stats(), "queue": QUEUE.stats(), "jobs": STORE.counts()}
 
 # -------------------- 启动 --------------------
 if __name__ == "__main__":
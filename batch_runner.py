@@ -0,0 +1,167 @@
+# batch_runner.py
+"""
+批量模式：多个 Excel → 多份报告，按工作簿分发到进程池并行运行（每个工作簿一次完整的 run_pipeline）。
+
+- 每个工作簿一个工作目录 <batch_root>/<名称>/：logs/、run_summary.json、.cache/（增量状态、Sheet 快照互不干扰）
+- 报告输出到 <config_dir>/output/<名称>.docx；名称取 Excel 文件名（不含扩展名），重名时追加 _2、_3…
+- worker 进程启动时预热一次：编译 prompts/ 下全部 Prompt、把 Word 模板载入模板池；
+  之后该进程处理的所有工作簿直接复用（YAML 配置每次运行照常读取，不做缓存）
+- LLM 并发：各进程内仍按 provider 自适应并发，另有跨进程共享的在途请求上限（BATCH_LLM_LIMIT），
+  避免 N 个 worker 把对 provider 的并发放大 N 倍。注意 rpm/tpm 令牌桶是进程内的，需要时在 llm.yaml 中按 worker 数下调
+- 结束写汇总 <batch_root>/batch_summary.json：每个工作簿的状态/耗时/LLM 调用数 + 整体吞吐
+
+环境变量：
+- BATCH_WORKERS     worker 进程数（默认 min(4, CPU 数)，且不超过工作簿数）
+- BATCH_LLM_LIMIT   所有 worker 合计的 LLM 在途请求上限（默认 8；0 不限）
+"""
+from __future__ import annotations
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+from pathlib import Path
+import glob, json, logging, multiprocessing, os, time, traceback
+
+SYS_LOG  = logging.getLogger("system")
+USER_LOG = logging.getLogger("user")
+
+DEFAULT_WORKERS   = int(os.getenv("BATCH_WORKERS", "0")) or min(4, os.cpu_count() or 1)
+DEFAULT_LLM_LIMIT = int(os.getenv("BATCH_LLM_LIMIT", "8"))
+
+def discover_workbooks(source: Path | str, pattern: str = "*.xls*") -> list[Path]:
+    """source 可以是目录（按 pattern 匹配）、单个文件或通配符路径；忽略 Excel 的临时锁文件（~$ 开头）。"""
+    p = Path(source)
+    if p.is_dir():
+        found = p.glob(pattern)
+    elif p.is_file():
+        found = [p]
+    else:
+        found = (Path(x) for x in glob.glob(str(source)))
+    return sorted(x.resolve() for x in found if x.is_file() and not x.name.startswith("~$"))
+
+def _unique_names(paths: list[Path]) -> list[str]:
+    seen: dict[str, int] = {}
+    out = []
+    for p in paths:
+        n = seen[p.stem] = seen.get(p.stem, 0) + 1
+        out.append(p.stem if n == 1 else f"{p.stem}_{n}")
+    return out
+
+# ---------------- worker 进程 ----------------
+def _init_worker(config_dir: Path, gate):
+    import llm_client
+    llm_client.set_global_gate(gate)
+    # 预热：之后本进程内的各次运行命中 Prompt 编译缓存与模板池
+    from core.prompts import get_prompt
+    from io_utils.template_pool import get_template
+    try:
+        prompts = config_dir / "prompts"
+        for p in (prompts.rglob("*") if prompts.is_dir() else []):
+            if p.is_file():
+                try:
+                    get_prompt(p, config_dir)
+                except Exception:
+                    pass            # 有问题的 Prompt 留给各次运行的验证阶段报告
+        tpl = config_dir / "template" / "report_template.docx"
+        if tpl.exists():
+            get_template(tpl)
+    except Exception as e:
+        SYS_LOG.warning(f"批量 worker 预热失败（不影响运行）：{e}")
+
+def _run_one(config_dir: Path, excel_path: Path, name: str, work_dir: Path, incremental: bool | None) -> dict:
+    from orchestrator import run_pipeline
+    item = {"name": name, "workbook": str(excel_path), "work_dir": str(work_dir), "pid": os.getpid()}
+    t0 = time.perf_counter()
+    try:
+        summary = run_pipeline(config_dir=config_dir, report_name=name, root=work_dir, logs_dir=work_dir / "logs",
+                               incremental=incremental, excel_path=excel_path)
+        out = config_dir / "output" / f"{name}.docx"
+        item.update(status="succeeded", **summary["counts"], llm_calls=summary["llm_calls"]["total"],
+                    output=str(out) if out.exists() else None)
+    except Exception as e:
+        item.update(status="failed", error=f"{type(e).__name__}: {e}", traceback=traceback.format_exc())
+    item["seconds"] = round(time.perf_counter() - t0, 3)
+    return item
+
+# ---------------- 父进程 ----------------
+def _throughput(items: list[dict], elapsed: float) -> dict:
+    done  = [it for it in items if it["status"] == "succeeded"]
+    secs  = [it["seconds"] for it in items if "seconds" in it]
+    calls = sum(it.get("llm_calls", 0) for it in done)
+    mins  = max(elapsed, 1e-9) / 60
+    return {
+        "elapsed_s":          round(elapsed, 3),
+        "workbooks_per_min":  round(len(done) / mins, 2),
+        "llm_calls":          calls,
+        "llm_calls_per_min":  round(calls / mins, 1),
+        "avg_workbook_s":     round(sum(secs) / len(secs), 3) if secs else None,
+        "max_workbook_s":     max(secs) if secs else None,
+        # 各工作簿耗时之和 / 墙钟时间：≈ 实际并行度
+        "parallelism":        round(sum(secs) / max(elapsed, 1e-9), 2) if secs else None,
+    }
+
+def run_batch(config_dir: Path, inputs: list[Path], root: Path, batch_root: Path | None = None,
+              workers: int | None = None, llm_limit: int | None = None, incremental: bool | None = None,
+              on_event=None) -> dict:
+    """
+    inputs：Excel 文件列表（见 discover_workbooks）；root：项目根目录，工作目录缺省为 <root>/batch/。
+    单个工作簿失败不影响其它工作簿；返回汇总（同 batch_summary.json）。
+    on_event：可选回调，每个工作簿结束时收到 workbook_done 事件。
+    """
+    emit = on_event or (lambda ev: None)
+    config_dir = Path(config_dir).resolve()
+    batch_root = Path(batch_root or Path(root) / "batch").resolve()
+    inputs     = [Path(p).resolve() for p in inputs]
+    names      = _unique_names(inputs)
+    workers    = max(1, min(workers or DEFAULT_WORKERS, len(inputs) or 1))
+    llm_limit  = DEFAULT_LLM_LIMIT if llm_limit is None else llm_limit
+
+    started = datetime.now()
+    t0 = time.perf_counter()
+    USER_LOG.info(f"[批量] 开始：{len(inputs)} 个工作簿，worker={workers}，LLM 全局并发上限={llm_limit or '不限'}")
+
+    # spawn：父进程可能是带线程的 API 服务，fork 不安全；预热在各 worker 的 initializer 中完成
+    ctx  = multiprocessing.get_context("spawn")
+    gate = ctx.BoundedSemaphore(llm_limit) if llm_limit > 0 else None
+    items: list[dict] = []
+    if inputs:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=ctx,
+                                 initializer=_init_worker, initargs=(config_dir, gate)) as pool:
+            futs = {pool.submit(_run_one, config_dir, p, n, batch_root / n, incremental): (p, n)
+                    for p, n in zip(inputs, names)}
+            for fut in as_completed(futs):
+                p, n = futs[fut]
+                try:
+                    item = fut.result()
+                except Exception as e:           # worker 进程异常退出等
+                    item = {"name": n, "workbook": str(p), "work_dir": str(batch_root / n), "status": "failed",
+                            "error": f"{type(e).__name__}: {e}"}
+                items.append(item)
+                if item["status"] == "succeeded":
+                    USER_LOG.info(f"[批量] {len(items)}/{len(inputs)} 完成：{n}（{item['seconds']}s，"
+                                  f"errors={item['errors']}，warnings={item['warnings']}，LLM 调用 {item['llm_calls']}）")
+                else:
+                    USER_LOG.error(f"[批量] {len(items)}/{len(inputs)} 失败：{n}：{item.get('error')}")
+                emit({"type": "workbook_done", "done": len(items), "total": len(inputs),
+                      **{k: v for k, v in item.items() if k != "traceback"}})
+
+    order = {n: i for i, n in enumerate(names)}
+    items.sort(key=lambda it: order.get(it["name"], 0))
+    summary = {
+        "started_at":  started.isoformat(timespec="seconds"),
+        "ended_at":    datetime.now().isoformat(timespec="seconds"),
+        "config_dir":  str(config_dir),
+        "batch_root":  str(batch_root),
+        "workers":     workers,
+        "llm_limit":   llm_limit,
+        "workbooks":   len(inputs),
+        "succeeded":   sum(1 for it in items if it["status"] == "succeeded"),
+        "failed":      sum(1 for it in items if it["status"] != "succeeded"),
+        "throughput":  _throughput(items, time.perf_counter() - t0),
+        "items":       items,
+    }
+    batch_root.mkdir(parents=True, exist_ok=True)
+    (batch_root / "batch_summary.json").write_text(json.dumps(summary, ensure_ascii=False, indent=2), encoding="utf-8")
+    tp = summary["throughput"]
+    USER_LOG.info(f"[批量] 结束：成功 {summary['succeeded']} / 失败 {summary['failed']}，耗时 {tp['elapsed_s']}s，"
+                  f"{tp['workbooks_per_min']} 个/分钟，LLM 调用 {tp['llm_calls']}；汇总见 {batch_root / 'batch_summary.json'}")
+    emit({"type": "batch_summary", **{k: v for k, v in summary.items() if k != "items"}})
+    return summary
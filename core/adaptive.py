@@ -0,0 +1,125 @@
+# core/adaptive.py
+"""
+自适应并发（AIMD）：替代固定的 max_in_flight 信号量。
+
+- 调用健康（成功且延迟不超标）且上限确实被用到时加性增长：每完成约 limit 次调用，上限 +increase
+- 遇到 429 / 超时乘性收缩：limit *= decrease（同一个延迟周期内只收缩一次，避免连续雪崩式下调）；
+  其他错误（4xx、解析失败等）不影响上限，在 stats() 中与限流分开统计（throttle_rate / error_rate）
+- 延迟是否超标：配置了 latency_slo 时与之比较，否则与近期 p50 的 tolerance 倍比较
+
+llm.yaml 中每个 provider 可选：
+    max_in_flight: 4          # 初始并发上限
+    adaptive:                 # 设为 false 则保持固定上限
+      min: 1
+      max: 16                 # 缺省为初始值的 4 倍
+      increase: 1
+      decrease: 0.5
+      latency_slo: 20         # 秒；缺省按近期 p50 × tolerance 判断
+      tolerance: 2.0
+"""
+from __future__ import annotations
+from collections import deque
+import logging, os, threading, time
+
+from core.retry import LatencyWindow, is_throttle
+
+SYS_LOG = logging.getLogger("system")
+
+ADAPTIVE_DEFAULT = os.getenv("LLM_ADAPTIVE", "1").lower() in ("1", "true", "yes", "on")
+
+class AdaptiveLimiter:
+    """线程安全；acquire 阻塞等待空闲槽位。"""
+
+    def __init__(self, initial: int, name: str = "", min_limit: int = 1, max_limit: int | None = None,
+                 increase: float = 1.0, decrease: float = 0.5, latency_slo: float | None = None,
+                 tolerance: float = 2.0, adaptive: bool = True):
+        self.name        = name
+        self.min_limit   = max(1, int(min_limit))
+        self.max_limit   = max(self.min_limit, int(max_limit or initial * 4))
+        self.limit       = float(min(max(initial, self.min_limit), self.max_limit))
+        self.increase    = float(increase)
+        self.decrease    = float(decrease)
+        self.latency_slo = latency_slo
+        self.tolerance   = float(tolerance)
+        self.adaptive    = adaptive
+        self.in_flight   = 0
+        self.latency     = LatencyWindow(100)
+        self._outcomes   = deque(maxlen=100)       # "ok" / "throttle"（429、超时）/ "error"（其他失败）
+        self._last_cut   = 0.0
+        self.cuts        = 0
+        self._cond       = threading.Condition()
+
+    @classmethod
+    def from_cfg(cls, initial: int, cfg, name: str = "") -> "AdaptiveLimiter":
+        if cfg is False or (cfg is None and not ADAPTIVE_DEFAULT):
+            return cls(initial, name=name, max_limit=initial, adaptive=False)
+        cfg = cfg if isinstance(cfg, dict) else {}
+        return cls(initial, name=name,
+                   min_limit   = cfg.get("min", 1),
+                   max_limit   = cfg.get("max"),
+                   increase    = cfg.get("increase", 1.0),
+                   decrease    = cfg.get("decrease", 0.5),
+                   latency_slo = cfg.get("latency_slo"),
+                   tolerance   = cfg.get("tolerance", 2.0))
+
+    @property
+    def current(self) -> int:
+        return max(self.min_limit, int(self.limit))
+
+    # ---------- 占用 / 释放 ----------
+    def acquire(self) -> float:
+        with self._cond:
+            while self.in_flight >= self.current:
+                self._cond.wait()
+            self.in_flight += 1
+            return time.perf_counter()
+
+    def release(self, token: float, error: BaseException | None = None):
+        """token 为 acquire 的返回值；error 为本次调用的异常（成功为 None）。"""
+        elapsed = time.perf_counter() - token
+        with self._cond:
+            busy = self.in_flight * 2 >= self.current     # 上限确实被用到一半以上才增长，空闲时不虚涨
+            self.in_flight -= 1
+            throttled = error is not None and is_throttle(error)
+            self._outcomes.append("ok" if error is None else "throttle" if throttled else "error")
+            if error is None:
+                healthy = self._healthy(elapsed)
+                self.latency.add(elapsed)
+                if self.adaptive and healthy and busy and self.limit < self.max_limit:
+                    # 加性增长：按当前上限摊薄，约每个“满窗口”增长 increase
+                    self.limit = min(self.max_limit, self.limit + self.increase / max(self.limit, 1.0))
+            elif self.adaptive and throttled:
+                now = time.perf_counter()
+                if now - self._last_cut >= (self.latency.quantile(0.5) or 1.0):
+                    old = self.current
+                    self.limit = max(self.min_limit, self.limit * self.decrease)
+                    self._last_cut = now
+                    self.cuts += 1
+                    SYS_LOG.warning(f"自适应并发收缩：{self.name} {old} → {self.current}（{type(error).__name__}）")
+            self._cond.notify_all()
+
+    def _healthy(self, elapsed: float) -> bool:
+        if self.latency_slo:
+            return elapsed <= float(self.latency_slo)
+        p50 = self.latency.quantile(0.5)
+        return p50 is None or elapsed <= p50 * self.tolerance
+
+    # ---------- 观测 ----------
+    def stats(self) -> dict:
+        with self._cond:
+            outcomes = list(self._outcomes)
+            out = {
+                "limit":      self.current,
+                "limit_raw":  round(self.limit, 2),
+                "min":        self.min_limit,
+                "max":        self.max_limit,
+                "adaptive":   self.adaptive,
+                "in_flight":  self.in_flight,
+                "cuts":       self.cuts,
+            }
+        p50, p95 = self.latency.quantile(0.5), self.latency.quantile(0.95)
+        out["latency_p50_s"] = round(p50, 3) if p50 is not None else None
+        out["latency_p95_s"] = round(p95, 3) if p95 is not None else None
+        out["throttle_rate"] = round(outcomes.count("throttle") / len(outcomes), 3) if outcomes else None
+        out["error_rate"]    = round(outcomes.count("error") / len(outcomes), 3) if outcomes else None
+        return out
@@ -0,0 +1,13 @@
+# core/context_pool.py
+"""
+带上下文的线程池：submit 时复制调用方的 contextvars 上下文，任务在该上下文中运行。
+作业日志目录（core/logging_setup.job_logs）等按上下文区分的状态因此能跟随任务进入工作线程。
+"""
+from __future__ import annotations
+from concurrent.futures import ThreadPoolExecutor
+import contextvars
+
+class ContextThreadPoolExecutor(ThreadPoolExecutor):
+    def submit(self, fn, /, *args, **kwargs):
+        ctx = contextvars.copy_context()
+        return super().submit(ctx.run, fn, *args, **kwargs)
@@ -1,22 +1,46 @@
 # core/error_collector.py
 from __future__ import annotations
 from pathlib import Path
-import json, logging
+import json, logging, threading
 USER_LOG = logging.getLogger("user"); SYS_LOG = logging.getLogger("system")
 
 class ErrorCollector:
     def __init__(self):
         self.items: list[dict] = []
+        self.stats: dict[str, dict] = {}  # 运行统计（缓存命中等），随摘要一起写入 run_summary.json
+        self.calls: list[dict] = []       # 每次 LLM 调用的记录（尝试/重试/对冲次数、耗时）
+        self._lock = threading.Lock()   # 并发抽取/生成时多个线程会同时 add
 
     def add(self, level: str, where: str, msg: str, detail: str | None = None):
         rec = {"level": level, "where": where, "msg": msg}
         if detail: rec["detail"] = detail
-        self.items.append(rec)
+        with self._lock:
+            self.items.append(rec)
         if level.lower().startswith("warn"):
             USER_LOG.warning(f"[{where}] {msg}")
         else:
             SYS_LOG.error(f"[{where}] {msg}")
 
+    def add_stats(self, section: str, data: dict):
+        with self._lock:
+            self.stats[section] = data
+
+    def record_call(self, rec: dict):
+        with self._lock:
+            self.calls.append(rec)
+
+    def _calls_summary(self) -> dict:
+        with self._lock:
+            calls = list(self.calls)
+        return {
+            "total":      len(calls),
+            "failed":     sum(1 for c in calls if not c.get("ok")),
+            "retries":    sum(c.get("retries", 0) for c in calls),
+            "hedged":     sum(c.get("hedged", 0) for c in calls),
+            "hedge_won":  sum(c.get("hedge_won", 0) for c in calls),
+            "items":      calls,
+        }
+
     def summary(self) -> dict:
         counts = {"errors": 0, "warnings": 0}
         for it in self.items:
@@ -24,7 +48,7 @@ class ErrorCollector:
                 counts["warnings"] += 1
             else:
                 counts["errors"] += 1
-        return {"counts": counts, "items": self.items}
+        return {"counts": counts, "items": self.items, "stats": self.stats, "llm_calls": self._calls_summary()}
 
     def dump(self, root: Path):
         (root / "logs").mkdir(exist_ok=True)
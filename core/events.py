@@ -0,0 +1,50 @@
+# core/events.py
+from __future__ import annotations
+import threading, time
+
+class EventStream:
+    """
+    单个作业的事件缓冲（线程安全，只追加）。
+    - publish()：运行线程写入事件（dict），自动编号 id
+    - read_from()：读取线程从某个 id 开始取事件，没有新事件时最多阻塞 timeout 秒
+    - close()：作业结束；读取方取完剩余事件后即可结束
+    - wants_tokens()：是否需要逐 token 推送（创建时要求了 stream_tokens，或当前有 SSE 客户端在读）；
+      否则段落整段生成后一次推送，生成调用可以对冲、超时切换 provider
+    """
+
+    def __init__(self, stream_tokens: bool = False):
+        self._events: list[dict] = []
+        self._cond   = threading.Condition()
+        self.closed  = False
+        self.closed_at: float | None = None
+        self.stream_tokens = stream_tokens
+        self._subscribers  = 0
+
+    def subscribe(self):
+        with self._cond:
+            self._subscribers += 1
+
+    def unsubscribe(self):
+        with self._cond:
+            self._subscribers = max(0, self._subscribers - 1)
+
+    def wants_tokens(self) -> bool:
+        with self._cond:
+            return self.stream_tokens or self._subscribers > 0
+
+    def publish(self, event: dict):
+        with self._cond:
+            self._events.append({"id": len(self._events), "ts": time.time(), **event})
+            self._cond.notify_all()
+
+    def close(self):
+        with self._cond:
+            self.closed = True
+            self.closed_at = time.time()
+            self._cond.notify_all()
+
+    def read_from(self, start: int, timeout: float = 15.0) -> list[dict]:
+        with self._cond:
+            if start >= len(self._events) and not self.closed:
+                self._cond.wait(timeout)
+            return self._events[start:]
@@ -0,0 +1,108 @@
+# core/job_queue.py
+"""
+API 作业队列：有界优先级队列 + 固定数量的工作线程。
+
+- 两档优先级：interactive（交互式单次运行，先出队）/ bulk（批量等后台作业）；同档内先进先出
+- 队列（不含执行中的作业）满时 submit 抛 QueueFull，附带建议的 Retry-After 秒数（按近期作业耗时与排队深度估算）
+- stats()：各档排队深度、执行中数量、近期排队等待时长（平均 / p95 / 最大）、最老排队作业已等待时长
+- stop()：服务关闭时调用；工作线程做完手上的作业后退出，仍在排队的作业不再执行
+
+环境变量：JOB_QUEUE_MAX（排队上限，默认 32）
+"""
+from __future__ import annotations
+from collections import deque
+import heapq, itertools, logging, math, os, threading, time
+
+SYS_LOG = logging.getLogger("system")
+
+QUEUE_MAX  = int(os.getenv("JOB_QUEUE_MAX", "32"))
+PRIORITIES = {"interactive": 0, "bulk": 1}
+
+class QueueFull(Exception):
+    def __init__(self, depth: int, retry_after: int):
+        super().__init__(f"作业队列已满（排队 {depth} 个），请 {retry_after}s 后重试")
+        self.depth       = depth
+        self.retry_after = retry_after
+
+class JobQueue:
+    def __init__(self, workers: int, max_depth: int = QUEUE_MAX, on_start=None):
+        """on_start(job_id, wait_s)：作业出队、开始执行前回调（更新作业表用）。"""
+        self.workers   = max(1, workers)
+        self.max_depth = max(1, max_depth)
+        self.on_start  = on_start
+        self._cond     = threading.Condition()
+        self._heap: list[tuple[int, int, float, str, object]] = []
+        self._seq      = itertools.count()
+        self._running  = 0
+        self._waits    = deque(maxlen=200)        # 近期排队等待（秒）
+        self._durs     = deque(maxlen=50)         # 近期执行耗时（秒），估算 Retry-After 用
+        self._counts   = {"submitted": 0, "rejected": 0, "completed": 0}
+        self._stopped  = False
+        self._threads  = [threading.Thread(target=self._loop, name=f"job-worker-{i}", daemon=True)
+                          for i in range(self.workers)]
+        for t in self._threads:
+            t.start()
+
+    def _retry_after(self, depth: int) -> int:
+        avg = sum(self._durs) / len(self._durs) if self._durs else 30.0
+        return int(min(300, max(1, math.ceil(avg * (depth + 1) / self.workers))))
+
+    def submit(self, job_id: str, fn, priority: str = "interactive"):
+        pri = PRIORITIES.get(priority, PRIORITIES["interactive"])
+        with self._cond:
+            depth = len(self._heap)
+            if depth >= self.max_depth:
+                self._counts["rejected"] += 1
+                raise QueueFull(depth, self._retry_after(depth))
+            heapq.heappush(self._heap, (pri, next(self._seq), time.monotonic(), job_id, fn))
+            self._counts["submitted"] += 1
+            self._cond.notify()
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+
+    def _loop(self):
+        while True:
+            with self._cond:
+                while not self._heap and not self._stopped:
+                    self._cond.wait()
+                if self._stopped:
+                    return
+                _, _, t_in, job_id, fn = heapq.heappop(self._heap)
+                wait = time.monotonic() - t_in
+                self._waits.append(wait)
+                self._running += 1
+            t0 = time.monotonic()
+            try:
+                if self.on_start:
+                    self.on_start(job_id, wait)
+                fn()
+            except Exception as e:       # 作业自身负责记录失败；这里只防止工作线程退出
+                SYS_LOG.error(f"作业执行异常：{job_id}：{e}")
+            finally:
+                with self._cond:
+                    self._running -= 1
+                    self._durs.append(time.monotonic() - t0)
+                    self._counts["completed"] += 1
+
+    def stats(self) -> dict:
+        with self._cond:
+            now    = time.monotonic()
+            depth  = {name: sum(1 for it in self._heap if it[0] == pri) for name, pri in PRIORITIES.items()}
+            oldest = max((now - it[2] for it in self._heap), default=0.0)
+            waits  = sorted(self._waits)
+            return {
+                "workers":   self.workers,
+                "running":   self._running,
+                "depth":     depth,
+                "max_depth": self.max_depth,
+                "wait_s": {
+                    "avg":    round(sum(waits) / len(waits), 3) if waits else None,
+                    "p95":    round(waits[min(len(waits) - 1, int(len(waits) * 0.95))], 3) if waits else None,
+                    "max":    round(waits[-1], 3) if waits else None,
+                    "oldest_queued": round(oldest, 3),
+                },
+                **self._counts,
+            }
@@ -0,0 +1,127 @@
+# core/job_store.py
+"""
+API 作业表：SQLite 持久化，服务重启后作业状态、错误与产物路径仍可查询。
+
+- 一行一个作业；artifacts / params 以 JSON 文本保存
+- 启动时把上次进程遗留的 queued/running 作业标记为 interrupted（执行体随进程丢失，不会自动续跑）
+- cleanup(retention_s)：删除结束时间早于保留期的已结束作业
+
+环境变量：
+- JOB_DB_PATH          SQLite 文件（默认 ~/.cache/report_gen/jobs.sqlite3）
+- JOB_RETENTION_HOURS  已结束作业的保留时长（默认 72）
+"""
+from __future__ import annotations
+from pathlib import Path
+import json, logging, os, sqlite3, threading, time
+
+SYS_LOG = logging.getLogger("system")
+
+DB_PATH         = os.getenv("JOB_DB_PATH", "~/.cache/report_gen/jobs.sqlite3")
+RETENTION_HOURS = float(os.getenv("JOB_RETENTION_HOURS", "72"))
+
+ACTIVE   = ("queued", "running")
+FINISHED = ("succeeded", "failed", "interrupted")
+
+_COLUMNS = ("job_id", "type", "status", "priority", "project_root", "created_at", "started_at", "ended_at",
+            "ended_ts", "wait_s", "error", "artifacts", "params")
+_JSON    = ("artifacts", "params")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id       TEXT PRIMARY KEY,
+    type         TEXT NOT NULL,
+    status       TEXT NOT NULL,
+    priority     TEXT NOT NULL DEFAULT 'interactive',
+    project_root TEXT,
+    created_at   TEXT,
+    started_at   TEXT,
+    ended_at     TEXT,
+    ended_ts     REAL,               -- 结束时刻（epoch 秒），保留期清理用
+    wait_s       REAL,               -- 排队等待时长
+    error        TEXT,
+    artifacts    TEXT,
+    params       TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_status_ended ON jobs(status, ended_ts);
+"""
+
+class JobStore:
+    """线程安全（单连接 + 锁）；WAL 模式，读写互不阻塞。"""
+
+    def __init__(self, path: Path | str = DB_PATH):
+        self.path = Path(path).expanduser()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db   = sqlite3.connect(str(self.path), check_same_thread=False, isolation_level=None)
+        self._db.row_factory = sqlite3.Row
+        with self._lock:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.executescript(_SCHEMA)
+
+    @staticmethod
+    def _row(row: sqlite3.Row | None) -> dict | None:
+        if row is None:
+            return None
+        job = dict(row)
+        for k in _JSON:
+            job[k] = json.loads(job[k]) if job.get(k) else {}
+        job.pop("ended_ts", None)
+        return job
+
+    def create(self, job: dict):
+        rec = {k: job.get(k) for k in _COLUMNS}
+        for k in _JSON:
+            rec[k] = json.dumps(job.get(k) or {}, ensure_ascii=False)
+        with self._lock:
+            self._db.execute(f"INSERT INTO jobs ({', '.join(_COLUMNS)}) VALUES ({', '.join('?' * len(_COLUMNS))})",
+                             [rec[k] for k in _COLUMNS])
+
+    def update(self, job_id: str, **fields):
+        if fields.get("status") in FINISHED:
+            fields.setdefault("ended_ts", time.time())
+        for k in _JSON:
+            if k in fields:
+                fields[k] = json.dumps(fields[k] or {}, ensure_ascii=False)
+        cols = [k for k in fields if k in _COLUMNS and k != "job_id"]
+        if not cols:
+            return
+        with self._lock:
+            self._db.execute(f"UPDATE jobs SET {', '.join(f'{k} = ?' for k in cols)} WHERE job_id = ?",
+                             [fields[k] for k in cols] + [job_id])
+
+    def get(self, job_id: str) -> dict | None:
+        with self._lock:
+            return self._row(self._db.execute("SELECT * FROM jobs WHERE job_id = ?", (job_id,)).fetchone())
+
+    def delete(self, job_id: str):
+        with self._lock:
+            self._db.execute("DELETE FROM jobs WHERE job_id = ?", (job_id,))
+
+    def mark_interrupted(self, ended_at: str) -> int:
+        """上次进程遗留的未完成作业 → interrupted。"""
+        with self._lock:
+            n = self._db.execute(
+                "UPDATE jobs SET status = 'interrupted', ended_at = ?, ended_ts = ?, "
+                "error = COALESCE(error, '服务重启，作业未完成') WHERE status IN (?, ?)",
+                (ended_at, time.time(), *ACTIVE)).rowcount
+        if n:
+            SYS_LOG.warning(f"作业表：{n} 个未完成作业因服务重启标记为 interrupted")
+        return n
+
+    def cleanup(self, retention_s: float = RETENTION_HOURS * 3600) -> list[str]:
+        """删除结束超过保留期的作业，返回被删除的 job_id。"""
+        cutoff = time.time() - retention_s
+        with self._lock:
+            ids = [r[0] for r in self._db.execute(
+                f"SELECT job_id FROM jobs WHERE status IN ({', '.join('?' * len(FINISHED))}) AND ended_ts < ?",
+                (*FINISHED, cutoff))]
+            if ids:
+                self._db.executemany("DELETE FROM jobs WHERE job_id = ?", [(i,) for i in ids])
+        if ids:
+            SYS_LOG.info(f"作业表：清理 {len(ids)} 个超过保留期的已结束作业")
+        return ids
+
+    def counts(self) -> dict:
+        with self._lock:
+            return {r[0]: r[1] for r in self._db.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status")}
@@ -0,0 +1,126 @@
+# core/llm_cache.py
+from __future__ import annotations
+from pathlib import Path
+from typing import Any
+import json, logging, os, threading, time
+
+from utils.hashing import sha256_json
+
+SYS_LOG = logging.getLogger("system")
+
+class LLMCache:
+    """
+    内容寻址的 LLM 响应磁盘缓存（跨项目共享）。
+    - key = sha256(kind, provider, model, prompt, schema)
+    - 每条记录一个 JSON 文件：<cache_dir>/<key[:2]>/<key>.json
+    - 命中会刷新 mtime；evict() 先删过期，再按 mtime 从旧到新删到容量以内
+    - 计数（hits / misses / writes / evicted）按实例统计，一次运行一个实例
+    """
+
+    def __init__(self, cache_dir: str | Path, max_bytes: int | None = None,
+                 max_age_s: float | None = None, enabled: bool = True):
+        self.cache_dir = Path(cache_dir).expanduser()
+        self.max_bytes = max_bytes
+        self.max_age_s = max_age_s
+        self.enabled   = enabled
+        self._lock     = threading.Lock()
+        self._counts   = {"hits": 0, "misses": 0, "writes": 0, "evicted": 0}
+
+    @classmethod
+    def from_env(cls) -> "LLMCache":
+        """
+        环境变量：
+        - LLM_CACHE=0               关闭缓存
+        - LLM_CACHE_DIR             缓存目录（默认 ~/.cache/report_gen/llm）
+        - LLM_CACHE_MAX_MB          容量上限（默认 512）
+        - LLM_CACHE_MAX_AGE_DAYS    过期天数（默认 30）
+        """
+        return cls(
+            cache_dir = os.getenv("LLM_CACHE_DIR", "~/.cache/report_gen/llm"),
+            max_bytes = int(float(os.getenv("LLM_CACHE_MAX_MB", "512")) * 1024 * 1024),
+            max_age_s = float(os.getenv("LLM_CACHE_MAX_AGE_DAYS", "30")) * 86400,
+            enabled   = os.getenv("LLM_CACHE", "1").strip().lower() not in ("0", "false", "off", "no"),
+        )
+
+    # ---------- key ----------
+    @staticmethod
+    def make_key(kind: str, provider: str, model: str, prompt: str, schema: dict | None = None) -> str:
+        return sha256_json({"kind": kind, "provider": provider, "model": model,
+                            "prompt": prompt, "schema": schema})
+
+    def _path(self, key: str) -> Path:
+        return self.cache_dir / key[:2] / f"{key}.json"
+
+    def _count(self, name: str, n: int = 1):
+        with self._lock:
+            self._counts[name] += n
+
+    # ---------- get / put ----------
+    def get(self, key: str) -> Any | None:
+        if not self.enabled:
+            return None
+        p = self._path(key)
+        try:
+            st = p.stat()
+            if self.max_age_s is not None and time.time() - st.st_mtime > self.max_age_s:
+                p.unlink(missing_ok=True)
+                self._count("misses")
+                return None
+            value = json.loads(p.read_text(encoding="utf-8"))["value"]
+            os.utime(p)   # 刷新 mtime，淘汰时按最近使用排序
+        except (FileNotFoundError, KeyError, ValueError, OSError):
+            self._count("misses")
+            return None
+        self._count("hits")
+        return value
+
+    def put(self, key: str, value: Any):
+        if not self.enabled:
+            return
+        p = self._path(key)
+        try:
+            p.parent.mkdir(parents=True, exist_ok=True)
+            tmp = p.with_name(f"{p.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+            tmp.write_text(json.dumps({"created": time.time(), "value": value}, ensure_ascii=False), encoding="utf-8")
+            os.replace(tmp, p)   # 原子替换，并发写同一 key 也不会读到半截文件
+            self._count("writes")
+        except OSError as e:
+            SYS_LOG.warning(f"LLM 缓存写入失败：{p}（{e}）")
+
+    # ---------- eviction ----------
+    def evict(self) -> int:
+        """删除过期条目，并把总大小压到 max_bytes 以内；返回删除条数。"""
+        if not self.enabled or not self.cache_dir.exists():
+            return 0
+        now, removed, entries = time.time(), 0, []
+        for p in self.cache_dir.glob("*/*.json"):
+            try:
+                st = p.stat()
+            except OSError:
+                continue
+            if self.max_age_s is not None and now - st.st_mtime > self.max_age_s:
+                p.unlink(missing_ok=True); removed += 1
+                continue
+            entries.append((st.st_mtime, st.st_size, p))
+
+        total = sum(size for _, size, _ in entries)
+        if self.max_bytes is not None and total > self.max_bytes:
+            for _, size, p in sorted(entries, key=lambda e: e[0]):
+                if total <= self.max_bytes:
+                    break
+                p.unlink(missing_ok=True); removed += 1
+                total -= size
+
+        if removed:
+            self._count("evicted", removed)
+            SYS_LOG.info(f"LLM 缓存淘汰 {removed} 条（剩余约 {total / 1024 / 1024:.1f} MB）")
+        return removed
+
+    def stats(self) -> dict:
+        with self._lock:
+            out = dict(self._counts)
+        lookups = out["hits"] + out["misses"]
+        out["hit_rate"] = round(out["hits"] / lookups, 4) if lookups else None
+        out["enabled"]  = self.enabled
+        out["dir"]      = str(self.cache_dir)
+        return out
@@ -1,63 +1,174 @@
 # logging_setup.py
+"""
+分层日志（user / system / config），按作业路由、后台落盘。
+
+- 三个 logger 各挂一个 QueueHandler：调用线程只把格式化好的记录放进内存队列，写文件由后台 QueueListener 线程完成
+- 日志目录按作业区分：job_logs(dir) 在当前上下文（contextvar）中指定目录，记录入队时带上该目录；
+  API 中并发的作业各写各的 <project_root>/logs/，不再改动全局 handler。未指定时写入 setup_logging 设定的进程缺省目录
+- 线程池需要把调用方的上下文带进工作线程，记录才能归到同一作业（见 core/context_pool.py）
+- 同时保持打开的日志目录数 LOG_MAX_OPEN_DIRS（默认 32），超出按最久未写关闭
+"""
 from __future__ import annotations
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
 from pathlib import Path
-import logging
-from logging.handlers import TimedRotatingFileHandler
-import sys
+import atexit, logging, os, queue, sys, threading
+from logging.handlers import TimedRotatingFileHandler, QueueHandler, QueueListener
+
+MAX_OPEN_DIRS = int(os.getenv("LOG_MAX_OPEN_DIRS", "32"))
+
+# logger 名 → (文件名, 级别)
+_FILES = {
+    "user":   ("user.log",   logging.INFO),
+    "system": ("system.log", logging.INFO),
+    "config": ("config.log", logging.DEBUG),
+}
+_FORMAT = "%(asctime)s | %(levelname)s | %(name)s | %(message)s"
 
 # 单例开关，避免重复添加 handler
 _INITIALIZED = False
 _CUR_DIR: Path | None = None
+_lock     = threading.Lock()
+_queue: "queue.SimpleQueue | None" = None
+_listener: QueueListener | None = None
+_job_dir: ContextVar[Path | None] = ContextVar("job_logs_dir", default=None)
+
+def _default_dir() -> Path:
+    # 默认：以启动脚本所在目录为 root，使用 <root>/logs
+    try:
+        return (Path(sys.argv[0]).resolve().parent / "logs").resolve()
+    except Exception:
+        return Path("./logs").resolve()
+
+class _ContextQueueHandler(QueueHandler):
+    """入队前在调用线程上记下当前作业的日志目录。"""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = super().prepare(record)
+        record.logs_dir = _job_dir.get() or _CUR_DIR or _default_dir()
+        return record
+
+class _RoutingHandler(logging.Handler):
+    """只在 QueueListener 线程中调用：按记录上的日志目录分发到对应的文件 handler。"""
+
+    def __init__(self, console: logging.Handler):
+        super().__init__(logging.DEBUG)
+        self.console = console
+        self._dirs: "OrderedDict[Path, dict[str, logging.Handler]]" = OrderedDict()
+
+    def _file_handler(self, logs_dir: Path, name: str) -> logging.Handler:
+        handlers = self._dirs.get(logs_dir)
+        if handlers is None:
+            logs_dir.mkdir(parents=True, exist_ok=True)
+            handlers = self._dirs[logs_dir] = {}
+            while len(self._dirs) > max(1, MAX_OPEN_DIRS):
+                _, old = self._dirs.popitem(last=False)
+                for h in old.values():
+                    h.close()
+        else:
+            self._dirs.move_to_end(logs_dir)
+        fh = handlers.get(name)
+        if fh is None:
+            filename, level = _FILES[name]
+            fh = handlers[name] = TimedRotatingFileHandler(logs_dir / filename, when="midnight", backupCount=14,
+                                                           encoding="utf-8")
+            fh.setLevel(level)
+            fh.setFormatter(logging.Formatter(_FORMAT))
+        return fh
+
+    def emit(self, record: logging.LogRecord):
+        done = getattr(record, "flush_event", None)
+        if done is not None:                 # flush_logs 的屏障：之前入队的记录都已写出
+            for handlers in self._dirs.values():
+                for h in handlers.values():
+                    h.flush()
+            done.set()
+            return
+        name = record.name.split(".", 1)[0]
+        if name in _FILES:
+            try:
+                self._file_handler(Path(record.logs_dir), name).handle(record)
+            except Exception:
+                self.handleError(record)
+        if name == "system":
+            self.console.handle(record)
+
+    def close(self):
+        for handlers in self._dirs.values():
+            for h in handlers.values():
+                h.close()
+        self._dirs.clear()
+        super().close()
+
+def _install():
+    """挂上 QueueHandler 并启动后台写线程（每个进程一次）。"""
+    global _queue, _listener
+    if _listener is not None:
+        return
+    _queue = queue.SimpleQueue()
+    # 控制台（只挂在 system 上，便于开发时看）
+    console = logging.StreamHandler(sys.stdout)
+    console.setLevel(logging.INFO)
+    console.setFormatter(logging.Formatter(_FORMAT))
+    router = _RoutingHandler(console)
+    _listener = QueueListener(_queue, router)
+    _listener.start()
+    for name, (_, level) in _FILES.items():
+        logger = logging.getLogger(name)
+        logger.handlers = [_ContextQueueHandler(_queue)]
+        logger.setLevel(level)
+    atexit.register(_stop)
+
+def _stop():
+    global _listener
+    if _listener is not None:
+        _listener.stop()              # 写完队列中剩余的记录
+        for h in _listener.handlers:
+            h.close()
+        _listener = None
 
 def setup_logging(logs_dir: str | Path | None = None) -> Path:
     """
-    初始化分层日志。支持显式指定日志目录。
+    初始化分层日志，并设置进程缺省日志目录（不在任何 job_logs 上下文中的记录写到这里）。
     - logs_dir=None：默认使用 项目根下的 logs（推断为 main.py 所在目录的上一级 /logs）
     - 返回最终的日志目录 Path
     """
     global _INITIALIZED, _CUR_DIR
-    if _INITIALIZED and _CUR_DIR and logs_dir is None:
-        return _CUR_DIR
-
-    # 解析日志目录
-    if logs_dir is not None:
-        logs_path = Path(logs_dir).expanduser().resolve()
-    else:
-        # 默认：以启动脚本所在目录的父级为 root，使用 <root>/logs
-        try:
-            root = Path(sys.argv[0]).resolve().parent
-            # 假设结构是 <project_root>/main.py -> root 就是 project_root
-            logs_path = (root / "logs").resolve()
-        except Exception:
-            logs_path = Path("./logs").resolve()
-
-    logs_path.mkdir(parents=True, exist_ok=True)
-
-    # 清理旧 handler（防止重复初始化）
-    for name in ("user", "system", "config"):
-        logger = logging.getLogger(name)
-        logger.handlers = []
+    with _lock:
+        if _INITIALIZED and _CUR_DIR and logs_dir is None:
+            return _CUR_DIR
+        logs_path = Path(logs_dir).expanduser().resolve() if logs_dir is not None else _default_dir()
+        logs_path.mkdir(parents=True, exist_ok=True)
+        _install()
+        _INITIALIZED = True
+        _CUR_DIR = logs_path
+        return logs_path
 
-    # 控制台（只挂在 system 上，便于开发时看）
-    console = logging.StreamHandler(sys.stdout)
-    console.setLevel(logging.INFO)
-    console.setFormatter(logging.Formatter("%(asctime)s | %(levelname)s | %(name)s | %(message)s"))
-
-    def _mk_logger(name: str, filename: str, level: int):
-        logger = logging.getLogger(name)
-        logger.setLevel(level)
-        fh = TimedRotatingFileHandler(logs_path / filename, when="midnight", backupCount=14, encoding="utf-8")
-        fh.setLevel(level)
-        fh.setFormatter(logging.Formatter("%(asctime)s | %(levelname)s | %(name)s | %(message)s"))
-        logger.addHandler(fh)
-        if name == "system":
-            logger.addHandler(console)
-        return logger
+@contextmanager
+def job_logs(logs_dir: str | Path):
+    """在当前上下文中把 user/system/config 日志写到 logs_dir；退出时等待本进程已入队的日志写完。"""
+    path = Path(logs_dir).expanduser().resolve()
+    path.mkdir(parents=True, exist_ok=True)
+    with _lock:
+        _install()
+    token = _job_dir.set(path)
+    try:
+        yield path
+    finally:
+        _job_dir.reset(token)
+        flush_logs()
 
-    _mk_logger("user",   "user.log",   logging.INFO)
-    _mk_logger("system", "system.log", logging.INFO)
-    _mk_logger("config", "config.log", logging.DEBUG)
+def current_logs_dir() -> Path:
+    return _job_dir.get() or _CUR_DIR or _default_dir()
 
-    _INITIALIZED = True
-    _CUR_DIR = logs_path
-    return logs_path
+def flush_logs(timeout: float = 5.0) -> bool:
+    """等待此前入队的日志全部写出（最多 timeout 秒）。"""
+    q, listener = _queue, _listener
+    if q is None or listener is None:
+        return True
+    done = threading.Event()
+    record = logging.makeLogRecord({"name": "__flush__", "msg": ""})
+    record.flush_event = done
+    q.put_nowait(record)
+    return done.wait(timeout)
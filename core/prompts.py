@@ -0,0 +1,92 @@
+# core/prompts.py
+"""
+进程级 Prompt 模板缓存：每个项目的 prompts/ 目录一个共享的 Jinja Environment。
+
+- FileSystemLoader 以 <config_dir>/prompts 为根；auto_reload 按 mtime 检查，文件修改后自动重新编译
+- 编译结果缓存在 Environment 内存中（同一进程内的多次作业共享），并写入磁盘字节码缓存（进程重启后免编译）
+- 计数：memory_hits（直接复用已编译模板）/ compiles（重新编译）/ bytecode_hits（编译时命中磁盘字节码）
+
+环境变量：
+- PROMPT_BYTECODE_DIR   字节码缓存目录（默认 ~/.cache/report_gen/jinja；设为空字符串关闭）
+- PROMPT_CACHE_SIZE     每个 Environment 内存中保留的模板数（默认 400）
+"""
+from __future__ import annotations
+from pathlib import Path
+import os, threading
+
+from jinja2 import Environment, FileSystemLoader, FileSystemBytecodeCache, Template, meta
+
+BYTECODE_DIR = os.getenv("PROMPT_BYTECODE_DIR", "~/.cache/report_gen/jinja")
+CACHE_SIZE   = int(os.getenv("PROMPT_CACHE_SIZE", "400"))
+
+_lock   = threading.Lock()
+_envs: dict[Path, Environment] = {}
+_seen: dict[tuple[Path, str], int] = {}          # (prompts 根, 模板名) → 上次返回的模板对象 id
+_counts = {"memory_hits": 0, "compiles": 0, "bytecode_hits": 0}
+
+class _CountingBytecodeCache(FileSystemBytecodeCache):
+    def load_bytecode(self, bucket):
+        super().load_bytecode(bucket)
+        if bucket.code is not None:
+            with _lock:
+                _counts["bytecode_hits"] += 1
+
+def _bytecode_cache():
+    if not BYTECODE_DIR:
+        return None
+    d = Path(BYTECODE_DIR).expanduser()
+    try:
+        d.mkdir(parents=True, exist_ok=True)
+    except OSError:
+        return None
+    return _CountingBytecodeCache(str(d))
+
+def prompt_env(root: Path) -> Environment:
+    """返回以 root 为根目录的共享 Environment（按需创建）。"""
+    root = Path(root).resolve()
+    with _lock:
+        env = _envs.get(root)
+        if env is None:
+            # 其余选项保持 jinja2 默认值，渲染结果与 Template(源码) 一致
+            env = _envs[root] = Environment(
+                loader         = FileSystemLoader(str(root), encoding="utf-8"),
+                auto_reload    = True,
+                cache_size     = CACHE_SIZE,
+                bytecode_cache = _bytecode_cache(),
+            )
+        return env
+
+def _locate(prompt_path: Path, config_dir: Path | None) -> tuple[Path, str]:
+    """把 prompt 绝对路径拆成 (loader 根目录, 模板名)；不在 <config_dir>/prompts 下时以所在目录为根。"""
+    prompt_path = Path(prompt_path).resolve()
+    if config_dir is not None:
+        root = (Path(config_dir) / "prompts").resolve()
+        if prompt_path.is_relative_to(root):
+            return root, prompt_path.relative_to(root).as_posix()
+    return prompt_path.parent, prompt_path.name
+
+def get_prompt(prompt_path: Path, config_dir: Path | None = None) -> Template:
+    root, name = _locate(prompt_path, config_dir)
+    tpl = prompt_env(root).get_template(name)
+    with _lock:
+        if _seen.get((root, name)) == id(tpl):
+            _counts["memory_hits"] += 1
+        else:
+            _counts["compiles"] += 1
+            _seen[(root, name)] = id(tpl)
+    return tpl
+
+def render_prompt(prompt_path: Path, config_dir: Path | None = None, **ctx) -> str:
+    return get_prompt(prompt_path, config_dir).render(**ctx)
+
+def prompt_variables(prompt_path: Path, config_dir: Path | None = None) -> set[str]:
+    """Prompt 中直接引用的顶层变量（如 {{ sum_total.x }} → sum_total）；文件缺失/语法错误时抛异常。"""
+    root, name = _locate(prompt_path, config_dir)
+    env = prompt_env(root)
+    src, _, _ = env.loader.get_source(env, name)
+    return meta.find_undeclared_variables(env.parse(src))
+
+def prompt_cache_stats() -> dict:
+    """进程累计计数（调用方可前后相减得到单次运行的增量）。"""
+    with _lock:
+        return {**_counts, "environments": len(_envs)}
@@ -0,0 +1,106 @@
+# core/rate_limit.py
+"""
+客户端令牌桶限流：每个 endpoint（一个 key + base_url）各有一个 RPM 桶和一个 TPM 桶。
+
+- 调用前按“1 个请求 + 估算 token 数”预留额度；所有 endpoint 都没有额度时等待，而不是发出去吃 429
+- 调用后按实际 usage 多退少补（settle）；收到 429 时把该 endpoint 冷却一段时间（penalize）
+- 多个 endpoint 之间轮询挑选当前有额度的那个，吞吐随 key 数线性增长
+"""
+from __future__ import annotations
+import logging, threading, time
+
+SYS_LOG = logging.getLogger("system")
+
+class TokenBucket:
+    """per_minute 为 None/0 表示不限；容量（突发上限）缺省为一分钟的额度。"""
+
+    def __init__(self, per_minute: float | None, burst: float | None = None):
+        self.per_minute = float(per_minute or 0)
+        self.capacity   = float(burst or self.per_minute)
+        self.tokens     = self.capacity
+        self.last       = time.monotonic()
+
+    @property
+    def unlimited(self) -> bool:
+        return self.per_minute <= 0
+
+    def _refill(self, now: float):
+        if not self.unlimited:
+            self.tokens = min(self.capacity, self.tokens + (now - self.last) * self.per_minute / 60.0)
+        self.last = now
+
+    def wait_time(self, n: float, now: float) -> float:
+        """还需等待多少秒才能取出 n 个令牌（超过容量的请求按容量计，避免永远等不到）。"""
+        if self.unlimited:
+            return 0.0
+        self._refill(now)
+        need = min(n, self.capacity)
+        return 0.0 if self.tokens >= need else (need - self.tokens) * 60.0 / self.per_minute
+
+    def take(self, n: float):
+        if not self.unlimited:
+            self.tokens -= n          # 允许透支，后续请求会相应等待
+
+class RateLimitedPool:
+    """
+    一组 endpoint 的额度调度。成员需有 rpm / tpm（TokenBucket）与 blocked_until（float）属性。
+    线程安全；所有线程共用同一把锁和同一组桶。
+    """
+
+    def __init__(self, members: list, name: str = ""):
+        self.members = list(members)
+        self.name    = name
+        self._lock   = threading.Lock()
+        self._rr     = 0
+        self.waits   = 0              # 因额度不足而等待的次数
+        self.wait_s  = 0.0            # 累计等待秒数
+
+    def reserve(self, tokens: int):
+        """非阻塞：有额度则预留并返回 (member, 0)，否则返回 (None, 最短等待秒数)。"""
+        with self._lock:
+            now, best = time.monotonic(), None
+            n = len(self.members)
+            for i in range(n):
+                m = self.members[(self._rr + i) % n]
+                w = max(m.blocked_until - now, m.rpm.wait_time(1, now), m.tpm.wait_time(tokens, now))
+                if w <= 0:
+                    m.rpm.take(1)
+                    m.tpm.take(tokens)
+                    self._rr = (self._rr + i + 1) % n
+                    return m, 0.0
+                best = w if best is None else min(best, w)
+            return None, best
+
+    def _note_wait(self, seconds: float, label: str):
+        with self._lock:
+            self.waits  += 1
+            self.wait_s += seconds
+        if seconds >= 1.0:
+            SYS_LOG.info(f"限流等待 {seconds:.1f}s：{self.name} {label}")
+
+    def acquire(self, tokens: int, label: str = ""):
+        """阻塞直到某个 endpoint 有额度，返回该 endpoint。"""
+        t0 = time.monotonic()
+        while True:
+            m, w = self.reserve(tokens)
+            if m is not None:
+                if time.monotonic() - t0 > 0.05:
+                    self._note_wait(time.monotonic() - t0, label)
+                return m
+            time.sleep(min(w, 5.0))
+
+    def settle(self, member, reserved: int, actual: int | None):
+        """按实际 token 用量修正 TPM 桶（actual 为 None 时不修正）。"""
+        if actual is None:
+            return
+        with self._lock:
+            member.tpm.take(actual - reserved)
+
+    def penalize(self, member, seconds: float):
+        """收到 429：该 endpoint 在 seconds 秒内不再被挑选。"""
+        with self._lock:
+            member.blocked_until = max(member.blocked_until, time.monotonic() + seconds)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"endpoints": len(self.members), "waits": self.waits, "wait_s": round(self.wait_s, 2)}
@@ -0,0 +1,230 @@
+# core/retry.py
+"""
+LLM 调用的重试与对冲（hedging）。
+
+- 重试：指数退避 + 全抖动（full jitter），只重试 429 / 5xx / 超时 / 连接错误；429 带 Retry-After 时优先遵守
+- 对冲：请求占到槽位后超过“近期延迟 p95”仍未返回时，在线程池中再发一个相同请求；主请求在调用线程内执行，
+  返回后取先成功的那个，主请求失败时直接采用在途的备份（省去一轮退避重试）
+- 每次逻辑调用返回 CallInfo（尝试次数、重试次数、是否对冲/对冲是否胜出、耗时），由调用方写入 run_summary.json
+
+llm.yaml 中每个 provider 可选：
+    retry:
+      max_attempts: 3         # 含首次调用（缺省 LLM_RETRY_MAX_ATTEMPTS，默认 3）
+      backoff_base: 1.0       # 第 n 次重试前等待 uniform(0, min(backoff_max, backoff_base * 2^(n-1))) 秒
+      backoff_max: 30
+      hedge: false            # 是否开启对冲（缺省 LLM_HEDGE，默认关闭）
+      hedge_quantile: 0.95    # 对冲延迟取近期成功调用延迟的分位数
+      hedge_min_delay: 2.0    # 对冲延迟下限（秒）
+      hedge_min_samples: 20   # 样本不足时不对冲
+"""
+from __future__ import annotations
+from collections import deque
+from core.context_pool import ContextThreadPoolExecutor
+from dataclasses import dataclass, field, asdict
+import contextvars, logging, os, random, threading, time
+
+import httpx, openai
+
+SYS_LOG = logging.getLogger("system")
+
+DEFAULT_MAX_ATTEMPTS = int(os.getenv("LLM_RETRY_MAX_ATTEMPTS", "3"))
+DEFAULT_HEDGE        = os.getenv("LLM_HEDGE", "0").lower() in ("1", "true", "yes", "on")
+
+# 对冲的备份请求在独立线程中发出，与业务线程池互不占用（主请求在调用线程内执行）
+_HEDGE_POOL = ContextThreadPoolExecutor(max_workers=int(os.getenv("LLM_HEDGE_WORKERS", "16")), thread_name_prefix="hedge")
+
+@dataclass
+class RetryPolicy:
+    max_attempts:      int   = DEFAULT_MAX_ATTEMPTS
+    backoff_base:      float = 1.0
+    backoff_max:       float = 30.0
+    hedge:             bool  = DEFAULT_HEDGE
+    hedge_quantile:    float = 0.95
+    hedge_min_delay:   float = 2.0
+    hedge_min_samples: int   = 20
+
+    @classmethod
+    def from_cfg(cls, cfg: dict | None) -> "RetryPolicy":
+        known = set(cls.__dataclass_fields__)
+        return cls(**{k: v for k, v in (cfg or {}).items() if k in known})
+
+    def backoff(self, attempt: int, exc: BaseException | None = None) -> float:
+        """第 attempt 次失败后的等待秒数。"""
+        after = retry_after(exc)
+        if after is not None:
+            return min(self.backoff_max, after)
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** (attempt - 1)))
+
+class LatencyWindow:
+    """最近 N 次成功调用的延迟（秒），线程安全。"""
+
+    def __init__(self, size: int = 200):
+        self._buf  = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def add(self, seconds: float):
+        with self._lock:
+            self._buf.append(seconds)
+
+    def __len__(self):
+        return len(self._buf)
+
+    def quantile(self, q: float) -> float | None:
+        with self._lock:
+            data = sorted(self._buf)
+        if not data:
+            return None
+        return data[min(len(data) - 1, int(q * len(data)))]
+
+@dataclass
+class CallInfo:
+    attempts:  int   = 0
+    retries:   int   = 0
+    hedged:    int   = 0          # 发出的对冲请求数
+    hedge_won: int   = 0          # 对冲请求先返回的次数
+    latency_s: float = 0.0
+    ok:        bool  = False
+    error:     str | None = None
+    errors:    list[str] = field(default_factory=list)   # 每次失败尝试的简述
+
+    def as_dict(self) -> dict:
+        d = asdict(self)
+        d["latency_s"] = round(d["latency_s"], 3)
+        if not d["errors"]:
+            del d["errors"]
+        if d["error"] is None:
+            del d["error"]
+        return d
+
+# ---------------- 错误分类 ----------------
+def status_code(exc: BaseException) -> int | None:
+    code = getattr(exc, "status_code", None)
+    if code is None and getattr(exc, "response", None) is not None:
+        code = getattr(exc.response, "status_code", None)
+    return code
+
+def is_retryable(exc: BaseException) -> bool:
+    if isinstance(exc, (openai.APITimeoutError, openai.APIConnectionError, openai.RateLimitError,
+                        openai.InternalServerError, httpx.TimeoutException, httpx.TransportError, TimeoutError)):
+        return True
+    code = status_code(exc)
+    return code is not None and (code == 429 or code >= 500)
+
+def is_throttle(exc: BaseException) -> bool:
+    """429 / 超时：说明 provider 已过载（自适应限流等据此收缩）。"""
+    return isinstance(exc, (openai.RateLimitError, openai.APITimeoutError, httpx.TimeoutException, TimeoutError)) \
+        or status_code(exc) == 429
+
+def retry_after(exc: BaseException | None) -> float | None:
+    resp = getattr(exc, "response", None)
+    if resp is None or status_code(exc) != 429:
+        return None
+    try:
+        return max(0.0, float(resp.headers.get("retry-after")))
+    except (TypeError, ValueError, AttributeError):
+        return None
+
+def _brief(exc: BaseException) -> str:
+    code = status_code(exc)
+    return f"{type(exc).__name__}{f'({code})' if code else ''}: {str(exc)[:200]}"
+
+# ---------------- 执行 ----------------
+def hedge_delay(policy: RetryPolicy, window: LatencyWindow) -> float | None:
+    if not policy.hedge or len(window) < policy.hedge_min_samples:
+        return None
+    q = window.quantile(policy.hedge_quantile)
+    return None if q is None else max(policy.hedge_min_delay, q)
+
+def _timed(fn, window: LatencyWindow, on_ready=None):
+    """
+    执行 fn(ready)：fn 占到限流额度与并发槽位、发出请求前调用 ready()。
+    成功时把 ready 之后的耗时记入 window（排队/限流等待不算作延迟）；返回 (结果, ready 时刻)。
+    """
+    marks: list[float] = []
+
+    def ready():
+        marks.append(time.perf_counter())
+        if on_ready is not None:
+            on_ready()
+
+    ts = time.perf_counter()
+    result = fn(ready)
+    window.add(time.perf_counter() - (marks[0] if marks else ts))
+    return result
+
+def _hedged(fn, delay: float, info: CallInfo, window: LatencyWindow):
+    """
+    主请求在当前线程内执行，占到槽位后才开始计时；超过 delay 仍未返回时，向 _HEDGE_POOL 只提交一个备份请求。
+    主请求返回后：备份已先成功则采用备份结果（hedge_won），主请求失败时等待在途的备份。
+    """
+    lock   = threading.Lock()
+    state  = {"done": False, "backup": None}
+    timers = []
+    ctx    = contextvars.copy_context()     # 定时器线程里提交备份时沿用调用方的上下文（作业日志目录等）
+
+    def _launch():
+        with lock:
+            if state["done"]:
+                return
+            info.hedged += 1
+            state["backup"] = _HEDGE_POOL.submit(_timed, fn, window)
+
+    def _arm():
+        t = threading.Timer(delay, ctx.run, args=(_launch,))
+        t.daemon = True
+        timers.append(t)
+        t.start()
+
+    def _finish():
+        with lock:
+            state["done"] = True
+        for t in timers:
+            t.cancel()
+        return state["backup"]
+
+    try:
+        result = _timed(fn, window, _arm)
+    except Exception as e:
+        backup = _finish()
+        if backup is None:
+            raise
+        try:
+            result = backup.result()
+        except Exception:
+            raise e
+        info.hedge_won += 1
+        return result
+    backup = _finish()
+    if backup is not None and backup.done() and backup.exception() is None:
+        info.hedge_won += 1
+        return backup.result()
+    return result
+
+def call_with_retry(fn, policy: RetryPolicy, window: LatencyWindow, label: str = "",
+                    hedge: bool = True, can_retry=None) -> tuple[object, CallInfo]:
+    """
+    执行 fn(ready)（一次网络调用），按 policy 重试/对冲。返回 (结果, CallInfo)。
+    fn 在占到限流额度/并发槽位后、发出请求前调用 ready()：对冲计时与延迟统计都从这一刻开始。
+    最终失败时抛出最后一次的异常，异常对象上附带 call_info 属性。
+    can_retry：可选，返回 False 时不再重试（例如流式输出已经推送了部分 token）。
+    """
+    info = CallInfo()
+    t0   = time.perf_counter()
+    for attempt in range(1, max(1, policy.max_attempts) + 1):
+        info.attempts = attempt
+        delay = hedge_delay(policy, window) if hedge else None
+        try:
+            result = _hedged(fn, delay, info, window) if delay else _timed(fn, window)
+            info.ok, info.latency_s = True, time.perf_counter() - t0
+            return result, info
+        except Exception as e:
+            info.errors.append(_brief(e))
+            last = attempt >= policy.max_attempts or not is_retryable(e) or (can_retry is not None and not can_retry())
+            if last:
+                info.error, info.latency_s = _brief(e), time.perf_counter() - t0
+                e.call_info = info
+                raise
+            wait_s = policy.backoff(attempt, e)
+            info.retries += 1
+            SYS_LOG.warning(f"LLM 调用失败，{wait_s:.1f}s 后重试（{attempt}/{policy.max_attempts}）：{label}：{_brief(e)}")
+            time.sleep(wait_s)
@@ -0,0 +1,227 @@
+# core/router.py
+"""
+按延迟/错误率在多个 provider 之间路由，并在超时或失败时自动切换。
+
+sheet_tasks.yaml / paragraph_tasks.yaml 中 provider 可写成：
+    provider: qwen                        # 单个（与原来相同）
+    provider: [qwen, openai]              # 有序列表：优先用靠前且健康的，失败/超时按健康度切换到其余
+    provider: {qwen: 3, openai: 1}        # 加权集合：按 权重 × 健康度 随机挑选
+    failover_after: 30                    # 秒；主调用超过该时间仍未返回，就并行发往下一个 provider（缺省 LLM_FAILOVER_AFTER）
+
+健康度取自 llm_client 中各 provider 的滚动统计（近期 p50/p95 延迟、错误率）。
+每次调用实际使用的 provider 记入 system.log 与 run_summary.json 的 llm_calls（route / failover 字段）。
+"""
+from __future__ import annotations
+from concurrent.futures import Future
+from core.context_pool import ContextThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+import contextvars, logging, os, queue, random, threading
+
+import llm_client
+
+SYS_LOG = logging.getLogger("system")
+
+FAILOVER_AFTER = float(os.getenv("LLM_FAILOVER_AFTER", "60"))
+# 失败率（限流 + 其他错误）高于该值的 provider 视为不健康（除非全部不健康）
+MAX_ERROR_RATE = float(os.getenv("LLM_ROUTE_MAX_ERROR_RATE", "0.3"))
+# p95 超过最快者该倍数的 provider 视为不健康
+SLOW_FACTOR    = float(os.getenv("LLM_ROUTE_SLOW_FACTOR", "3"))
+
+_FAILOVER_POOL = ContextThreadPoolExecutor(max_workers=int(os.getenv("LLM_FAILOVER_WORKERS", "16")), thread_name_prefix="failover")
+
+def parse_route(spec, default: str = "qwen") -> list[tuple[str, float]]:
+    """provider 配置 → [(名称, 权重)]；字符串/列表的权重为 1。"""
+    if not spec:
+        return [(default, 1.0)]
+    if isinstance(spec, str):
+        return [(spec, 1.0)]
+    if isinstance(spec, dict):
+        return [(str(k), float(v or 0)) for k, v in spec.items()]
+    return [(str(x), 1.0) for x in spec]
+
+def route_label(spec, default: str = "qwen") -> str:
+    """稳定的路由标识：单个 provider 时就是其名称（缓存键/批量分组用）。"""
+    items = parse_route(spec, default)
+    if len(items) == 1:
+        return items[0][0]
+    if isinstance(spec, dict):
+        return ",".join(f"{n}:{w:g}" for n, w in items)
+    return ">".join(n for n, _ in items)
+
+@dataclass
+class Route:
+    items:          list[tuple[str, float]]
+    weighted:       bool
+    failover_after: float
+    label:          str
+
+    @classmethod
+    def parse(cls, spec, failover_after: float | None = None, default: str = "qwen") -> "Route":
+        return cls(items=parse_route(spec, default), weighted=isinstance(spec, dict),
+                   failover_after=float(failover_after if failover_after is not None else FAILOVER_AFTER),
+                   label=route_label(spec, default))
+
+    @property
+    def primary(self) -> str:
+        return self.items[0][0]
+
+    @property
+    def names(self) -> list[str]:
+        return [n for n, _ in self.items]
+
+    # ---------- 选路 ----------
+    def rank(self, config_dir: Path) -> list[str]:
+        """返回本次调用的 provider 顺序：第一个为选中的，其余为故障切换顺序。"""
+        if len(self.items) == 1:
+            return [self.primary]
+        health = {n: llm_client.provider_health(n, config_dir) for n in self.names}
+        p95s   = [h["latency_p95_s"] for h in health.values() if h.get("latency_p95_s")]
+        best   = min(p95s) if p95s else None
+
+        def healthy(n):
+            h = health[n]
+            if _fail_rate(h) > MAX_ERROR_RATE:
+                return False
+            return not (best and h.get("latency_p95_s") and h["latency_p95_s"] > best * SLOW_FACTOR)
+
+        def score(n):   # 越小越好；没有样本的 provider 视为 0（先探测）
+            h = health[n]
+            return (h.get("latency_p95_s") or 0.0) * (1 + 4 * _fail_rate(h))
+
+        weights = dict(self.items)
+        if self.weighted:
+            pool = [n for n in self.names if healthy(n) and weights[n] > 0] or [n for n in self.names if weights[n] > 0]
+            w    = [weights[n] / (1.0 + score(n)) for n in pool]
+            first = random.choices(pool, weights=w)[0] if pool else self.primary
+        else:
+            first = next((n for n in self.names if healthy(n)), min(self.names, key=score))
+        rest = sorted((n for n in self.names if n != first), key=lambda n: (not healthy(n), score(n)))
+        return [first] + rest
+
+def _fail_rate(health: dict) -> float:
+    """限流（429/超时）与其他错误合计的失败率。"""
+    return (health.get("error_rate") or 0.0) + (health.get("throttle_rate") or 0.0)
+
+def _tag(on_call, route: Route, idx: int):
+    if on_call is None:
+        return None
+    return lambda rec: on_call({**rec, "route": route.label, "failover": idx}) if len(route.items) > 1 else on_call(rec)
+
+def _log_choice(route: Route, order: list[str], label: str, idx: int, why: str = ""):
+    if len(order) > 1:
+        SYS_LOG.info(f"路由：{label} → {order[idx]}{'（' + why + '）' if why else ''}，候选 {order}")
+
+class _Skipped(Exception):
+    """备份调用尚未开始时已有结果：直接放弃，不占额度。"""
+
+def routed_invoke(route: Route, config_dir: Path, fn, kind: str = "", label: str = "", on_call=None,
+                  hedge: bool = True, can_retry=None, tokens: int = 0, stream: bool = False):
+    """
+    按路由执行一次逻辑调用；fn(client, model_name) 发出请求。
+    - 非流式：主调用在当前线程内执行；它占到 provider 槽位后超过 failover_after 仍未返回，
+      就在线程池中发往下一个 provider（每个备份同样从占到槽位起计时）；主调用失败则立即切换。
+      排队/限流等待不计入 failover_after。主调用成功即返回；失败时取备份中先成功的。
+      有结果后尚未开始的备份直接放弃。
+    - 流式：不并行（避免重复推送 token），只在失败且尚未推送内容时按顺序切换
+    """
+    order = route.rank(config_dir)
+
+    def _one(idx: int, on_ready=None):
+        name = order[idx]
+        model = llm_client.provider_model(name, config_dir)
+        return llm_client.invoke(name, config_dir, lambda c: fn(c, model), kind=kind, label=label,
+                                 on_call=_tag(on_call, route, idx), hedge=hedge, can_retry=can_retry, tokens=tokens,
+                                 on_ready=on_ready)
+
+    _log_choice(route, order, label, 0)
+    if len(order) == 1:
+        return _one(0)
+
+    if stream:
+        for idx in range(len(order)):
+            try:
+                return _one(idx)
+            except Exception as e:
+                if idx + 1 >= len(order) or (can_retry is not None and not can_retry()):
+                    raise
+                _log_choice(route, order, label, idx + 1, f"{order[idx]} 失败：{type(e).__name__}")
+
+    ctx     = contextvars.copy_context()          # 定时器线程里提交备份时沿用调用方的上下文（作业日志目录等）
+    lock    = threading.Lock()
+    futs: dict[Future, int] = {}                  # future → 在 order 中的下标（失败日志要指明是哪个 provider）
+    done_q: "queue.SimpleQueue[Future]" = queue.SimpleQueue()
+    timers: list[threading.Timer] = []
+    state   = {"done": False, "next": 1, "running": 0}
+
+    def _backup(idx: int):
+        if state["done"]:
+            raise _Skipped()
+        return _one(idx, _deadline())
+
+    def _launch(why: str) -> bool:
+        with lock:
+            if state["done"] or state["next"] >= len(order):
+                return False
+            idx = state["next"]
+            state["next"] += 1
+            state["running"] += 1
+            _log_choice(route, order, label, idx, why)
+            fut = _FAILOVER_POOL.submit(_backup, idx)
+            futs[fut] = idx
+        fut.add_done_callback(done_q.put)
+        return True
+
+    def _deadline():
+        """返回 on_ready 回调：调用首次占到槽位时开始 failover_after 倒计时，到时发往下一个 provider。"""
+        armed = []
+        def _arm():
+            if armed or route.failover_after <= 0:
+                return
+            armed.append(True)
+            t = threading.Timer(route.failover_after, ctx.copy().run,
+                                args=(_launch, f"超过 {route.failover_after:g}s 未返回"))
+            t.daemon = True
+            with lock:
+                if state["done"]:
+                    return
+                timers.append(t)
+            t.start()
+        return _arm
+
+    def _finish():
+        with lock:
+            state["done"] = True
+            pending = list(timers)
+        for t in pending:
+            t.cancel()
+        for fut in futs:
+            fut.cancel()                          # 尚未开始的备份不再执行
+
+    try:
+        result = _one(0, _deadline())
+    except Exception as e:
+        last_exc = e
+        _launch(f"{order[0]} 失败：{type(e).__name__}")
+    else:
+        _finish()
+        return result
+
+    while True:
+        with lock:
+            if state["running"] == 0:
+                state["done"] = True              # 没有在途的备份，也不会再有新的
+                break
+        fut = done_q.get()
+        with lock:
+            state["running"] -= 1
+        exc = None if fut.cancelled() else fut.exception()
+        if fut.cancelled() or isinstance(exc, _Skipped):
+            continue
+        if exc is None:
+            _finish()
+            return fut.result()
+        last_exc = exc
+        _launch(f"{order[futs[fut]]} 失败：{type(exc).__name__}")
+    _finish()
+    raise last_exc
@@ -0,0 +1,150 @@
+# core/run_state.py
+"""
+增量重跑：按输入指纹复用上一次运行的抽取/生成结果。
+
+- Sheet 指纹 = 解析后表格内容 + prompt 文件内容 + 该 Sheet 的任务配置（keys/compute/chunking/provider…）+ 所用模型
+- 段落指纹 = 段落配置 + prompt 文件内容 + keys 的取值 + prompt 直接引用的 Sheet 的全部取值 + 所用模型
+- 指纹未变且上次成功的，直接复用结果；失败的不记录，下次必然重算
+- 每次运行结束只保存本次涉及的条目（已删除的 Sheet/段落自然淘汰），写入 <project_root>/.cache/run_state.json
+
+环境变量：INCREMENTAL=0 关闭（每次全量重算）。
+"""
+from __future__ import annotations
+from pathlib import Path
+import copy, json, logging, os, threading
+
+import pandas as pd
+
+from utils.hashing import sha256_json, sha256_text, sha256_file
+from utils.resolve import resolve
+
+SYS_LOG  = logging.getLogger("system")
+USER_LOG = logging.getLogger("user")
+
+STATE_VERSION = 1
+
+def _file_hash(path: Path) -> str | None:
+    try:
+        return sha256_file(path)
+    except OSError:
+        return None
+
+def _models(spec, config_dir: Path) -> list:
+    """provider 配置对应的模型名（llm.yaml 改模型后应重算）；读取失败时用 provider 名代替。"""
+    from core.router import parse_route
+    import llm_client
+    out = []
+    for name, _ in parse_route(spec):
+        try:
+            out.append(llm_client.provider_model(name, config_dir))
+        except Exception:
+            out.append(name)
+    return out
+
+def frame_hash(df: pd.DataFrame) -> str:
+    return sha256_text(json.dumps([str(c) for c in df.columns], ensure_ascii=False) + "\n" + df.to_csv(index=False))
+
+class RunState:
+    def __init__(self, path: Path, enabled: bool = True):
+        self.path    = Path(path)
+        self.enabled = enabled
+        self._lock   = threading.Lock()
+        self._prev   = {"sheets": {}, "paragraphs": {}}
+        self._next   = {"sheets": {}, "paragraphs": {}}
+        self._report = {"sheets": {"reused": [], "recomputed": []},
+                        "paragraphs": {"reused": [], "recomputed": []}}
+        if enabled:
+            self._load()
+
+    @classmethod
+    def for_project(cls, root: Path, enabled: bool | None = None) -> "RunState":
+        if enabled is None:
+            enabled = os.getenv("INCREMENTAL", "1").strip().lower() not in ("0", "false", "off", "no")
+        return cls(Path(root) / ".cache" / "run_state.json", enabled)
+
+    def _load(self):
+        try:
+            data = json.loads(self.path.read_text(encoding="utf-8"))
+        except FileNotFoundError:
+            return
+        except Exception as e:
+            SYS_LOG.warning(f"增量状态读取失败，将全量运行：{self.path}：{e}")
+            return
+        if data.get("version") == STATE_VERSION:
+            self._prev = {"sheets": data.get("sheets") or {}, "paragraphs": data.get("paragraphs") or {}}
+
+    # ---------- 指纹 ----------
+    def sheet_fp(self, sheet: str, df: pd.DataFrame, cfg: dict, config_dir: Path) -> str:
+        prompt = cfg.get("prompt")
+        return sha256_json({
+            "table":  frame_hash(df),
+            "cfg":    cfg,
+            "prompt": _file_hash(config_dir / "prompts" / prompt) if prompt else None,
+            "models": _models(cfg.get("provider", "qwen"), config_dir),
+        })
+
+    def para_fp(self, pid: str, task: dict, extracted: dict, deps: set[str], config_dir: Path) -> str:
+        keys = task.get("keys") or []
+        return sha256_json({
+            "task":   task,
+            "prompt": _file_hash(config_dir / "prompts" / task["prompt"]) if task.get("prompt") else None,
+            "values": {k: resolve(k, extracted, strict=True) for k in keys},
+            "sheets": {s: extracted.get(s) for s in sorted(deps)},
+            "models": _models(task.get("provider", "qwen"), config_dir),
+        })
+
+    # ---------- 复用 / 记录 ----------
+    # 存取都做深拷贝：抽取结果随后会被改写（如 fill 段落补 "-"），不能让这些改动混进保存的状态
+    def _reuse(self, kind: str, name: str, fp: str, field: str):
+        if not self.enabled:
+            return None
+        prev = self._prev[kind].get(name)
+        if not prev or prev.get("fp") != fp or field not in prev:
+            return None
+        with self._lock:
+            self._next[kind][name] = prev
+            self._report[kind]["reused"].append(name)
+        return copy.deepcopy(prev[field])
+
+    def _put(self, kind: str, name: str, fp: str, field: str, value):
+        with self._lock:
+            self._report[kind]["recomputed"].append(name)
+            if value is not None:
+                self._next[kind][name] = {"fp": fp, field: copy.deepcopy(value)}
+
+    def reuse_sheet(self, sheet: str, fp: str) -> dict | None:
+        return self._reuse("sheets", sheet, fp, "values")
+
+    def put_sheet(self, sheet: str, fp: str, values: dict | None):
+        self._put("sheets", sheet, fp, "values", values)
+
+    def reuse_paragraph(self, pid: str, fp: str) -> str | None:
+        return self._reuse("paragraphs", pid, fp, "text")
+
+    def put_paragraph(self, pid: str, fp: str, text: str | None):
+        self._put("paragraphs", pid, fp, "text", text)
+
+    # ---------- 保存 / 报告 ----------
+    def save(self):
+        if not self.enabled:
+            return
+        data = {"version": STATE_VERSION, **self._next}
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.path.with_suffix(".tmp")
+            tmp.write_text(json.dumps(data, ensure_ascii=False, default=str), encoding="utf-8")
+            os.replace(tmp, self.path)
+        except Exception as e:
+            SYS_LOG.warning(f"增量状态保存失败：{self.path}：{e}")
+
+    def report(self) -> dict:
+        with self._lock:
+            rep = {k: {kk: list(vv) for kk, vv in v.items()} for k, v in self._report.items()}
+        return {"enabled": self.enabled, **rep}
+
+    def log_summary(self):
+        if not self.enabled:
+            return
+        r = self.report()
+        USER_LOG.info(f"[增量运行] Sheet：重新抽取 {len(r['sheets']['recomputed'])}，复用 {len(r['sheets']['reused'])}；"
+                      f"段落：重新生成 {len(r['paragraphs']['recomputed'])}，复用 {len(r['paragraphs']['reused'])}")
@@ -0,0 +1,48 @@
+# core/stages.py
+"""
+流水线阶段计时：每个阶段的耗时与结束时的进程峰值内存（RSS），写入 system.log 与 run_summary.json 的 stats.stages。
+
+峰值内存取 getrusage 的 ru_maxrss（进程启动以来的最高值，只增不减）；
+Windows 等没有 resource 模块时装了 psutil 则取当前 RSS 代替，否则不记录。
+"""
+from __future__ import annotations
+from contextlib import contextmanager
+import logging, sys, threading, time
+
+SYS_LOG = logging.getLogger("system")
+
+def peak_rss_mb() -> float | None:
+    try:
+        import resource
+        kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return round(kb / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)   # macOS 单位为字节
+    except ImportError:
+        pass
+    try:
+        import psutil
+        return round(psutil.Process().memory_info().rss / (1024 * 1024), 1)
+    except Exception:
+        return None
+
+class StageTimer:
+    def __init__(self):
+        self.stages: list[dict] = []
+        self._lock  = threading.Lock()
+        self._t0    = time.perf_counter()
+
+    @contextmanager
+    def stage(self, name: str):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            rec = {"stage": name, "seconds": round(time.perf_counter() - t0, 3), "peak_rss_mb": peak_rss_mb()}
+            with self._lock:
+                self.stages.append(rec)
+            mem = f"，峰值内存 {rec['peak_rss_mb']}MB" if rec["peak_rss_mb"] is not None else ""
+            SYS_LOG.info(f"阶段完成：{name} {rec['seconds']:.2f}s{mem}")
+
+    def report(self) -> dict:
+        with self._lock:
+            return {"total_s": round(time.perf_counter() - self._t0, 3), "peak_rss_mb": peak_rss_mb(),
+                    "items": list(self.stages)}
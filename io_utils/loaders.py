@@ -2,12 +2,21 @@
 from __future__ import annotations
 from pathlib import Path
 from typing import Tuple, Any
-import logging
+import importlib.util, logging, os, threading, time
+from core.context_pool import ContextThreadPoolExecutor
 import yaml
 import pandas as pd
 
+from utils.hashing import sha256_file
+
 SYS_LOG = logging.getLogger("system")
 
+# 多工作簿输入时并行打开/解析的线程数
+EXCEL_LOAD_WORKERS = int(os.getenv("EXCEL_LOAD_WORKERS", "4"))
+
+# Excel 解析引擎：auto（装了 python-calamine 用 calamine，否则 openpyxl 只读模式）/ calamine / openpyxl
+EXCEL_ENGINE = os.getenv("EXCEL_ENGINE", "auto").strip().lower()
+
 # ---------------- 宽松 YAML 加载（运行期用） ----------------
 def load_yaml(path: Path) -> dict:
     """
@@ -59,9 +68,127 @@ def load_yaml_strict(path: Path) -> Tuple[dict, list[dict], str | None]:
         return ({}, [], f"YAML not found: {path}")
 
 # ---------------- Excel / 模板加载（向后兼容 + 小幅增强） ----------------
-def load_excel_first(input_dir: Path, pattern: str = "*.xls*") -> pd.ExcelFile:
+def excel_engine(path: Path, engine: str | None = None) -> str | None:
+    """选择解析引擎；.xls 等 openpyxl 不支持的格式交给 pandas 默认（None）。"""
+    engine = (engine or EXCEL_ENGINE or "auto").lower()
+    has_calamine = importlib.util.find_spec("python_calamine") is not None
+    if engine == "calamine" and not has_calamine:
+        SYS_LOG.warning("EXCEL_ENGINE=calamine 但未安装 python-calamine，改用默认引擎")
+        engine = "auto"
+    if engine == "auto":
+        if has_calamine:
+            return "calamine"
+        engine = "openpyxl"
+    if engine == "openpyxl" and Path(path).suffix.lower() not in (".xlsx", ".xlsm", ".xltx", ".xltm"):
+        return None
+    return engine
+
+class Workbook:
+    """
+    pd.ExcelFile 的薄封装：只在被请求时解析对应 Sheet，每个 Sheet 每次运行只解析一次。
+    - sheet_names / io / parse(sheet) 与 pd.ExcelFile 用法一致（验证器、抽取共用同一个对象）
+    - parse 结果缓存在对象内并直接返回（同一个 DataFrame，调用方不要原地修改）；解析失败的异常也缓存，再次请求时原样抛出
+    - snapshot_root：给出项目根目录时启用 Sheet 列式快照（io_utils/sheet_cache.py），
+      工作簿内容未变时直接从快照读取，Excel 只在需要时才打开
+    - 线程安全（底层 ExcelFile 不是）
+    - stats()：引擎、打开耗时、各 Sheet 解析耗时、快照命中
     """
-    在 input_dir 中按 pattern 找到第一个 Excel，并返回 pd.ExcelFile。
+
+    def __init__(self, path: Path, engine: str | None = None, snapshot_root: Path | None = None):
+        self.io     = Path(path)
+        self.engine = excel_engine(self.io, engine)
+        self._lock  = threading.Lock()
+        self._frames: dict[str, pd.DataFrame] = {}
+        self._errors: dict[str, Exception] = {}
+        self._parse_s: dict[str, float] = {}
+        self._xls   = None
+        self.open_s = 0.0
+        self.snapshots = None
+        if snapshot_root is not None:
+            from io_utils.sheet_cache import SheetSnapshots
+            snaps = SheetSnapshots.for_project(snapshot_root, sha256_file(self.io), engine=self.engine)
+            self.snapshots = snaps if snaps.enabled else None
+        names = self.snapshots.sheet_names() if self.snapshots else None
+        if names is None:
+            names = list(self._excel().sheet_names)
+            if self.snapshots:
+                self.snapshots.put_sheet_names(names)
+        self.sheet_names: list[str] = names
+
+    def _excel(self) -> pd.ExcelFile:
+        if self._xls is None:
+            t0 = time.perf_counter()
+            self._xls   = pd.ExcelFile(self.io, engine=self.engine)
+            self.open_s = time.perf_counter() - t0
+        return self._xls
+
+    def _load(self, sheet: str) -> tuple[pd.DataFrame, str]:
+        if self.snapshots:
+            df = self.snapshots.get(sheet)
+            if df is not None:
+                return df, "snapshot"
+        df = self._excel().parse(sheet)
+        if self.snapshots:
+            self.snapshots.put(sheet, df)
+        return df, f"engine={self.engine or 'default'}"
+
+    def parse(self, sheet: str) -> pd.DataFrame:
+        with self._lock:
+            if sheet in self._errors:
+                raise self._errors[sheet]
+            df = self._frames.get(sheet)
+            if df is None:
+                t0 = time.perf_counter()
+                try:
+                    df, src = self._load(sheet)
+                    self._frames[sheet] = df
+                except Exception as e:
+                    self._errors[sheet] = e
+                    raise
+                finally:
+                    self._parse_s[sheet] = time.perf_counter() - t0
+                SYS_LOG.info(f"解析 Sheet：{sheet}（{df.shape[0]}×{df.shape[1]}，{self._parse_s[sheet]:.3f}s，{src}）")
+        return df
+
+    def preload(self, sheets) -> None:
+        """按 Excel 中的顺序解析给定 Sheet（失败不抛出，留给之后的 parse 报告）。"""
+        wanted = set(sheets)
+        for sheet in self.sheet_names:
+            if sheet in wanted:
+                try:
+                    self.parse(sheet)
+                except Exception:
+                    pass
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "engine":         self.engine or "default",
+                "excel_opened":   self._xls is not None,
+                "sheets_total":   len(self.sheet_names),
+                "sheets_parsed":  len(self._frames),
+                "sheets_failed":  sorted(self._errors),
+                "open_s":         round(self.open_s, 3),
+                "parse_s":        {k: round(v, 3) for k, v in self._parse_s.items()},
+                "snapshot":       self.snapshots.stats() if self.snapshots else {"enabled": False},
+            }
+
+    def close(self):
+        if self._xls is not None:
+            self._xls.close()
+
+def open_workbook(path: Path, engine: str | None = None, snapshot_root: Path | None = None) -> Workbook:
+    try:
+        return Workbook(path, engine, snapshot_root)
+    except Exception as e:
+        # 给出更友好的错误提示
+        raise ValueError(f"无法打开 Excel 文件：{path}（可能已损坏或格式不受支持）。原始错误：{e}") from e
+
+def load_excel_first(input_dir: Path, pattern: str = "*.xls*", engine: str | None = None,
+                     snapshot_root: Path | None = None) -> Workbook:
+    """
+    在 input_dir 中按 pattern 找到第一个 Excel，并返回 Workbook（按需解析 Sheet，接口同 pd.ExcelFile）。
+    snapshot_root：项目根目录；给出时启用 Sheet 快照缓存（<snapshot_root>/.cache/sheets）。
     - 找不到：抛 FileNotFoundError（保持原行为）
     - 多个：记录 system 日志 warning，但仍返回第一个（字典序）
     - 打开失败：抛 ValueError，附带更清晰的错误信息
@@ -72,11 +199,166 @@ def load_excel_first(input_dir: Path, pattern: str = "*.xls*") -> pd.ExcelFile:
         raise FileNotFoundError(f"目录 {input_dir} 下没有找到任何 {pattern} 文件！")
     if len(matches) > 1:
         SYS_LOG.warning(f"发现 {len(matches)} 个 Excel，仅使用第一个：{matches[0].name}")
-    try:
-        return pd.ExcelFile(matches[0])
-    except Exception as e:
-        # 给出更友好的错误提示
-        raise ValueError(f"无法打开 Excel 文件：{matches[0]}（可能已损坏或格式不受支持）。原始错误：{e}") from e
+    return open_workbook(matches[0], engine, snapshot_root)
+
+# ---------------- 多工作簿输入（sheet_tasks.yaml 的 source / sheet） ----------------
+def _excel_files(input_dir: Path, pattern: str) -> list[Path]:
+    # 忽略 Excel 打开文件时生成的 ~$ 锁文件
+    return sorted(p for p in Path(input_dir).glob(pattern) if p.is_file() and not p.name.startswith("~$"))
+
+def uses_sources(sheet_cfg: dict | None) -> bool:
+    if not isinstance(sheet_cfg, dict):
+        return False
+    return any(isinstance(c, dict) and (c.get("source") or c.get("sheet")) for c in (sheet_cfg or {}).values())
+
+class WorkbookSet:
+    """
+    多个工作簿合并成一个 Sheet 命名空间，接口同 Workbook（sheet_names / io / engine / parse / preload / stats / close）。
+    命名空间中的名字是 sheet_tasks.yaml 的任务名（顶层键），抽取结果仍按任务名写入 extracted：
+    - 未写 source 的任务：从主工作簿（input 目录下的第一个，或显式指定的文件）取 Sheet
+    - source: 文件名或通配符（相对 <config_dir>/input）：从匹配的工作簿取 Sheet
+    - sheet: 工作簿中的实际 Sheet 名（缺省 = 任务名）；不同工作簿的同名 Sheet 用不同任务名 + sheet 区分
+    重名规则：source 匹配到多个工作簿且其中不止一个含该 Sheet 时不猜测，记为 error（见 issues，验证器报告并跳过该任务），
+    需要把 source 写到具体文件；主工作簿中与任务名同名的 Sheet 不会顶替指向其它工作簿的任务。
+    只打开被引用的工作簿（并行），只解析被引用的 Sheet。
+    """
+
+    def __init__(self, primary: Workbook | None, books: dict[Path, Workbook], routes: dict[str, tuple[Workbook, str]],
+                 issues: dict[str, tuple[str, str]], sheet_names: list[str]):
+        self.primary     = primary
+        self.books       = books
+        self.routes      = routes            # 任务名 → (工作簿, 实际 Sheet 名)
+        self.issues      = issues            # 任务名 → (level, 说明)
+        self.sheet_names = sheet_names
+        self.io          = primary.io if primary else None
+        self.engine      = primary.engine if primary else None
+
+    @classmethod
+    def open(cls, input_dir: Path, sheet_cfg: dict, pattern: str = "*.xls*", engine: str | None = None,
+             snapshot_root: Path | None = None, excel_path: Path | None = None) -> "WorkbookSet":
+        input_dir = Path(input_dir)
+        tasks = {t: c for t, c in (sheet_cfg or {}).items() if isinstance(c, dict)}
+        primary_path = Path(excel_path) if excel_path else next(iter(_excel_files(input_dir, pattern)), None)
+        matched: dict[str, list[Path]] = {}
+        for task, cfg in tasks.items():
+            src = cfg.get("source")
+            if not src:
+                continue
+            if not isinstance(src, str) or Path(src).is_absolute() or ".." in Path(src).parts:
+                matched[task] = []        # 非法路径不去匹配（验证器另报 CONFIG 错误）
+                continue
+            matched[task] = [p.resolve() for p in _excel_files(input_dir, src)]
+
+        paths = {p.resolve() for ps in matched.values() for p in ps}
+        if primary_path is not None:
+            primary_path = primary_path.resolve()
+            paths.add(primary_path)
+        if not paths:
+            raise FileNotFoundError(f"目录 {input_dir} 下没有找到任何 {pattern} 文件！")
+
+        books: dict[Path, Workbook] = {}
+        failed: dict[Path, Exception] = {}
+        with ContextThreadPoolExecutor(max_workers=max(1, min(EXCEL_LOAD_WORKERS, len(paths)))) as pool:
+            futs = {p: pool.submit(open_workbook, p, engine, snapshot_root) for p in sorted(paths)}
+        for p, fut in futs.items():
+            try:
+                books[p] = fut.result()
+            except Exception as e:
+                failed[p] = e
+        if primary_path in failed:
+            raise failed[primary_path]
+        primary = books.get(primary_path)
+
+        routes: dict[str, tuple[Workbook, str]] = {}
+        issues: dict[str, tuple[str, str]] = {}
+        for task, cfg in tasks.items():
+            sheet = str(cfg.get("sheet") or task)
+            if not cfg.get("source"):
+                if primary is not None and sheet in primary.sheet_names:
+                    routes[task] = (primary, sheet)
+                continue                  # 主工作簿中没有：与单工作簿时一样，由验证器报“不存在”
+            src  = cfg["source"]
+            hits = [p for p in matched[task] if p in books and sheet in books[p].sheet_names]
+            if len(hits) == 1:
+                routes[task] = (books[hits[0]], sheet)
+            elif len(hits) > 1:
+                issues[task] = ("error", f"Sheet {sheet} 同时存在于 {src} 匹配的多个工作簿："
+                                         f"{', '.join(p.name for p in hits)}；请把 source 写到具体文件")
+            elif not matched[task]:
+                issues[task] = ("warning", f"source 没有匹配到任何文件：{src}（将跳过）")
+            else:
+                bad = [f"{p.name}（{failed[p]}）" for p in matched[task] if p in failed]
+                issues[task] = ("warning", f"{src} 匹配的工作簿中没有 Sheet：{sheet}（将跳过）"
+                                           + (f"；打开失败：{'; '.join(bad)}" if bad else ""))
+
+        # 顺序：主工作簿的 Sheet 顺序（指向主工作簿的任务排在其实际 Sheet 的位置），其余任务按 sheet_tasks.yaml 顺序追加
+        claimed = {t for t, c in tasks.items() if c.get("source") or c.get("sheet")}
+        names: list[str] = []
+        for sheet in (primary.sheet_names if primary else []):
+            names += [t for t, (wb, real) in routes.items() if wb is primary and real == sheet and t != sheet]
+            if sheet not in claimed or routes.get(sheet) == (primary, sheet):
+                names.append(sheet)
+        names += [t for t in routes if t not in names]
+
+        other = [p.name for p in books if p != primary_path]
+        if other:
+            SYS_LOG.info(f"多工作簿输入：主工作簿 {primary_path.name if primary_path else '-'}，另有 {', '.join(other)}")
+        return cls(primary, books, routes, issues, names)
+
+    def _route(self, name: str) -> tuple[Workbook, str]:
+        route = self.routes.get(name)
+        if route is not None:
+            return route
+        if self.primary is None or name in self.issues:
+            raise KeyError(f"Worksheet named '{name}' not found")
+        return self.primary, name
+
+    def parse(self, name: str) -> pd.DataFrame:
+        wb, sheet = self._route(name)
+        return wb.parse(sheet)
+
+    def preload(self, names) -> None:
+        """各工作簿之间并行解析（同一工作簿内串行，Workbook 本身按 Sheet 缓存）。"""
+        groups: dict[int, tuple[Workbook, list[str]]] = {}
+        for name in names:
+            try:
+                wb, sheet = self._route(name)
+            except KeyError:
+                continue
+            groups.setdefault(id(wb), (wb, []))[1].append(sheet)
+        if len(groups) <= 1:
+            for wb, sheets in groups.values():
+                wb.preload(sheets)
+            return
+        with ContextThreadPoolExecutor(max_workers=max(1, min(EXCEL_LOAD_WORKERS, len(groups)))) as pool:
+            list(pool.map(lambda g: g[0].preload(g[1]), groups.values()))
+
+    def describe(self) -> dict:
+        """任务名 → "文件名!Sheet"（未能定位的任务不列出）。"""
+        return {t: f"{wb.io.name}!{sheet}" for t, (wb, sheet) in self.routes.items()}
+
+    def stats(self) -> dict:
+        return {
+            "primary":   self.io.name if self.io else None,
+            "sheets":    self.describe(),
+            "workbooks": {wb.io.name: wb.stats() for wb in self.books.values()},
+        }
+
+    def close(self):
+        for wb in self.books.values():
+            wb.close()
+
+def load_inputs(input_dir: Path, sheet_cfg: dict | None, pattern: str = "*.xls*", engine: str | None = None,
+                snapshot_root: Path | None = None, excel_path: Path | None = None) -> Workbook | WorkbookSet:
+    """
+    按 sheet_tasks.yaml 载入输入：没有任务写 source / sheet 时与原来相同（单个工作簿：excel_path 或 input 下第一个），
+    否则返回合并多个工作簿的 WorkbookSet。
+    """
+    if not uses_sources(sheet_cfg):
+        if excel_path:
+            return open_workbook(excel_path, engine, snapshot_root)
+        return load_excel_first(input_dir, pattern, engine, snapshot_root)
+    return WorkbookSet.open(input_dir, sheet_cfg, pattern, engine, snapshot_root, excel_path)
 
 def load_template_exists(config_dir: Path) -> Path:
     """
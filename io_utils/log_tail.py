@@ -0,0 +1,87 @@
+# io_utils/log_tail.py
+"""
+日志文件读取（API 的 /jobs/{id}/logs 用）：不把整个文件读进内存。
+
+- tail_lines：从文件末尾按块倒读，凑够 N 行即停；返回 (文本, 文件末尾偏移)
+- LogFollower：从给定字节偏移持续跟读新写入的完整行；文件被轮转（按天切分）或截断后从新文件开头继续，
+  启动时尚不存在的文件出现后也从开头读
+偏移均为字节偏移且落在行边界上，客户端可用返回的偏移续读。
+"""
+from __future__ import annotations
+from pathlib import Path
+import os
+
+BLOCK = 64 * 1024
+
+def tail_lines(path: Path, lines: int = 200, block: int = BLOCK) -> tuple[str, int]:
+    try:
+        f = open(path, "rb")
+    except FileNotFoundError:
+        return "", 0
+    with f:
+        end = f.seek(0, os.SEEK_END)
+        pos, chunks, newlines = end, [], 0
+        # 末尾的换行不算一行的开始：多读到 lines+1 个换行即可确定最后 lines 行的起点
+        while pos > 0 and newlines <= lines:
+            step = min(block, pos)
+            pos -= step
+            f.seek(pos)
+            chunk = f.read(step)
+            chunks.append(chunk)
+            newlines += chunk.count(b"\n")
+    data = b"".join(reversed(chunks))
+    text = data.decode("utf-8", errors="ignore").splitlines()
+    return "\n".join(text[-lines:]), end
+
+class LogFollower:
+    """从 offset 开始跟读 path；每次 read() 返回新增的完整行（可能为空列表）与新的偏移。"""
+
+    def __init__(self, path: Path, offset: int = -1):
+        self.path   = Path(path)
+        # -1：从当前文件末尾开始；启动时文件还不存在的，出现后从开头读（否则会漏掉开头的几行）
+        self.offset = offset if offset >= 0 or self.path.exists() else 0
+        self._f     = None
+        self._ino   = None
+        self._buf   = b""
+
+    def _open(self) -> bool:
+        try:
+            self._f = open(self.path, "rb")
+        except FileNotFoundError:
+            return False
+        st = os.fstat(self._f.fileno())
+        self._ino = (st.st_dev, st.st_ino)
+        if self.offset < 0 or self.offset > st.st_size:
+            self.offset = st.st_size if self.offset < 0 else 0     # 偏移超出文件：文件已被截断/替换，从头读
+        self._f.seek(self.offset)
+        self._buf = b""
+        return True
+
+    def _rotated(self) -> bool:
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return False
+        return (st.st_dev, st.st_ino) != self._ino or st.st_size < self.offset + len(self._buf)
+
+    def read(self, max_bytes: int = 1024 * 1024) -> tuple[list[str], int]:
+        if self._f is None and not self._open():
+            return [], max(self.offset, 0)
+        data = self._f.read(max_bytes)
+        if not data and self._rotated():
+            # 旧文件已读完且路径指向了新文件：从新文件开头继续
+            self.close()
+            self.offset = 0
+            if not self._open():
+                return [], 0
+            data = self._f.read(max_bytes)
+        data = self._buf + data
+        cut = data.rfind(b"\n") + 1
+        self._buf = data[cut:]
+        self.offset += cut
+        return data[:cut].decode("utf-8", errors="ignore").splitlines(), self.offset
+
+    def close(self):
+        if self._f is not None:
+            self._f.close()
+            self._f = None
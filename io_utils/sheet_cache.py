@@ -0,0 +1,196 @@
+# io_utils/sheet_cache.py
+"""
+解析后 Sheet 的列式快照缓存（Arrow IPC），放在项目目录下：<project_root>/.cache/sheets/
+
+- 目录按工作簿内容哈希划分：<sha256(xlsx)>/meta.json（Sheet 列表）+ <sha256(解析引擎 + sheet 名)>.arrow
+  （不同引擎解析出的类型/空值可能不同，快照按引擎分开）
+- 工作簿内容不变时 validate / run / API 作业都不再打开 Excel；读回时整体转成 DataFrame（会复制一次，不做内存映射）
+- Excel 表头区常见的混合类型 object 列（数字/文本/日期混排）逐单元格带类型标记编码为字符串列，读回时还原原始 Python 类型
+- 写入后立即读回比对，与 Excel 解析结果不完全一致的 Sheet 不落快照，下次仍解析 Excel
+- 只保留最近使用的 SHEET_SNAPSHOT_KEEP 个工作簿版本（默认 8）
+
+pyarrow 为可选依赖：未安装时自动关闭。环境变量 SHEET_SNAPSHOT=0 关闭。
+"""
+from __future__ import annotations
+from pathlib import Path
+import datetime as dt, json, logging, numbers, os, shutil, threading
+
+import numpy as np
+import pandas as pd
+
+from utils.hashing import sha256_text
+
+SYS_LOG = logging.getLogger("system")
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc
+except ImportError:          # 可选依赖
+    pa = None
+
+KEEP = int(os.getenv("SHEET_SNAPSHOT_KEEP", "8"))
+_TAGGED_META = b"report_gen.tagged_columns"
+
+# ---------------- object 列的类型标记编码 ----------------
+def _encode_cell(v) -> str | None:
+    if v is None:
+        return None
+    if isinstance(v, str):
+        return "s" + v
+    if isinstance(v, (bool, np.bool_)):
+        return "b1" if v else "b0"
+    if isinstance(v, numbers.Integral):
+        return "i" + str(int(v))
+    if isinstance(v, float):
+        return "f" + repr(float(v))
+    if isinstance(v, pd.Timestamp):
+        return "T" + v.isoformat()
+    if isinstance(v, dt.datetime):
+        return "t" + v.isoformat()
+    if isinstance(v, dt.date):
+        return "d" + v.isoformat()
+    if isinstance(v, dt.time):
+        return "h" + v.isoformat()
+    raise TypeError(f"不支持的单元格类型：{type(v).__name__}")
+
+_DECODERS = {
+    "s": str,
+    "b": lambda x: x == "1",
+    "i": int,
+    "f": float,
+    "T": pd.Timestamp,
+    "t": dt.datetime.fromisoformat,
+    "d": dt.date.fromisoformat,
+    "h": dt.time.fromisoformat,
+}
+
+def _decode_cell(v: str | None):
+    return None if v is None else _DECODERS[v[0]](v[1:])
+
+def _to_table(df: pd.DataFrame) -> "pa.Table":
+    tagged = [i for i, t in enumerate(df.dtypes) if t == object]
+    if tagged:
+        df = df.copy(deep=False)
+        for i in tagged:
+            df.isetitem(i, pd.Series([_encode_cell(v) for v in df.iloc[:, i]], index=df.index, dtype=object))
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    return table.replace_schema_metadata({**(table.schema.metadata or {}), _TAGGED_META: json.dumps(tagged).encode()})
+
+def _from_table(table: "pa.Table") -> pd.DataFrame:
+    df = table.to_pandas()
+    for i in json.loads((table.schema.metadata or {}).get(_TAGGED_META, b"[]")):
+        df.isetitem(i, pd.Series([_decode_cell(v) for v in df.iloc[:, i]], index=df.index, dtype=object))
+    return df
+
+class SheetSnapshots:
+    """一个工作簿版本（内容哈希）的快照目录；线程安全。"""
+
+    def __init__(self, root: Path, workbook_hash: str, enabled: bool = True, engine: str | None = None):
+        self.root    = Path(root)
+        self.dir     = self.root / workbook_hash
+        self.engine  = engine or "default"
+        self.enabled = enabled and pa is not None
+        self._lock   = threading.Lock()
+        self._counts = {"hits": 0, "misses": 0, "writes": 0, "skipped": 0}
+
+    @classmethod
+    def for_project(cls, root: Path, workbook_hash: str, enabled: bool | None = None,
+                    engine: str | None = None) -> "SheetSnapshots":
+        if enabled is None:
+            enabled = os.getenv("SHEET_SNAPSHOT", "1").strip().lower() not in ("0", "false", "off", "no")
+        return cls(Path(root) / ".cache" / "sheets", workbook_hash, enabled, engine)
+
+    def _path(self, sheet: str) -> Path:
+        key = sha256_text(f"{self.engine}\n{sheet}")
+        return self.dir / f"{key[:32]}.arrow"
+
+    def _count(self, name: str):
+        with self._lock:
+            self._counts[name] += 1
+
+    # ---------- Sheet 列表 ----------
+    def sheet_names(self) -> list[str] | None:
+        if not self.enabled:
+            return None
+        try:
+            names = json.loads((self.dir / "meta.json").read_text(encoding="utf-8"))["sheet_names"]
+        except (OSError, ValueError, KeyError):
+            return None
+        try:
+            os.utime(self.dir)            # 刷新 mtime，淘汰时按最近使用排序
+        except OSError:
+            pass
+        return names
+
+    def put_sheet_names(self, names: list[str]):
+        if not self.enabled:
+            return
+        try:
+            self.dir.mkdir(parents=True, exist_ok=True)
+            self._write_atomic(self.dir / "meta.json",
+                               json.dumps({"sheet_names": list(names)}, ensure_ascii=False).encode("utf-8"))
+            self._prune()
+        except OSError as e:
+            SYS_LOG.warning(f"Sheet 快照目录写入失败：{self.dir}：{e}")
+
+    # ---------- 读 / 写 ----------
+    def get(self, sheet: str) -> pd.DataFrame | None:
+        if not self.enabled:
+            return None
+        path = self._path(sheet)
+        if not path.exists():
+            self._count("misses")
+            return None
+        try:
+            with pa.OSFile(str(path), "rb") as src:
+                df = _from_table(pa.ipc.open_file(src).read_all())
+        except Exception as e:
+            SYS_LOG.warning(f"Sheet 快照读取失败，改为解析 Excel：{sheet}：{e}")
+            self._count("misses")
+            return None
+        self._count("hits")
+        return df
+
+    def put(self, sheet: str, df: pd.DataFrame):
+        if not self.enabled:
+            return
+        path = self._path(sheet)
+        try:
+            table = _to_table(df)
+            sink  = pa.BufferOutputStream()
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+            buf = sink.getvalue()
+            back = _from_table(pa.ipc.open_file(buf).read_all())
+            if not (back.shape == df.shape and list(back.columns) == list(df.columns) and back.equals(df)):
+                raise ValueError("读回结果与原表不一致")
+        except Exception as e:
+            SYS_LOG.info(f"Sheet 不适合列式快照，保持每次解析 Excel：{sheet}：{type(e).__name__}: {e}")
+            self._count("skipped")
+            return
+        try:
+            self.dir.mkdir(parents=True, exist_ok=True)
+            self._write_atomic(path, buf.to_pybytes())
+            self._count("writes")
+        except OSError as e:
+            SYS_LOG.warning(f"Sheet 快照写入失败：{sheet}：{e}")
+
+    @staticmethod
+    def _write_atomic(path: Path, data: bytes):
+        tmp = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        tmp.write_bytes(data)
+        os.replace(tmp, path)
+
+    def _prune(self):
+        """按目录 mtime 只保留最近使用的 KEEP 个工作簿版本。"""
+        try:
+            dirs = sorted((d for d in self.root.iterdir() if d.is_dir()), key=lambda d: d.stat().st_mtime, reverse=True)
+        except OSError:
+            return
+        for d in dirs[max(1, KEEP):]:
+            if d != self.dir:
+                shutil.rmtree(d, ignore_errors=True)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"enabled": self.enabled, **self._counts}
@@ -0,0 +1,172 @@
+# io_utils/template_pool.py
+"""
+进程级 Word 模板池：按模板内容哈希缓存解析后的模板状态，渲染时发放互不影响的副本。
+
+每个模板版本缓存：
+- 解析好的 python-docx Document（母本，只读）；每次渲染 deepcopy 一份，省去解压 + 逐部件解析 XML
+- docxtpl 预处理（patch_xml）后的 XML，以及编译好的 Jinja 模板（按渲染环境区分：默认 / StrictUndefined）
+
+容量按字节计（模板文件大小 + 缓存的 XML 文本），超过 TEMPLATE_POOL_MB（默认 256）时按 LRU 淘汰；
+模板文件修改后（大小/mtime 变化且内容哈希变化）自动换新版本。TEMPLATE_POOL=0 关闭（每次重新读取、解析模板，不入池）。
+"""
+from __future__ import annotations
+from collections import OrderedDict
+from pathlib import Path
+import copy, hashlib, io, logging, os, threading
+
+from docx import Document
+from docxtpl import DocxTemplate
+from jinja2 import Environment, StrictUndefined
+
+from utils.hashing import sha256_file
+
+SYS_LOG = logging.getLogger("system")
+
+ENABLED   = os.getenv("TEMPLATE_POOL", "1").strip().lower() not in ("0", "false", "off", "no")
+MAX_BYTES = int(float(os.getenv("TEMPLATE_POOL_MB", "256")) * 1024 * 1024)
+
+def _digest(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+class _CachingEnvironment(Environment):
+    """from_string 按源码缓存编译结果；docxtpl 渲染每个部件时都会调用 from_string。"""
+
+    def __init__(self, entry: "_Entry", **options):
+        super().__init__(**options)
+        self._entry    = entry
+        self._compiled: dict[str, object] = {}
+        self._clock    = threading.Lock()
+
+    def from_string(self, source, globals=None, template_class=None):
+        if globals or template_class or not isinstance(source, str):
+            return super().from_string(source, globals, template_class)
+        key = _digest(source)
+        with self._clock:
+            tpl = self._compiled.get(key)
+        if tpl is None:
+            tpl = super().from_string(source)
+            with self._clock:
+                if key not in self._compiled:
+                    self._compiled[key] = tpl
+                    self._entry.grow(len(source))
+        return tpl
+
+class _Entry:
+    def __init__(self, pool: "TemplatePool | None", key: str, data: bytes):
+        self.pool    = pool          # None：不入池的一次性条目（TEMPLATE_POOL=0）
+        self.key     = key
+        self.data    = data
+        self.master  = Document(io.BytesIO(data))
+        self.nbytes  = len(data)
+        self.patched: dict[str, str] = {}
+        self.envs    = {
+            "default": _CachingEnvironment(self),
+            "strict":  _CachingEnvironment(self, undefined=StrictUndefined, autoescape=False),
+        }
+        self.lock    = threading.Lock()
+
+    def grow(self, n: int):
+        with self.lock:
+            self.nbytes += n
+        if self.pool is not None:
+            self.pool._account(self, n)
+
+class PooledTemplate(DocxTemplate):
+    """DocxTemplate：Document 来自母本副本，patch_xml 结果按源码复用。render 缺省使用池中对应的 Jinja 环境。"""
+
+    def __init__(self, entry: _Entry, strict: bool = False):
+        super().__init__(io.BytesIO(entry.data))
+        self._entry = entry
+        self._env   = entry.envs["strict" if strict else "default"]
+        self.docx   = copy.deepcopy(entry.master)
+
+    def patch_xml(self, src_xml):
+        key = _digest(src_xml)
+        with self._entry.lock:
+            out = self._entry.patched.get(key)
+        if out is None:
+            out = super().patch_xml(src_xml)
+            with self._entry.lock:
+                fresh = key not in self._entry.patched
+                self._entry.patched[key] = out
+            if fresh:
+                self._entry.grow(len(out))
+        return out
+
+    def render(self, context, jinja_env=None, autoescape=False):
+        # autoescape=True 时 docxtpl 会改写传入环境的 autoescape，不能用共享环境
+        if jinja_env is None and not autoescape:
+            jinja_env = self._env
+        return super().render(context, jinja_env, autoescape)
+
+class TemplatePool:
+    def __init__(self, max_bytes: int = MAX_BYTES, enabled: bool = ENABLED):
+        self.max_bytes = max_bytes
+        self.enabled   = enabled
+        self._lock     = threading.Lock()
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._hashes: dict[Path, tuple[tuple[int, int], str]] = {}   # 路径 → ((大小, mtime), 内容哈希)
+        self._bytes    = 0
+        self._counts   = {"hits": 0, "loads": 0, "evicted": 0}
+
+    def _hash(self, path: Path) -> str:
+        st  = path.stat()
+        sig = (st.st_size, st.st_mtime_ns)
+        with self._lock:
+            known = self._hashes.get(path)
+        if known and known[0] == sig:
+            return known[1]
+        h = sha256_file(path)
+        with self._lock:
+            self._hashes[path] = (sig, h)
+        return h
+
+    def _account(self, entry: _Entry, n: int):
+        with self._lock:
+            if self._entries.get(entry.key) is entry:     # 已被淘汰的条目不再计入
+                self._bytes += n
+                self._evict()
+
+    def _evict(self):
+        # 调用方持有 self._lock；最近使用的那个即使超限也保留
+        while self._bytes > self.max_bytes and len(self._entries) > 1:
+            _, old = self._entries.popitem(last=False)
+            self._bytes -= old.nbytes
+            self._counts["evicted"] += 1
+
+    def get(self, path: Path, strict: bool = False) -> DocxTemplate:
+        """返回可直接 render/save 的模板对象；strict=True 时缺省用 StrictUndefined 环境渲染（验证模拟渲染用）。"""
+        path = Path(path).resolve()
+        if not self.enabled:
+            return PooledTemplate(_Entry(None, "", path.read_bytes()), strict)
+        key = self._hash(path)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self._counts["hits"] += 1
+        if entry is None:
+            entry = _Entry(self, key, path.read_bytes())
+            with self._lock:
+                if key in self._entries:          # 并发加载：用先到的那个
+                    entry = self._entries[key]
+                else:
+                    self._entries[key] = entry
+                    self._bytes += entry.nbytes
+                    self._counts["loads"] += 1
+                    self._evict()
+            SYS_LOG.info(f"模板载入模板池：{path.name}（{entry.nbytes / 1024:.0f} KB）")
+        return PooledTemplate(entry, strict)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"enabled": self.enabled, "templates": len(self._entries),
+                    "bytes": self._bytes, "max_bytes": self.max_bytes, **self._counts}
+
+_POOL = TemplatePool()
+
+def get_template(path: Path, strict: bool = False) -> DocxTemplate:
+    return _POOL.get(path, strict)
+
+def template_pool_stats() -> dict:
+    return _POOL.stats()
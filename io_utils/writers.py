@@ -1,10 +1,11 @@
 # io/writers.py
 from __future__ import annotations
 from pathlib import Path
-from docxtpl import DocxTemplate
+from io_utils.template_pool import get_template
 
 def write_docx(config_dir: Path, report_name: str, render_ctx: dict):
-    tpl = DocxTemplate(config_dir / "template" / "report_template.docx")
+    # 模板池：同一模板（按内容哈希）只解析一次，这里拿到的是独立副本
+    tpl = get_template(config_dir / "template" / "report_template.docx")
     tpl.render(render_ctx)
     out_dir = config_dir / "output"
     out_dir.mkdir(parents=True, exist_ok=True)
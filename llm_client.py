@@ -1,30 +1,294 @@
 # llm_client.py
-import os, yaml, openai
+"""
+LLM provider 注册表。
+
+- llm.yaml 解析结果按 (文件路径, mtime) 缓存：同一文件不重复解析，文件修改后自动重新加载
+- client 按 (llm.yaml 路径, provider) 缓存：不同项目的同名 provider 互不共用；配置变化时重建
+- 同一 provider 的所有调用共用一个 HTTP 连接池（keep-alive），池大小/超时取自 llm.yaml 的 http 段
+- apply_provider → openai.OpenAI（线程安全，多线程共用）
+- set_global_gate：可选的跨进程在途请求上限（批量模式多个 worker 进程共用，见 batch_runner.py）
+
+llm.yaml 中每个 provider 可选：
+    max_in_flight: 4          # 初始并发上限（缺省 LLM_MAX_IN_FLIGHT，默认 4），之后按 AIMD 自适应调整
+    adaptive: {...}           # 自适应并发参数，见 core/adaptive.py；false 为固定上限
+    http:
+      timeout: 120            # 单次请求总超时（秒）
+      connect_timeout: 10     # 建连超时（秒）
+      max_connections: 8      # 连接池上限（缺省取 max_in_flight）
+      max_keepalive: 8        # 保持空闲的长连接数（缺省同 max_connections）
+      keepalive_expiry: 30    # 空闲长连接保留时长（秒）
+      max_retries: 0          # SDK 内置重试次数（默认 0：重试由 retry 段统一控制，见 core/retry.py）
+    retry: {...}              # 重试/对冲策略，见 core/retry.py
+    rpm: 600                  # 每个 endpoint 每分钟请求数上限（客户端令牌桶，缺省不限）
+    tpm: 1000000              # 每个 endpoint 每分钟 token 数上限（按 Prompt 估算预留、按 usage 修正）
+    endpoints:                # 多 key / 多地址（可选）；每项继承上面的字段，可单独覆盖
+      - key_env: DASHSCOPE_API_KEY
+      - key_env: DASHSCOPE_API_KEY_2
+        base_url: https://...
+        rpm: 300
+"""
+from __future__ import annotations
+import os, threading, time, yaml, httpx, openai
+from dataclasses import dataclass, field
 from pathlib import Path
 
-# provider → (client, model_name)
-_clients: dict[str, tuple[openai.OpenAI, str]] = {}
+from core.retry import RetryPolicy, LatencyWindow, call_with_retry, retry_after, status_code
+from core.rate_limit import TokenBucket, RateLimitedPool
+from core.adaptive import AdaptiveLimiter
+
+DEFAULT_MAX_IN_FLIGHT = int(os.getenv("LLM_MAX_IN_FLIGHT", "4"))
+
+_HTTP_DEFAULTS = {
+    "timeout":          120.0,
+    "connect_timeout":  10.0,
+    "keepalive_expiry": 30.0,
+    "max_retries":      0,
+}
+
+# endpoint 级字段；provider 顶层的同名字段作为各 endpoint 的缺省值
+_ENDPOINT_KEYS = ("key_env", "base_url", "extra", "http", "max_in_flight", "rpm", "tpm")
+
+@dataclass
+class Endpoint:
+    name:    str                                  # "<provider>#<序号>"，日志/记录用，不含密钥
+    cfg:     dict                                 # 合并了 provider 缺省值的 endpoint 配置
+    rpm:     TokenBucket
+    tpm:     TokenBucket
+    client:  openai.OpenAI | None = None
+    blocked_until: float = 0.0
+
+@dataclass
+class ProviderEntry:
+    name:       str
+    model_name: str
+    cfg:        dict                              # 构建时的 provider 配置（用于判断是否需要重建）
+    endpoints:  list[Endpoint]
+    pool:       RateLimitedPool
+    limiter:    AdaptiveLimiter
+    path:       Path | None = None                # 所属 llm.yaml（/healthz 展示用）
+    latency:    LatencyWindow = field(default_factory=LatencyWindow)
+
+    @property
+    def policy(self) -> RetryPolicy:
+        return RetryPolicy.from_cfg(self.cfg.get("retry"))
+
+# llm.yaml 路径 → (mtime_ns, 解析结果)
+_configs: dict[Path, tuple[int, dict]] = {}
+# (llm.yaml 路径, provider) → ProviderEntry
+_registry: dict[tuple[Path, str], ProviderEntry] = {}
+# (base_url, key_env) → (RPM 桶, TPM 桶)：同一个 key 的额度在所有项目间共享
+_buckets: dict[tuple, tuple[TokenBucket, TokenBucket]] = {}
+# 跨进程的全局并发闸门（multiprocessing 信号量）；批量模式下由父进程创建，经进程池 initializer 传入各 worker
+_global_gate = None
+_lock = threading.RLock()
+
+def _cfg_path(config_dir: Path) -> Path:
+    return (Path(config_dir) / "business_configs" / "llm.yaml").resolve()
+
+def load_llm_config(config_dir: Path) -> dict:
+    """解析 llm.yaml；按 (路径, mtime) 缓存，文件未变化时直接返回上次结果。"""
+    path  = _cfg_path(config_dir)
+    mtime = path.stat().st_mtime_ns
+    with _lock:
+        hit = _configs.get(path)
+        if hit and hit[0] == mtime:
+            return hit[1]
+    cfg = yaml.safe_load(path.read_text(encoding="utf-8")) or {}
+    with _lock:
+        _configs[path] = (mtime, cfg)
+    return cfg
+
+def _entry(name: str, config_dir: Path) -> ProviderEntry:
+    path = _cfg_path(config_dir)
+    all_cfg = load_llm_config(config_dir)
+    if name not in all_cfg:
+        raise KeyError(f"provider {name!r} not in {path}")
+    cfg = all_cfg[name]
+    with _lock:
+        ent = _registry.get((path, name))
+        if ent is not None and ent.cfg == cfg:
+            return ent
+        if ent is not None:
+            _close(ent)
+        endpoints = _build_endpoints(name, cfg)
+        initial = sum(_max_in_flight(ep.cfg) for ep in endpoints)
+        ent = _registry[(path, name)] = ProviderEntry(
+            name=name, model_name=cfg["model_name"], cfg=cfg,
+            endpoints=endpoints, pool=RateLimitedPool(endpoints, name=name),
+            limiter=AdaptiveLimiter.from_cfg(initial, cfg.get("adaptive"), name=name), path=path,
+        )
+        return ent
+
+def _build_endpoints(name: str, cfg: dict) -> list[Endpoint]:
+    base  = {k: cfg[k] for k in _ENDPOINT_KEYS if k in cfg}
+    specs = cfg.get("endpoints") or [{}]
+    out = []
+    for i, spec in enumerate(specs):
+        ep_cfg = {**base, **(spec or {})}
+        if "key_env" not in ep_cfg:
+            raise KeyError(f"provider {name!r} endpoint #{i} missing key_env")
+        bkey = (ep_cfg.get("base_url"), ep_cfg["key_env"])
+        rpm, tpm = ep_cfg.get("rpm"), ep_cfg.get("tpm")
+        with _lock:
+            buckets = _buckets.get(bkey)
+            if buckets is None or (buckets[0].per_minute, buckets[1].per_minute) != (float(rpm or 0), float(tpm or 0)):
+                buckets = _buckets[bkey] = (TokenBucket(rpm), TokenBucket(tpm))
+        out.append(Endpoint(name=f"{name}#{i}", cfg=ep_cfg, rpm=buckets[0], tpm=buckets[1]))
+    return out
+
+def _max_in_flight(cfg: dict) -> int:
+    return max(1, int(cfg.get("max_in_flight", DEFAULT_MAX_IN_FLIGHT)))
+
+def _http_options(cfg: dict) -> tuple[httpx.Limits, httpx.Timeout, int]:
+    http  = {**_HTTP_DEFAULTS, **(cfg.get("http") or {})}
+    conns = int(http.get("max_connections") or _max_in_flight(cfg))
+    limits = httpx.Limits(
+        max_connections           = conns,
+        max_keepalive_connections = int(http.get("max_keepalive") or conns),
+        keepalive_expiry          = float(http["keepalive_expiry"]),
+    )
+    timeout = httpx.Timeout(float(http["timeout"]), connect=float(http["connect_timeout"]))
+    return limits, timeout, int(http["max_retries"])
+
+def _client_kwargs(cfg: dict) -> dict:
+    return {
+        "api_key":  os.getenv(cfg["key_env"], ""),
+        "base_url": cfg.get("base_url"),
+        **(cfg.get("extra") or {}),
+    }
+
+def _close(ent: ProviderEntry):
+    """配置变化时关闭旧的连接池。"""
+    for ep in ent.endpoints:
+        if ep.client is not None:
+            try:
+                ep.client.close()
+            except Exception:
+                pass
+
+def _client(ent: ProviderEntry, ep: Endpoint) -> openai.OpenAI:
+    with _lock:
+        if ep.client is None:
+            limits, timeout, retries = _http_options(ep.cfg)
+            ep.client = openai.OpenAI(
+                http_client = httpx.Client(limits=limits, timeout=timeout),
+                timeout     = timeout,
+                max_retries = retries,
+                **_client_kwargs(ep.cfg),
+            )
+            print(f"✓ LLM provider loaded: {ep.name} ({ent.model_name})")
+        return ep.client
 
 def apply_provider(name: str = "openai", config_dir: Path = Path("")) -> tuple[openai.OpenAI, str]:
-    _CFG = yaml.safe_load((config_dir / "business_configs" / "llm.yaml").read_text(encoding="utf-8"))
     """
     返回 (client, model_name) 供调用。
-    - client  已按 base_url / key / extra 初始化
+    - client  已按 base_url / key / extra 初始化，共享带 keep-alive 的连接池，线程安全
+      （配置了多个 endpoints 时为第一个；经 invoke() 发出的调用会在各 endpoint 间按额度分配）
     - model_name  从 llm.yaml 读
-    结果会缓存在 _clients，重复调用不再重新建连接。
+    结果按 (llm.yaml, provider) 缓存，重复调用不再重新解析配置、重新建连接。
+    """
+    ent = _entry(name, config_dir)
+    return _client(ent, ent.endpoints[0]), ent.model_name
+
+def provider_limiter(name: str, config_dir: Path = Path("")) -> AdaptiveLimiter:
     """
-    if name in _clients:
-        return _clients[name]
+    返回 provider 的自适应并发限制器。
+    - 初始上限取 llm.yaml 中该 provider 的 max_in_flight（多个 endpoints 时为各 endpoint 之和），缺省 LLM_MAX_IN_FLIGHT（默认 4）
+    - 只包住真正的网络调用，外层线程池不占槽位，避免嵌套调用时互相等待
+    """
+    return _entry(name, config_dir).limiter
+
+def provider_model(name: str, config_dir: Path = Path("")) -> str:
+    return _entry(name, config_dir).model_name
+
+def provider_health(name: str, config_dir: Path = Path("")) -> dict:
+    """provider 的滚动健康度（p50/p95 延迟、错误率、当前并发上限），路由用；未配置的 provider 视为不可用。"""
+    try:
+        return _entry(name, config_dir).limiter.stats()
+    except KeyError:
+        return {"error_rate": 1.0}
+
+def limiter_stats() -> list[dict]:
+    """各 provider 当前并发上限、在途数、近期延迟与错误率（/healthz 展示）。"""
+    with _lock:
+        entries = list(_registry.values())
+    return [{"provider": ent.name, "config": str(ent.path) if ent.path else None, **ent.limiter.stats()}
+            for ent in entries]
 
-    if name not in _CFG:
-        raise KeyError(f"provider {name!r} not in {config_dir.name}/configs/llm.yaml")
+# ---------------- 统一调用入口：限流 + 自适应并发 + 重试/对冲 + 调用记录 ----------------
+def _record(on_call, kind: str, label: str, ent: ProviderEntry, info, used: list[str], waited: list[float]):
+    if on_call is None or info is None:
+        return
+    rec = {"kind": kind, "label": label, "provider": ent.name, "model": ent.model_name, **info.as_dict()}
+    if len(ent.endpoints) > 1 and used:
+        rec["endpoint"] = used[-1]
+    if sum(waited) >= 0.01:
+        rec["rate_wait_s"] = round(sum(waited), 3)      # 等待 RPM/TPM 额度的累计时间
+    on_call(rec)
+
+def _usage_tokens(result) -> int | None:
+    usage = getattr(result, "usage", None)
+    return getattr(usage, "total_tokens", None) if usage is not None else None
+
+def set_global_gate(sem):
+    """设置跨进程共享的在途请求上限（None 取消）；每次尝试在占用 provider 槽位后再占用一个全局名额。"""
+    global _global_gate
+    _global_gate = sem
+
+def _gate_acquire():
+    gate = _global_gate
+    if gate is not None:
+        gate.acquire()
+    return gate
+
+def _gate_release(gate):
+    if gate is not None:
+        gate.release()
+
+def _on_error(ent: ProviderEntry, ep: Endpoint, e: Exception):
+    if status_code(e) == 429:
+        ent.pool.penalize(ep, retry_after(e) or 1.0)
+
+def invoke(name: str, config_dir: Path, fn, kind: str = "", label: str = "", on_call=None,
+           hedge: bool = True, can_retry=None, tokens: int = 0, on_ready=None):
+    """
+    执行一次逻辑 LLM 调用：fn(client) 发出真正的请求（每次尝试都重新调用，client 为本次分到的 endpoint）。
+    - 每次尝试先按 RPM/TPM 令牌桶等待额度（tokens 为 Prompt 估算 token 数），再占用自适应并发槽位
+    - 按 llm.yaml 的 retry 段重试/对冲；429 的 endpoint 会被冷却，重试自动换到其它 endpoint
+    on_call：可选回调，调用结束（成功或最终失败）时收到一条调用记录（dict）。
+    on_ready：可选回调，每次尝试占到槽位、发出请求前调用（路由据此开始 failover 计时）。
+    """
+    ent  = _entry(name, config_dir)
+    limiter = ent.limiter
+    used: list[str] = []
+    waited: list[float] = []
 
-    cfg       = _CFG[name]
-    api_key   = os.getenv(cfg["key_env"], "")
-    base_url  = cfg.get("base_url")
-    extra     = cfg.get("extra", {})
+    def _attempt(ready):
+        t0 = time.monotonic()
+        ep = ent.pool.acquire(tokens, label)
+        waited.append(time.monotonic() - t0)
+        used.append(ep.name)
+        token = limiter.acquire()
+        gate = _gate_acquire()
+        try:
+            ready()          # 槽位已就绪：对冲计时与延迟统计从这里开始
+            if on_ready is not None:
+                on_ready()
+            result = fn(_client(ent, ep))
+        except Exception as e:
+            limiter.release(token, e)
+            _on_error(ent, ep, e)
+            raise
+        finally:
+            _gate_release(gate)
+        limiter.release(token)
+        ent.pool.settle(ep, tokens, _usage_tokens(result))
+        return result
 
-    client = openai.OpenAI(api_key=api_key, base_url=base_url, **extra)
-    _clients[name] = (client, cfg["model_name"])
-    print(f"✓ LLM provider loaded: {name} ({cfg['model_name']})")
-    return _clients[name]
+    try:
+        result, info = call_with_retry(_attempt, ent.policy, ent.latency, label, hedge, can_retry)
+    except Exception as e:
+        _record(on_call, kind, label, ent, getattr(e, "call_info", None), used, waited)
+        raise
+    _record(on_call, kind, label, ent, info, used, waited)
+    return result
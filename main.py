@@ -26,6 +26,17 @@ def parse_args():
     ap_run.add_argument("-c", "--config", default="configs", help="配置目录")
     ap_run.add_argument("-n", "--name", default="生成报告文件", help="输出报告名称（不含扩展名）")
     ap_run.add_argument("--logs", default=None, help="日志输出目录（默认 <config_dir>/../logs）")
+    ap_run.add_argument("--full", action="store_true", help="全量重跑：不复用上次运行的抽取/生成结果")
+
+    # batch 子命令：多个 Excel → 多份报告
+    ap_bat = sub.add_parser("batch", help="批量运行：每个 Excel 生成一份报告，多进程并行")
+    ap_bat.add_argument("-c", "--config", default="configs", help="配置目录")
+    ap_bat.add_argument("-i", "--input", default=None, help="Excel 目录/文件/通配符（默认 <config_dir>/input）")
+    ap_bat.add_argument("-w", "--workers", type=int, default=None, help="worker 进程数（默认 BATCH_WORKERS 或 min(4, CPU 数)）")
+    ap_bat.add_argument("--llm-limit", type=int, default=None, help="所有 worker 合计的 LLM 在途请求上限（默认 BATCH_LLM_LIMIT=8；0 不限）")
+    ap_bat.add_argument("--out", default=None, help="各工作簿的工作目录（默认 <config_dir>/../batch）")
+    ap_bat.add_argument("--logs", default=None, help="日志输出目录（默认 <config_dir>/../logs）")
+    ap_bat.add_argument("--full", action="store_true", help="全量重跑：不复用上次运行的抽取/生成结果")
 
     # 向后兼容：未给子命令时默认 run
     ap.add_argument("-C", "--compat-config", dest="compat_config", default=None, help=argparse.SUPPRESS)
@@ -59,6 +70,22 @@ def main():
         )
         sys.exit(code)
 
+    if args.cmd == "batch":
+        config_dir = Path(args.config).resolve()
+        logs_dir = Path(args.logs).resolve() if args.logs else (config_dir.parent / "logs").resolve()
+        setup_logging(logs_dir)
+        root = logs_dir.parent
+
+        from batch_runner import discover_workbooks, run_batch
+        inputs = discover_workbooks(args.input or (config_dir / "input"))
+        if not inputs:
+            logging.getLogger("system").error(f"没有找到 Excel：{args.input or (config_dir / 'input')}")
+            sys.exit(2)
+        summary = run_batch(config_dir, inputs, root=root, batch_root=Path(args.out).resolve() if args.out else None,
+                            workers=args.workers, llm_limit=args.llm_limit,
+                            incremental=False if args.full else None)
+        sys.exit(1 if summary["failed"] else 0)
+
     # 正常 run 子命令
     if args.cmd == "run" or args.cmd is None:
         config_dir = Path(getattr(args, "config", "configs")).resolve()
@@ -73,7 +100,8 @@ def main():
 
         # 跑流水线（确保内部使用 root 来定位日志）
         from orchestrator import run_pipeline
-        run_pipeline(config_dir=config_dir, report_name=getattr(args, "name", "生成报告文件"), root=root, logs_dir=logs_dir)
+        run_pipeline(config_dir=config_dir, report_name=getattr(args, "name", "生成报告文件"), root=root, logs_dir=logs_dir,
+                     incremental=False if getattr(args, "full", False) else None)
     else:
         logging.getLogger("system").error(f"未知命令：{args.cmd}")
         sys.exit(2)
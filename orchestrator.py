@@ -1,16 +1,21 @@
 # orchestrator.py
 from __future__ import annotations
 from pathlib import Path
-import logging, json, traceback
+import logging, json, os, traceback
 import pandas as pd
 
 from core.error_collector import ErrorCollector
-from core.logging_setup import setup_logging
-from io_utils.loaders import load_yaml, load_excel_first, load_template_exists
+from core.llm_cache import LLMCache
+from core.prompts import prompt_cache_stats
+from core.run_state import RunState
+from core.stages import StageTimer
+from core.logging_setup import job_logs
+from io_utils.loaders import load_yaml, load_inputs, load_template_exists
 from io_utils.writers import write_docx, write_json
 from services.planner import quick_plan_from_validation
 from services.extractor_service import run_extraction
 from services.generator_service import run_generation_and_fill
+from services.scheduler import run_pipelined
 from services.renderer_service import render_word
 from validator.validate import validate_configs  # 用于 quick validate
 
@@ -18,39 +23,100 @@ SYS_LOG  = logging.getLogger("system")
 USER_LOG = logging.getLogger("user")
 CFG_LOG  = logging.getLogger("config")
 
-def run_pipeline(config_dir: Path, report_name: str, root: Path, logs_dir: Path | None = None):
-    setup_logging(logs_dir or (config_dir.parent / "logs"))
+# dag：按段落依赖把抽取与生成流水线化（默认）；barrier：先全部抽取再逐段生成
+PIPELINE_SCHEDULER = os.getenv("PIPELINE_SCHEDULER", "dag").strip().lower()
+
+def run_pipeline(config_dir: Path, report_name: str, root: Path, logs_dir: Path | None = None, on_event=None,
+                 incremental: bool | None = None, excel_path: Path | None = None, stream=None) -> dict:
+    """
+    on_event：可选回调（API 的 SSE 推送用），推送
+    stage / paragraph_start / token / paragraph_done / paragraph_error 事件。
+    stream：段落是否流式生成（bool 或无参函数，每段开始时判断）；缺省为传入 on_event 即流式。
+    非流式生成可对冲、可超时并行切换 provider，流式只在失败时顺序切换。
+    incremental：是否复用上次运行中输入未变化的抽取/生成结果（缺省读 INCREMENTAL，默认开启）。
+    excel_path：指定主工作簿（批量模式用）；缺省读取 <config_dir>/input 下的第一个。
+    sheet_tasks.yaml 中写了 source / sheet 的任务从其它工作簿取 Sheet（见 io_utils/loaders.py 的 WorkbookSet）。
+    返回运行摘要（同 run_summary.json）。
+    日志只在本次运行的上下文中写到 logs_dir（缺省 <config_dir>/../logs），并发运行互不干扰（见 core/logging_setup.py）。
+    """
+    with job_logs(logs_dir or (config_dir.parent / "logs")):
+        return _run_pipeline(config_dir, report_name, root, on_event, incremental, excel_path, stream)
+
+def _run_pipeline(config_dir: Path, report_name: str, root: Path, on_event, incremental: bool | None,
+                  excel_path: Path | None, stream=None) -> dict:
+    emit = on_event or (lambda ev: None)
     ec = ErrorCollector()
+    cache = LLMCache.from_env()
+    prompt_stats0 = prompt_cache_stats()
+    state = RunState.for_project(root, incremental)
+    timer = StageTimer()
 
-    # 1) 加载配置 & Excel
+    # 1) 加载配置 & Excel（只读取 Sheet 列表，Sheet 内容按需解析）
     try:
-        sheet_cfg   = load_yaml(config_dir / "business_configs" / "sheet_tasks.yaml")
-        para_cfg    = load_yaml(config_dir / "business_configs" / "paragraph_tasks.yaml")
-        xls         = load_excel_first(config_dir / "input")
-        SYS_LOG.info(f"载入配置：sheet={len(sheet_cfg)}，paragraphs={len(para_cfg)}；Excel={xls.io}")
+        with timer.stage("load"):
+            sheet_cfg   = load_yaml(config_dir / "business_configs" / "sheet_tasks.yaml")
+            para_cfg    = load_yaml(config_dir / "business_configs" / "paragraph_tasks.yaml")
+            xls         = load_inputs(config_dir / "input", sheet_cfg, snapshot_root=root, excel_path=excel_path)
+        SYS_LOG.info(f"载入配置：sheet={len(sheet_cfg)}，paragraphs={len(para_cfg)}；Excel={xls.io}（engine={xls.engine or 'default'}）")
     except Exception as e:
         ec.add("error", "LOAD", f"加载配置/Excel失败：{e}", traceback.format_exc())
         ec.dump(root); raise
 
-    # 2) 轻量验证（不阻断，仅返回 planned_skips）
-    v_report = validate_configs(config_dir, xls, simulate_render=False)
-    plan     = quick_plan_from_validation(v_report)
-    USER_LOG.info(f"计划执行：sheets={len(plan['sheets_exec'])} / paragraphs={len(plan['paras_exec'])}（其余跳过）")
+    try:
+        # 2) 轻量验证（不阻断，仅返回 planned_skips）
+        with timer.stage("validate"):
+            v_report = validate_configs(config_dir, xls, simulate_render=False)
+            plan     = quick_plan_from_validation(v_report)
+        USER_LOG.info(f"计划执行：sheets={len(plan['sheets_exec'])} / paragraphs={len(plan['paras_exec'])}（其余跳过）")
+
+        # 只解析 sheet_tasks.yaml 中配置且未被跳过的 Sheet；之后的抽取直接取缓存
+        with timer.stage("parse"):
+            xls.preload(s for s in (sheet_cfg or {}) if s not in plan["sheets_skip"])
 
-    # 3) 抽取（嵌套 dict）
-    extracted = run_extraction(xls, sheet_cfg, plan, ec, config_dir)
+        if PIPELINE_SCHEDULER == "barrier":
+            # 3) 抽取（嵌套 dict）
+            emit({"type": "stage", "stage": "extract"})
+            with timer.stage("extract"):
+                extracted = run_extraction(xls, sheet_cfg, plan, ec, config_dir, cache=cache, state=state)
 
-    # 4) 生成/直填
-    gen_ctx   = run_generation_and_fill(para_cfg, extracted, plan, ec, config_dir)
+            # 4) 生成/直填
+            emit({"type": "stage", "stage": "generate"})
+            with timer.stage("generate"):
+                gen_ctx   = run_generation_and_fill(para_cfg, extracted, plan, ec, config_dir, cache=cache,
+                                                    on_event=on_event, state=state, stream=stream)
+        else:
+            # 3+4) 抽取与生成按依赖流水线执行
+            emit({"type": "stage", "stage": "extract+generate"})
+            with timer.stage("extract+generate"):
+                extracted, gen_ctx = run_pipelined(xls, sheet_cfg, para_cfg, plan, ec, config_dir, cache=cache,
+                                                   on_event=on_event, state=state, stream=stream)
 
-    # 5) 渲染
-    try:
-        render_word(config_dir, report_name, extracted, gen_ctx)
-    except Exception as e:
-        ec.add("error", "RENDER", f"渲染失败：{e}", traceback.format_exc())
+        # 5) 渲染
+        emit({"type": "stage", "stage": "render"})
+        with timer.stage("render"):
+            try:
+                render_word(config_dir, report_name, extracted, gen_ctx)
+            except Exception as e:
+                ec.add("error", "RENDER", f"渲染失败：{e}", traceback.format_exc())
 
-    # 6) 摘要
-    ec.dump(root)
-    sums = ec.summary()["counts"]
-    SYS_LOG.info(f"Run Summary: errors={sums['errors']}, warnings={sums['warnings']}")
-    USER_LOG.info("运行完成，详情见 logs/user.log / system.log / config.log / run_summary.json")
+        # 6) 摘要
+        cache.evict()
+        ec.add_stats("llm_cache", cache.stats())
+        # Prompt 模板缓存：本次运行期间的增量（进程内并发作业会计入彼此）
+        prompt_stats = prompt_cache_stats()
+        ec.add_stats("prompt_cache", {k: prompt_stats[k] - prompt_stats0.get(k, 0)
+                                      for k in ("memory_hits", "compiles", "bytecode_hits")})
+        state.save()
+        ec.add_stats("incremental", state.report())
+        state.log_summary()
+        ec.add_stats("excel", xls.stats())
+        ec.add_stats("stages", timer.report())
+        ec.dump(root)
+        summary = ec.summary()
+        sums = summary["counts"]
+        SYS_LOG.info(f"Run Summary: errors={sums['errors']}, warnings={sums['warnings']}")
+        emit({"type": "summary", "counts": sums})
+        USER_LOG.info("运行完成，详情见 logs/user.log / system.log / config.log / run_summary.json")
+        return summary
+    finally:
+        xls.close()          # 释放 Excel 文件句柄（多工作簿时逐个关闭）
@@ -1,19 +1,29 @@
 # services/extractor_service.py
 from __future__ import annotations
 from pathlib import Path
-import logging, traceback
+from core.context_pool import ContextThreadPoolExecutor
+from dataclasses import dataclass, field
+import logging, os, traceback
 import pandas as pd
 
 from agents.registry import get_extractor
 from utils.coerce import coerce_types
+from utils.tokens import estimate_tokens
+from io_utils.loaders import Workbook
+from core.router import route_label
 
 SYS_LOG  = logging.getLogger("system")
 USER_LOG = logging.getLogger("user")
 CFG_LOG  = logging.getLogger("config")
 
-def run_extraction(xls: pd.ExcelFile, sheet_cfg: dict, plan: dict, ec, config_dir: Path) -> dict:
-    extracted: dict[str, dict] = {}
+# 抽取线程数：<=1 走串行路径；各 provider 的在途上限由 llm_client 的自适应限制器控制（初始值见 llm.yaml 的 max_in_flight）
+EXTRACT_MAX_WORKERS = int(os.getenv("EXTRACT_MAX_WORKERS", "4"))
+# 批量抽取的 Prompt token 预算：>0 时把多个小 Sheet 合并成一次调用（默认关闭）
+EXTRACT_BATCH_TOKENS = int(os.getenv("EXTRACT_BATCH_TOKENS", "0"))
 
+def _plan_sheets(xls: Workbook, sheet_cfg: dict, plan: dict) -> list[str]:
+    """按 Excel 中的顺序挑出需要抽取的 Sheet（顺序决定 extracted 的键顺序）。"""
+    todo = []
     for sheet in xls.sheet_names:
         if sheet not in sheet_cfg:
             SYS_LOG.info(f"跳过未配置 Sheet：{sheet}")
@@ -21,30 +31,217 @@ def run_extraction(xls: pd.ExcelFile, sheet_cfg: dict, plan: dict, ec, config_di
         if sheet in plan["sheets_skip"]:
             SYS_LOG.warning(f"跳过存在问题 Sheet：{sheet}")
             continue
+        todo.append(sheet)
+    return todo
 
+def load_frames(xls: Workbook, sheet_cfg: dict, plan: dict, ec) -> dict[str, pd.DataFrame]:
+    """
+    解析待抽取的 Sheet，返回 {sheet: DataFrame}（按 Excel 顺序）。
+    先在当前线程解析（Workbook 按 Sheet 缓存，已 preload 的直接取缓存），再把 LLM 调用并发出去。
+    """
+    frames: dict[str, pd.DataFrame] = {}
+    for sheet in _plan_sheets(xls, sheet_cfg, plan):
+        try:
+            frames[sheet] = xls.parse(sheet)
+        except Exception as e:
+            ec.add("error", f"EXTRACT:{sheet}", f"抽取失败：{e}", traceback.format_exc())
+    return frames
+
+def _computed_values(sheet: str, df: pd.DataFrame, cfg: dict) -> dict:
+    """可确定性计算的 key：直接在 DataFrame 上求值，不调用 LLM。"""
+    compute = cfg.get("compute") or {}
+    if not compute:
+        return {}
+    return get_extractor("ComputedExtractor")(
+        df          = df,
+        keys        = {k: t for k, t in cfg["keys"].items() if k in compute},
+        compute     = compute,
+        names       = cfg.get("names"),
+        sheet_name  = sheet,
+    ).extract()
+
+def _llm_keys(cfg: dict) -> dict:
+    compute = cfg.get("compute") or {}
+    return {k: t for k, t in cfg["keys"].items() if k not in compute}
+
+def _make_llm_extractor(sheet: str, df: pd.DataFrame, cfg: dict, config_dir: Path, cache=None, on_call=None):
+    return get_extractor("GenericExtractor")(
+        df          = df,
+        keys        = _llm_keys(cfg),
+        prompt_path = config_dir / "prompts" / cfg["prompt"],
+        config_dir  = config_dir,
+        provider    = cfg.get("provider", "qwen"),
+        sheet_name  = sheet,
+        cache       = cache if cfg.get("cache", True) else None,   # sheet_tasks 中 cache: false 可单独绕过
+        chunking    = cfg.get("chunking"),
+        table_format= cfg.get("table_format", "csv"),
+        float_digits= cfg.get("float_digits"),
+        on_call     = on_call,
+        failover_after = cfg.get("failover_after"),
+    )
+
+def _finish(sheet: str, raw_values: dict, cfg: dict) -> dict:
+    cleaned = coerce_types(sheet, raw_values, cfg["keys"], percent_as_fraction=True)
+
+    # 摘要日志
+    head = ", ".join(f"{k}={cleaned[k]}" for k in list(cleaned.keys())[:10])
+    USER_LOG.info(f"[抽取完成] {sheet}：{head}{' ...' if len(cleaned)>10 else ''}")
+    return cleaned
+
+def extract_sheet(sheet: str, df: pd.DataFrame, cfg: dict, config_dir: Path, cache=None, on_call=None,
+                  extractor=None) -> dict:
+    """
+    单个 Sheet：计算型 key + LLM 抽取 + 类型清洗（同一 coerce_types 路径），异常交给调用方记录。
+    extractor：规划阶段已构建的 LLM 抽取器（可选），避免重复构建。
+    """
+    SYS_LOG.info(f"开始抽取 Sheet：{sheet}")
+    raw_values = _computed_values(sheet, df, cfg)
+    # 其余 key 交给 LLM；全部可计算时整张 Sheet 不再调用 LLM
+    if _llm_keys(cfg):
+        extractor = extractor or _make_llm_extractor(sheet, df, cfg, config_dir, cache, on_call)
+        raw_values.update(extractor.extract() or {})
+    return _finish(sheet, raw_values, cfg)
+
+# ---------------- 批量抽取：多个小 Sheet 合并成一次工具调用 ----------------
+@dataclass
+class ExtractUnit:
+    """一个抽取单元：一个或多个 Sheet，以及规划时已构建好的 LLM 抽取器（按 Sheet，抽取时直接复用）。"""
+    sheets:     list[str]
+    extractors: dict = field(default_factory=dict)
+
+def plan_units(frames: dict[str, pd.DataFrame], sheet_cfg: dict, config_dir: Path,
+               batch_tokens: int | None = None, cache=None, on_call=None) -> list[ExtractUnit]:
+    """
+    把待抽取的 Sheet 分成若干“抽取单元”：
+    - 未开启批量（batch_tokens<=0）：每个 Sheet 一个单元
+    - 开启后：同一 provider、Prompt 估算 token 在预算内、未配置 chunking、未设 batch: false 的小 Sheet
+      按 Excel 顺序贪心打包，单元内 Prompt 估算 token 之和不超过 batch_tokens
+    估算 token 时构建的抽取器（带 cache / on_call）随单元传给 extract_unit，不再重复构建。
+    """
+    batch_tokens = EXTRACT_BATCH_TOKENS if batch_tokens is None else batch_tokens
+    if not batch_tokens or batch_tokens <= 0:
+        return [ExtractUnit([s]) for s in frames]
+
+    units: list[ExtractUnit] = []
+    open_units: dict[str, tuple[ExtractUnit, int]] = {}   # provider → (当前单元, 已用 token)
+    for sheet, df in frames.items():
         cfg = sheet_cfg[sheet]
+        if cfg.get("batch") is False or cfg.get("chunking") or not _llm_keys(cfg):
+            units.append(ExtractUnit([sheet])); continue
         try:
-            df = xls.parse(sheet)
-            SYS_LOG.info(f"开始抽取 Sheet：{sheet}")
-
-            extractor = get_extractor("GenericExtractor")(
-                df          = df,
-                keys        = cfg["keys"],
-                prompt_path = config_dir / "prompts" / cfg["prompt"],
-                config_dir  = config_dir,
-                provider    = cfg.get("provider", "qwen"),
-                sheet_name  = sheet,
-            )
-            raw_values = extractor.extract() or {}
-            cleaned    = coerce_types(sheet, raw_values, cfg.get("keys", {}), percent_as_fraction=True)
-            extracted[sheet] = cleaned
-
-            # 摘要日志
-            head = ", ".join(f"{k}={cleaned[k]}" for k in list(cleaned.keys())[:10])
-            USER_LOG.info(f"[抽取完成] {sheet}：{head}{' ...' if len(cleaned)>10 else ''}")
+            extractor = _make_llm_extractor(sheet, df, cfg, config_dir, cache, on_call)
+            size = estimate_tokens(extractor._render_prompt())
+        except Exception:
+            units.append(ExtractUnit([sheet])); continue   # 渲染失败留给单独抽取时报错
+        if size > batch_tokens:
+            units.append(ExtractUnit([sheet], {sheet: extractor})); continue
+
+        provider = route_label(cfg.get("provider", "qwen"))
+        cur, used = open_units.get(provider, (None, 0))
+        if cur is None or used + size > batch_tokens:
+            cur, used = ExtractUnit([]), 0
+            units.append(cur)
+        cur.sheets.append(sheet)
+        cur.extractors[sheet] = extractor
+        open_units[provider] = (cur, used + size)
+
+    batched = [u.sheets for u in units if len(u.sheets) > 1]
+    if batched:
+        SYS_LOG.info(f"批量抽取：{len(batched)} 组 → " + "；".join("+".join(u) for u in batched))
+    return units
 
+def extract_unit(unit: ExtractUnit, frames: dict[str, pd.DataFrame], sheet_cfg: dict, ec,
+                 config_dir: Path, cache=None) -> dict:
+    """
+    抽取一个单元，返回 {sheet: cleaned}；失败按 Sheet 记入 ec（EXTRACT:<sheet>），不抛异常。
+    批量调用失败或某个 Sheet 在结果中缺失时，该 Sheet 回退为单独抽取，保证失败归属到具体 Sheet。
+    """
+    out: dict[str, dict] = {}
+    sheets = unit.sheets
+    if len(sheets) == 1:
+        sheet = sheets[0]
+        try:
+            out[sheet] = extract_sheet(sheet, frames[sheet], sheet_cfg[sheet], config_dir, cache, ec.record_call,
+                                       extractor=unit.extractors.get(sheet))
         except Exception as e:
             ec.add("error", f"EXTRACT:{sheet}", f"抽取失败：{e}", traceback.format_exc())
-            continue
+        return out
+
+    SYS_LOG.info(f"开始批量抽取：{'+'.join(sheets)}")
+    computed, members = {}, {}
+    for sheet in sheets:
+        try:
+            computed[sheet] = _computed_values(sheet, frames[sheet], sheet_cfg[sheet])
+            members[sheet]  = unit.extractors.get(sheet) or _make_llm_extractor(sheet, frames[sheet], sheet_cfg[sheet],
+                                                                               config_dir, cache, ec.record_call)
+        except Exception as e:
+            ec.add("error", f"EXTRACT:{sheet}", f"抽取失败：{e}", traceback.format_exc())
+
+    batch_values: dict[str, dict] = {}
+    if members:
+        use_cache = cache if all(m.cache is not None for m in members.values()) else None
+        try:
+            batch_values = get_extractor("BatchExtractor")(list(members.values()), cache=use_cache).extract()
+        except Exception as e:
+            SYS_LOG.warning(f"批量抽取失败（{'+'.join(members)}）：{e}；改为逐个抽取")
+
+    for sheet, member in members.items():
+        try:
+            values = batch_values.get(sheet)
+            if values is None:
+                SYS_LOG.info(f"批量结果缺少 {sheet}，单独抽取")
+                values = member.extract() or {}
+            out[sheet] = _finish(sheet, {**computed[sheet], **values}, sheet_cfg[sheet])
+        except Exception as e:
+            ec.add("error", f"EXTRACT:{sheet}", f"抽取失败：{e}", traceback.format_exc())
+    return out
+
+def split_reused(frames: dict[str, pd.DataFrame], sheet_cfg: dict, config_dir: Path,
+                 state=None) -> tuple[dict[str, pd.DataFrame], dict[str, dict], dict[str, str]]:
+    """
+    增量重跑：按指纹把 frames 分成 (待抽取 frames, 复用结果 {sheet: values}, 待抽取 Sheet 的指纹)。
+    state 为 None 或未启用时全部待抽取。
+    """
+    if state is None or not state.enabled:
+        return frames, {}, {}
+    todo, reused, fps = {}, {}, {}
+    for sheet, df in frames.items():
+        try:
+            fp = state.sheet_fp(sheet, df, sheet_cfg[sheet], config_dir)
+        except Exception as e:
+            SYS_LOG.warning(f"计算 Sheet 指纹失败，重新抽取：{sheet}：{e}")
+            todo[sheet] = df; continue
+        values = state.reuse_sheet(sheet, fp)
+        if values is None:
+            todo[sheet], fps[sheet] = df, fp
+        else:
+            reused[sheet] = values
+            USER_LOG.info(f"[复用抽取] {sheet}（输入未变化）")
+    return todo, reused, fps
+
+def run_extraction(xls: Workbook, sheet_cfg: dict, plan: dict, ec, config_dir: Path,
+                   max_workers: int | None = None, cache=None, batch_tokens: int | None = None,
+                   state=None) -> dict:
+    max_workers = EXTRACT_MAX_WORKERS if max_workers is None else max_workers
+    frames = load_frames(xls, sheet_cfg, plan, ec)
+    todo, reused, fps = split_reused(frames, sheet_cfg, config_dir, state)
+    units  = plan_units(todo, sheet_cfg, config_dir, batch_tokens, cache, ec.record_call)
+
+    results: dict[str, dict] = dict(reused)
+
+    def _one(unit: ExtractUnit):
+        results.update(extract_unit(unit, frames, sheet_cfg, ec, config_dir, cache))
+
+    if max_workers <= 1 or len(units) <= 1:
+        for unit in units:
+            _one(unit)
+    else:
+        SYS_LOG.info(f"并发抽取：sheets={len(todo)}，units={len(units)}，workers={max_workers}")
+        with ContextThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="extract") as pool:
+            list(pool.map(_one, units))
+
+    for sheet, fp in fps.items():
+        state.put_sheet(sheet, fp, results.get(sheet))
 
-    return extracted
+    # 与串行路径保持一致：按 Excel 中的 Sheet 顺序组装，与完成先后无关
+    return {sheet: results[sheet] for sheet in frames if sheet in results}
@@ -5,12 +5,125 @@ import logging, json, traceback
 
 from agents.registry import get_generator
 from utils.resolve import resolve, ensure_path_set
+from core.prompts import prompt_variables
 
 SYS_LOG  = logging.getLogger("system")
 USER_LOG = logging.getLogger("user")
 CFG_LOG  = logging.getLogger("config")
 
-def run_generation_and_fill(para_cfg: dict, extracted: dict, plan: dict, ec, config_dir: Path) -> dict:
+def para_mode(task: dict) -> str:
+    return task.get("mode") or ("generate" if "prompt" in task else "fill")
+
+def paragraph_deps(task: dict, sheet_names, config_dir: Path) -> set[str]:
+    """段落依赖的 Sheet 集合（只保留 sheet_names 中存在的）。"""
+    names = set(sheet_names)
+    deps  = {k.split(".", 1)[0] for k in (task.get("keys") or []) if isinstance(k, str)}
+    if task.get("prompt"):
+        try:
+            deps |= prompt_variables(config_dir / "prompts" / task["prompt"], config_dir)
+        except Exception:
+            pass   # prompt 缺失/语法错误留给生成阶段报错
+    return deps & names
+
+def _wants_stream(on_event, stream) -> bool:
+    if on_event is None:
+        return False
+    if stream is None:
+        return True
+    return bool(stream() if callable(stream) else stream)
+
+def process_paragraph(pid: str, task: dict, extracted: dict, ec, config_dir: Path, cache=None,
+                      on_event=None, state=None, stream=None) -> str | None:
+    """
+    处理单个段落：generate 返回生成文本；fill 只补位/记日志，返回 None。
+    软失败：缺字段/异常都记入 ec，返回 None。
+    on_event：可选回调，依次推送 paragraph_start / token / paragraph_done 事件。
+    stream：是否流式生成（逐 token 推送）；可传无参函数，在每段开始生成时判断。缺省为传入 on_event 即流式。
+      非流式时整段生成完成后一次推送 token 事件；流式调用不对冲，也不做超时并行切换。
+    state：可选 RunState，输入指纹未变时直接复用上次生成的文本。
+    """
+    mode = para_mode(task)
+    keys = task.get("keys", [])
+    fp   = None
+
+    try:
+        missing = [k for k in (keys or []) if resolve(k, extracted, strict=True) is None]
+        if mode == "generate" and missing:
+            ec.add("warn", f"PARA:{pid}", f"缺字段 {missing}，已跳过生成")
+            return None
+
+        if mode == "generate":
+            provider    = task.get("provider", "qwen")
+            prompt_path = config_dir / "prompts" / task["prompt"]
+
+            if state is not None and state.enabled:
+                deps = paragraph_deps(task, list(extracted), config_dir)
+                fp   = state.para_fp(pid, task, extracted, deps, config_dir)
+                text = state.reuse_paragraph(pid, fp)
+                if text is not None:
+                    USER_LOG.info(f"[复用生成] {pid}（输入未变化）")
+                    if on_event is not None:
+                        on_event({"type": "paragraph_start", "paragraph": pid})
+                        on_event({"type": "token", "paragraph": pid, "text": text})
+                        on_event({"type": "paragraph_done", "paragraph": pid, "chars": len(text), "reused": True})
+                    return text
+
+            ctx_vals = {k: resolve(k, extracted, strict=True) for k in keys or []}
+            CFG_LOG.debug(f"[GEN-VALUES] {pid}\n{json.dumps(ctx_vals, ensure_ascii=False, indent=2)}")
+
+            generator = get_generator("GenericParagraphGenerator")(
+                prompt_path = prompt_path,
+                context     = extracted,   # 模板里 {{ Sheet.Field }}
+                config_dir  = config_dir,
+                provider    = provider,
+                paragraph_id= pid,
+                cache       = cache if task.get("cache", True) else None,   # paragraph_tasks 中 cache: false 可单独绕过
+                on_call     = ec.record_call,
+                failover_after = task.get("failover_after"),
+            )
+            if on_event is None:
+                text = generator.generate()
+            elif not _wants_stream(on_event, stream):
+                on_event({"type": "paragraph_start", "paragraph": pid})
+                text = generator.generate()
+                on_event({"type": "token", "paragraph": pid, "text": text})
+                on_event({"type": "paragraph_done", "paragraph": pid, "chars": len(text)})
+            else:
+                on_event({"type": "paragraph_start", "paragraph": pid})
+                text = generator.generate(
+                    stream   = True,
+                    on_token = lambda p, delta: on_event({"type": "token", "paragraph": p, "text": delta}),
+                )
+                on_event({"type": "paragraph_done", "paragraph": pid, "chars": len(text)})
+            USER_LOG.info(f"[生成完成] {pid}：{(text[:200] + '...') if len(text)>200 else text}")
+            if fp is not None:
+                state.put_paragraph(pid, fp, text)
+            return text
+
+        # fill
+        for miss in missing:
+            ensure_path_set(extracted, miss, "-")
+            ec.add("warn", f"FILL:{pid}", f"缺字段 {miss}，已用默认 '-' 补位")
+
+        if keys:
+            val_map = {k: resolve(k, extracted, strict=False, default="-") for k in keys}
+            CFG_LOG.debug(f"[FILL-VALUES] pid={pid}\n{json.dumps(val_map, ensure_ascii=False, indent=2)}")
+            summary = ", ".join(f"{k}={val_map[k]}" for k in val_map)
+            USER_LOG.info(f"[直填值] {pid} → {summary[:500] + ' ...' if len(summary)>500 else summary}")
+        else:
+            SYS_LOG.info(f"[直填变量] {pid}（未声明 keys，跳过值记录）")
+        return None
+
+    except Exception as e:
+        ec.add("error", f"PARA:{pid}", f"处理失败（mode={mode}）：{e}", traceback.format_exc())
+        if fp is not None:
+            state.put_paragraph(pid, fp, None)
+        if on_event is not None and mode == "generate":
+            on_event({"type": "paragraph_error", "paragraph": pid, "error": str(e)})
+        return None
+
+def run_generation_and_fill(para_cfg: dict, extracted: dict, plan: dict, ec, config_dir: Path, cache=None,
+                            on_event=None, state=None, stream=None) -> dict:
     gen_ctx: dict[str, str] = {}
 
     for pid, task in (para_cfg or {}).items():
@@ -18,48 +131,8 @@ def run_generation_and_fill(para_cfg: dict, extracted: dict, plan: dict, ec, con
             SYS_LOG.warning(f"跳过存在问题的段落/占位符：{pid}")
             continue
 
-        mode = task.get("mode") or ("generate" if "prompt" in task else "fill")
-        keys = task.get("keys", [])
-
-        try:
-            missing = [k for k in (keys or []) if resolve(k, extracted, strict=True) is None]
-            if mode == "generate" and missing:
-                ec.add("warn", f"PARA:{pid}", f"缺字段 {missing}，已跳过生成")
-                continue
-
-            if mode == "generate":
-                provider    = task.get("provider", "qwen")
-                prompt_path = config_dir / "prompts" / task["prompt"]
-
-                ctx_vals = {k: resolve(k, extracted, strict=True) for k in keys or []}
-                CFG_LOG.debug(f"[GEN-VALUES] {pid}\n{json.dumps(ctx_vals, ensure_ascii=False, indent=2)}")
-
-                generator = get_generator("GenericParagraphGenerator")(
-                    prompt_path = prompt_path,
-                    context     = extracted,   # 模板里 {{ Sheet.Field }}
-                    config_dir  = config_dir,
-                    provider    = provider,
-                    paragraph_id= pid,
-                )
-                text = generator.generate()
-                gen_ctx[pid] = text
-                USER_LOG.info(f"[生成完成] {pid}：{(text[:200] + '...') if len(text)>200 else text}")
-
-            else:  # fill
-                for miss in missing:
-                    ensure_path_set(extracted, miss, "-")
-                    ec.add("warn", f"FILL:{pid}", f"缺字段 {miss}，已用默认 '-' 补位")
-
-                if keys:
-                    val_map = {k: resolve(k, extracted, strict=False, default="-") for k in keys}
-                    CFG_LOG.debug(f"[FILL-VALUES] pid={pid}\n{json.dumps(val_map, ensure_ascii=False, indent=2)}")
-                    summary = ", ".join(f"{k}={val_map[k]}" for k in val_map)
-                    USER_LOG.info(f"[直填值] {pid} → {summary[:500] + ' ...' if len(summary)>500 else summary}")
-                else:
-                    SYS_LOG.info(f"[直填变量] {pid}（未声明 keys，跳过值记录）")
-
-        except Exception as e:
-            ec.add("error", f"PARA:{pid}", f"处理失败（mode={mode}）：{e}", traceback.format_exc())
-            continue
+        text = process_paragraph(pid, task, extracted, ec, config_dir, cache, on_event, state, stream)
+        if text is not None:
+            gen_ctx[pid] = text
 
     return gen_ctx
@@ -0,0 +1,117 @@
+# services/scheduler.py
+"""
+依赖驱动调度：抽取 → 生成 按段落依赖流水线化。
+
+- 段落依赖 = keys 中引用的 Sheet ∪ 生成 prompt 里直接引用的顶层变量（同名 Sheet）
+- 某段落依赖的 Sheet 全部抽取结束（成功或失败）后立即开始生成，互不依赖的段落并发执行
+- fill 段落不调用 LLM，依赖的 Sheet 结束后即在调度线程内补位（缺值补 "-"）；补位前先把要写的 Sheet 换成副本，
+  并与读写同一 Sheet 的生成段落按配置顺序先后执行，效果与串行路径一致
+- 增量重跑（state）：指纹未变的 Sheet 直接复用，视为已完成；段落是否复用在 process_paragraph 中判断
+- extracted / gen_ctx 最终按 Excel Sheet 顺序 / paragraph_tasks 顺序组装，与完成先后无关
+"""
+from __future__ import annotations
+from pathlib import Path
+from concurrent.futures import Future, wait, FIRST_COMPLETED
+from core.context_pool import ContextThreadPoolExecutor
+import copy, logging, os, time
+
+from io_utils.loaders import Workbook
+from services.extractor_service import load_frames, plan_units, extract_unit, split_reused
+from services.generator_service import process_paragraph, para_mode, paragraph_deps
+
+SYS_LOG  = logging.getLogger("system")
+
+# 抽取 + 生成共用的线程数；真正的并发上限仍由各 provider 的自适应限制器控制（线程数是它能达到的上界）
+PIPELINE_MAX_WORKERS = int(os.getenv("PIPELINE_MAX_WORKERS", "8"))
+
+def run_pipelined(xls: Workbook, sheet_cfg: dict, para_cfg: dict, plan: dict, ec, config_dir: Path,
+                  cache=None, max_workers: int | None = None, on_event=None, state=None,
+                  stream=None) -> tuple[dict, dict]:
+    """返回 (extracted, gen_ctx)，语义同 run_extraction + run_generation_and_fill。"""
+    max_workers = PIPELINE_MAX_WORKERS if max_workers is None else max_workers
+    t0     = time.perf_counter()
+    frames = load_frames(xls, sheet_cfg, plan, ec)
+    todo, reused, fps = split_reused(frames, sheet_cfg, config_dir, state)
+
+    # ---- 建图：段落 → 尚未完成的依赖（Sheet 名 / "para:<pid>"）----
+    tasks = {pid: task for pid, task in (para_cfg or {}).items() if pid not in plan["paras_skip"]}
+    for pid in (para_cfg or {}):
+        if pid not in tasks:
+            SYS_LOG.warning(f"跳过存在问题的段落/占位符：{pid}")
+    fills  = {pid for pid, task in tasks.items() if para_mode(task) != "generate"}
+    # fill 段落补位写入的 Sheet（keys 的第一段）；这些 Sheet 即使未配置，生成 prompt 也可能引用
+    writes = {pid: {k.split(".", 1)[0] for k in (tasks[pid].get("keys") or []) if isinstance(k, str)} for pid in fills}
+    names  = set(sheet_cfg or {}).union(*writes.values())
+    reads  = {pid: paragraph_deps(task, names, config_dir) for pid, task in tasks.items()}
+
+    waiting: dict[str, set[str]] = {}
+    earlier: list[str] = []
+    for pid in tasks:
+        # 不会被抽取的 Sheet（未配置/被跳过/解析失败/复用上次结果）视为已完成，缺值由段落自身报告
+        deps = reads[pid] & set(todo)
+        # 与串行路径一致：读写同一 Sheet 的段落按配置顺序先后执行（fill 的补位只对其后的段落可见）
+        for prev in earlier:
+            if (pid in fills and reads[prev] & writes[pid]) or (prev in fills and reads[pid] & writes[prev]):
+                deps.add(f"para:{prev}")
+        waiting[pid] = deps
+        earlier.append(pid)
+    for pid, deps in waiting.items():
+        SYS_LOG.info(f"段落依赖：{pid} ← {sorted(deps) or '（无）'}")
+
+    extracted: dict[str, dict] = dict(reused)
+    gen_ctx:   dict[str, str]  = {}
+    futures: dict[Future, tuple[str, object]] = {}
+
+    with ContextThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix="pipeline") as pool:
+
+        def _submit_ready():
+            ready = [p for p, deps in waiting.items() if not deps]
+            while ready:
+                for pid in ready:
+                    del waiting[pid]
+                    if pid in fills:
+                        # fill 不调用 LLM，在调度线程内执行；先换成副本再写，已开始的生成线程看到的 Sheet 不受影响
+                        for sheet in writes[pid] & set(extracted):
+                            extracted[sheet] = copy.deepcopy(extracted[sheet])
+                        process_paragraph(pid, tasks[pid], extracted, ec, config_dir, cache)
+                    else:
+                        SYS_LOG.info(f"依赖就绪，开始生成：{pid}")
+                        # 浅拷贝即可：各 Sheet 的 dict 发布后不再原地修改（抽取整体替换，fill 写副本）
+                        fut = pool.submit(process_paragraph, pid, tasks[pid], dict(extracted), ec, config_dir, cache,
+                                          on_event, state, stream)
+                        futures[fut] = ("para", pid)
+                    for deps in waiting.values():
+                        deps.discard(f"para:{pid}")
+                ready = [p for p, deps in waiting.items() if not deps]
+
+        for unit in plan_units(todo, sheet_cfg, config_dir, cache=cache, on_call=ec.record_call):
+            fut = pool.submit(extract_unit, unit, todo, sheet_cfg, ec, config_dir, cache)
+            futures[fut] = ("unit", unit.sheets)
+        _submit_ready()
+
+        while futures:
+            done, _ = wait(list(futures), return_when=FIRST_COMPLETED)
+            for fut in done:
+                kind, name = futures.pop(fut)
+                if kind == "unit":
+                    # extract_unit 按 Sheet 记录失败、不抛异常；单元内的 Sheet 一并视为结束
+                    values = fut.result()
+                    extracted.update(values)
+                    for sheet in name:
+                        if sheet in fps:
+                            state.put_sheet(sheet, fps[sheet], values.get(sheet))
+                    for deps in waiting.values():
+                        deps.difference_update(name)
+                else:
+                    text = fut.result()   # process_paragraph 自身软失败，不抛异常
+                    if text is not None:
+                        gen_ctx[name] = text
+            _submit_ready()
+
+    # 按 Excel Sheet 顺序组装；fill 补位新建的（未抽取的）Sheet 排在后面
+    extracted = {**{s: extracted[s] for s in frames if s in extracted}, **extracted}
+    gen_ctx = {pid: gen_ctx[pid] for pid in (para_cfg or {}) if pid in gen_ctx}
+
+    SYS_LOG.info(f"流水线调度完成：sheets={len(extracted)}/{len(frames)}，paragraphs={len(gen_ctx)}/{len(tasks) - len(fills)}，"
+                 f"耗时 {time.perf_counter() - t0:.2f}s")
+    return extracted, gen_ctx
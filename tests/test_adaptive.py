@@ -0,0 +1,89 @@
+# tests/test_adaptive.py
+import threading
+
+import pytest
+
+from core import adaptive
+from core.adaptive import AdaptiveLimiter
+
+class _Clock:
+    def __init__(self):
+        self.now = 100.0
+
+    def perf_counter(self):
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    c = _Clock()
+    monkeypatch.setattr(adaptive, "time", c)
+    return c
+
+def _run(lim: AdaptiveLimiter, clock: _Clock, error=None, seconds: float = 1.0):
+    token = lim.acquire()
+    clock.now += seconds
+    lim.release(token, error)
+
+def test_additive_increase_only_when_busy(clock):
+    lim = AdaptiveLimiter(4, max_limit=8)
+    _run(lim, clock)                                  # 只有 1 个在途，不到上限的一半：不增长
+    assert lim.limit == 4
+    tokens = [lim.acquire() for _ in range(4)]
+    clock.now += 1.0
+    for t in tokens:
+        lim.release(t)
+    expected = 4.0
+    for _ in range(3):                                # 在途 4、3、2 时释放才算用满
+        expected += 1 / expected
+    assert lim.limit == pytest.approx(expected)
+    assert lim.current == 4
+
+def test_increase_stops_at_max_and_on_slow_calls(clock):
+    lim = AdaptiveLimiter(1, max_limit=2, latency_slo=5)
+    for _ in range(10):
+        _run(lim, clock)
+    assert lim.limit == 2
+    lim = AdaptiveLimiter(1, max_limit=4, latency_slo=5)
+    _run(lim, clock, seconds=6)
+    assert lim.limit == 1
+
+def test_throttle_halves_once_per_latency_period(clock):
+    lim = AdaptiveLimiter(8, max_limit=8)
+    _run(lim, clock, seconds=2.0)                     # p50 = 2s
+    _run(lim, clock, TimeoutError("timeout"))
+    assert (lim.limit, lim.cuts) == (4, 1)
+    _run(lim, clock, TimeoutError("timeout"), seconds=0.5)
+    assert (lim.limit, lim.cuts) == (4, 1)            # 距上次收缩不足 p50，不再收缩
+    clock.now += 2.0
+    _run(lim, clock, TimeoutError("timeout"))
+    assert (lim.limit, lim.cuts) == (2, 2)
+    for _ in range(3):
+        clock.now += 5.0
+        _run(lim, clock, TimeoutError("timeout"))
+    assert lim.current == lim.min_limit == 1
+
+def test_other_errors_do_not_shrink_and_are_reported_separately(clock):
+    lim = AdaptiveLimiter(4)
+    _run(lim, clock)
+    _run(lim, clock, ValueError("bad json"))
+    _run(lim, clock, ValueError("bad json"))
+    _run(lim, clock, TimeoutError("timeout"))
+    stats = lim.stats()
+    assert (stats["cuts"], stats["limit"]) == (1, 2)
+    assert (stats["error_rate"], stats["throttle_rate"]) == (0.5, 0.25)
+
+def test_fixed_limit_never_changes(clock):
+    lim = AdaptiveLimiter.from_cfg(3, False)
+    for _ in range(5):
+        _run(lim, clock)
+    _run(lim, clock, TimeoutError("timeout"))
+    assert (lim.limit, lim.cuts) == (3, 0)
+
+def test_acquire_blocks_at_limit(clock):
+    lim = AdaptiveLimiter(1, adaptive=False)
+    token = lim.acquire()
+    got = threading.Event()
+    threading.Thread(target=lambda: (lim.acquire(), got.set()), daemon=True).start()
+    assert not got.wait(0.1)
+    lim.release(token)
+    assert got.wait(1.0)
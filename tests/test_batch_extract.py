@@ -0,0 +1,18 @@
+# tests/test_batch_extract.py
+from types import SimpleNamespace
+
+from agents.extract_generic import BatchExtractor
+
+def _member(sheet, keys):
+    return SimpleNamespace(sheet_name=sheet, keys=keys, on_call=None, route=None, provider="qwen",
+                           config_dir=None, client=None, model_name="m")
+
+def test_split_with_dotted_sheet_prefix():
+    batch = BatchExtractor([_member("财务", {"营收": "number"}),
+                            _member("财务.附表", {"合计": "number"})])
+    flat = {"财务.附表.合计": 1, "财务.营收": 2, "财务.附表.合计 ": 3, "其他.营收": 4}
+    assert batch._split(flat) == {"财务": {"营收": 2}, "财务.附表": {"合计": 1}}
+
+def test_split_keeps_member_order_and_drops_missing_sheets():
+    batch = BatchExtractor([_member("A", {"x": "number"}), _member("B", {"y": "string"}), _member("C", {"z": "string"})])
+    assert list(batch._split({"C.z": "c", "A.x": 1})) == ["A", "C"]
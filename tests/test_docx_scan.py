@@ -0,0 +1,41 @@
+# tests/test_docx_scan.py
+import zipfile
+
+import pytest
+
+from validator.docx_scan import JINJA_RE, _Matcher, scan_placeholders
+
+def _match(*chunks):
+    m = _Matcher()
+    for c in chunks:
+        m.feed(c)
+    m.finish()
+    return m.found
+
+def _regex(text):
+    return [s.strip() for s in JINJA_RE.findall(text)]
+
+def test_placeholder_split_across_runs():
+    chunks = ["正文 {", "{ sub", "ject.", "name }", "} 中间 {{x}", "}{{ y", " }}尾 {"]
+    assert _match(*chunks) == ["subject.name", "x", "y"] == _regex("".join(chunks))
+
+@pytest.mark.parametrize("text", ["{{  }}", "{{ }} {{a}}", "{{{a}}}", "{{a}} }} {{", "{{ a\n b }}", "{ {a}}"])
+def test_matches_regex_for_every_split(text):
+    expected = _regex(text)
+    assert _match(text) == expected
+    for i in range(len(text) + 1):
+        assert _match(text[:i], text[i:]) == expected
+    assert _match(*text) == expected                 # 每个字符一个 run
+
+def _docx(path, runs_per_para):
+    body = "".join("<w:p>" + "".join(f"<w:r><w:t>{t}</w:t></w:r>" for t in runs) + "</w:p>" for runs in runs_per_para)
+    doc = (f'<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main">'
+           f"<w:body>{body}</w:body></w:document>")
+    with zipfile.ZipFile(path, "w") as z:
+        z.writestr("word/document.xml", doc)
+        z.writestr("word/header1.xml", doc.replace("a.b", "hdr"))
+    return path
+
+def test_scan_placeholders_across_runs_and_parts(tmp_path):
+    path = _docx(tmp_path / "t.docx", [["标题 {", "{ a.", "b }}"], ["{{c}}"], ["{{ a.b }}"]] * 200)
+    assert scan_placeholders(path) == ["a.b", "c", "hdr"]
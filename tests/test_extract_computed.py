@@ -0,0 +1,62 @@
+# tests/test_extract_computed.py
+import pandas as pd
+import pytest
+
+from agents.extract_computed import ComputedExtractor, ComputeError, parse_expr
+
+@pytest.fixture
+def ex():
+    # Excel 第 1 行是表头（科目 / 总值 / 比例），数据从第 2 行开始
+    df = pd.DataFrame({"科目": ["甲", "乙", "丙", None], "总值": [10, 20, "30", None], "比例": ["1.5%", "2", None, None]})
+    return ComputedExtractor(df, keys={}, compute={}, names={"subjects": "A2:A5", "top": "B2"}, sheet_name="t")
+
+@pytest.mark.parametrize("expr, expected", [
+    ("B2", 10),
+    ('cell("A3")', "乙"),
+    ("A1", "科目"),                     # 第 1 行取表头
+    ("Z2", None),                       # 单元格超出数据：空
+    ("sum(B2:B4)", 60),
+    ('sum(range("B2:B5"))', 60),
+    ("count(subjects)", 3),
+    ("top * 2", 20),
+    ('max(col("总值"))', 30),
+    ('count(col("C"))', 2),
+    ("mean(B2:B3)", 15),
+    ("nunique(A2:C5)", 8),
+    ("first(C2:C5)", "1.5%"),
+    ("last(subjects)", "丙"),
+    ("rows()", 3),
+    ("round(sum(B2:B4) / 7, 2)", 8.57),
+    ("round(B3 / 3)", 7),
+    ("-B2 + 1", -9),
+])
+def test_evaluate(ex, expr, expected):
+    assert ex.evaluate(expr) == expected
+
+@pytest.mark.parametrize("expr", [
+    "df.shape",                         # 属性
+    "B2[0]",                            # 下标
+    'round(B2, ndigits=1)',             # 关键字参数
+    "(lambda: 1)()",                    # lambda
+    "__import__('os')",                 # 非白名单函数
+    "B2 ** 2",                          # 非白名单运算
+    "sum()", "col()", "round()", "round(B2, 1, 2)", "rows(A2:A3)", "sum(B2, B3)",   # 参数个数
+    "sum(B2:",                          # 语法错误
+])
+def test_rejected_syntax(expr):
+    with pytest.raises(ComputeError):
+        parse_expr(expr)
+
+@pytest.mark.parametrize("expr", ['sum(col("ZZ"))', 'col("不存在")', "sum(ZZ)", 'cell("2B")', "sum(B2:C)"])
+def test_bad_reference(ex, expr):
+    with pytest.raises(ComputeError):
+        ex.evaluate(expr)
+
+def test_column_result_must_be_aggregated(ex):
+    with pytest.raises(ComputeError, match="不是单个值"):
+        ex.evaluate('col("总值")')
+
+def test_extract_soft_fails_per_key(ex):
+    ex.keys = {"total": "number", "bad": "number"}
+    ex.compute = {"total": "sum(B2:B5)", "bad": 'sum(col("ZZ"))'}
+    assert ex.extract() == {"total": 60, "bad": None}
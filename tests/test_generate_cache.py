@@ -0,0 +1,46 @@
+# tests/test_generate_cache.py
+from types import SimpleNamespace
+
+import pytest
+
+import llm_client
+from agents.generate import base
+from agents.generate.base import GenericParagraphGenerator
+from core.llm_cache import LLMCache
+
+def _resp(text):
+    return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=text))])
+
+class _Completions:
+    def create(self, model, messages, stream=False):
+        return _resp(f"由 {model} 生成")
+
+@pytest.fixture
+def gen(monkeypatch, tmp_path):
+    failing = set()
+
+    def invoke(name, config_dir, fn, **kw):
+        if name in failing:
+            raise RuntimeError(f"{name} 不可用")
+        return fn(SimpleNamespace(chat=SimpleNamespace(completions=_Completions())))
+
+    monkeypatch.setattr(base, "apply_provider", lambda name, config_dir: (None, f"{name}-model"))
+    monkeypatch.setattr(llm_client, "invoke", invoke)
+    monkeypatch.setattr(llm_client, "provider_model", lambda name, config_dir=None: f"{name}-model")
+    monkeypatch.setattr(llm_client, "provider_health", lambda name, config_dir=None: {})
+    (tmp_path / "p.txt").write_text("写一段：{{ x }}", encoding="utf-8")
+    cache = LLMCache(tmp_path / "cache")
+
+    def make():
+        return GenericParagraphGenerator(tmp_path / "p.txt", {"x": 1}, provider=["a", "b"], config_dir=tmp_path,
+                                         paragraph_id="p1", cache=cache)
+    return make, failing, cache
+
+def test_failover_answer_is_not_cached_under_primary(gen):
+    make, failing, cache = gen
+    failing.add("a")
+    assert make().generate() == "由 b-model 生成"
+    failing.clear()
+    assert make().generate() == "由 a-model 生成"     # 没有命中备份模型的结果
+    assert make().generate() == "由 a-model 生成"
+    assert cache.stats()["hits"] == 1
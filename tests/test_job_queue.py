@@ -0,0 +1,62 @@
+# tests/test_job_queue.py
+import threading
+
+import pytest
+
+from core.job_queue import JobQueue, QueueFull
+
+def _blocked_queue(max_depth: int = 8):
+    """单工作线程，先塞一个阻塞作业占住它，后续提交的作业都留在队列里。"""
+    started, gate, order = threading.Event(), threading.Event(), []
+    q = JobQueue(1, max_depth=max_depth, on_start=lambda job_id, wait: order.append(job_id))
+    q.submit("blocker", lambda: (started.set(), gate.wait(5)))
+    assert started.wait(5)
+    return q, gate, order
+
+def _drain(q: JobQueue, expected: int):
+    done = threading.Event()
+    q.submit("last", done.set, priority="bulk")
+    assert done.wait(5)
+    assert q.stats()["submitted"] == expected + 1
+
+def test_interactive_jobs_run_before_bulk_in_fifo_order():
+    q, gate, order = _blocked_queue()
+    for job_id, pri in [("b1", "bulk"), ("i1", "interactive"), ("b2", "bulk"), ("i2", "interactive")]:
+        q.submit(job_id, lambda: None, priority=pri)
+    assert q.stats()["depth"] == {"interactive": 2, "bulk": 2}
+    gate.set()
+    _drain(q, 5)
+    assert order == ["blocker", "i1", "i2", "b1", "b2", "last"]
+    q.stop()
+
+def test_unknown_priority_is_interactive():
+    q, gate, order = _blocked_queue()
+    q.submit("b1", lambda: None, priority="bulk")
+    q.submit("x1", lambda: None, priority="urgent")
+    gate.set()
+    _drain(q, 3)
+    assert order[:3] == ["blocker", "x1", "b1"]
+    q.stop()
+
+def test_full_queue_rejects_with_retry_after():
+    q, gate, _ = _blocked_queue(max_depth=2)
+    q.submit("a", lambda: None)
+    q.submit("b", lambda: None)
+    with pytest.raises(QueueFull) as exc:
+        q.submit("c", lambda: None)
+    assert exc.value.depth == 2
+    assert exc.value.retry_after == 90             # 没有耗时样本：按 30s × (2 + 1) / 1 个工作线程
+    assert q.stats()["rejected"] == 1
+    gate.set()
+    q.stop()
+
+def test_retry_after_scales_with_recent_durations_and_workers():
+    q = JobQueue(4, max_depth=1)
+    q._durs.extend([2.0, 4.0])
+    assert q._retry_after(5) == 5                  # ceil(3 × 6 / 4)
+    q._durs.extend([1000.0] * 10)
+    assert q._retry_after(5) == 300                # 上限 300s
+    q._durs.clear()
+    q._durs.append(0.01)
+    assert q._retry_after(0) == 1                  # 下限 1s
+    q.stop()
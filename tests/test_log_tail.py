@@ -0,0 +1,47 @@
+# tests/test_log_tail.py
+import os
+
+from io_utils.log_tail import LogFollower, tail_lines
+
+def _append(path, text):
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(text)
+
+def test_file_created_after_start_is_read_from_beginning(tmp_path):
+    path = tmp_path / "system.log"
+    follower = LogFollower(path)
+    assert follower.read() == ([], 0)
+    _append(path, "第一行\n第二行\n半")
+    lines, offset = follower.read()
+    assert lines == ["第一行", "第二行"]
+    assert offset == len("第一行\n第二行\n".encode("utf-8"))
+    _append(path, "行\n")
+    assert follower.read()[0] == ["半行"]
+    follower.close()
+
+def test_existing_file_is_followed_from_end(tmp_path):
+    path = tmp_path / "system.log"
+    _append(path, "旧的\n")
+    follower = LogFollower(path)
+    assert follower.read()[0] == []
+    _append(path, "新的\n")
+    assert follower.read()[0] == ["新的"]
+    follower.close()
+
+def test_rotation_continues_from_new_file(tmp_path):
+    path = tmp_path / "system.log"
+    _append(path, "a\n")
+    follower = LogFollower(path, offset=0)
+    assert follower.read()[0] == ["a"]
+    os.replace(path, tmp_path / "system.log.1")
+    _append(path, "b\n")
+    assert follower.read() == (["b"], 2)
+    follower.close()
+
+def test_tail_lines(tmp_path):
+    path = tmp_path / "user.log"
+    _append(path, "".join(f"{i}\n" for i in range(100)))
+    text, end = tail_lines(path, 3, block=7)
+    assert text.splitlines() == ["97", "98", "99"]
+    assert end == path.stat().st_size
+    assert tail_lines(tmp_path / "missing.log") == ("", 0)
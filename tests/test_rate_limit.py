@@ -0,0 +1,84 @@
+# tests/test_rate_limit.py
+from dataclasses import dataclass
+
+import pytest
+
+from core import rate_limit
+from core.rate_limit import RateLimitedPool, TokenBucket
+
+class _Clock:
+    """替换 rate_limit 模块里的 time：monotonic 手动推进，sleep 直接推进时间。"""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+@pytest.fixture
+def clock(monkeypatch):
+    c = _Clock()
+    monkeypatch.setattr(rate_limit, "time", c)
+    return c
+
+@dataclass
+class _Endpoint:
+    rpm:           TokenBucket
+    tpm:           TokenBucket
+    blocked_until: float = 0.0
+
+def _endpoint(rpm=None, tpm=None):
+    return _Endpoint(TokenBucket(rpm), TokenBucket(tpm))
+
+def test_bucket_refills_at_per_minute_rate(clock):
+    b = TokenBucket(60)
+    b.take(60)
+    assert b.wait_time(1, clock.now) == pytest.approx(1.0)
+    clock.now += 30
+    assert b.wait_time(30, clock.now) == 0.0
+    assert b.wait_time(31, clock.now) == pytest.approx(1.0)
+
+def test_bucket_caps_request_at_capacity_and_refill(clock):
+    b = TokenBucket(60, burst=10)
+    assert b.wait_time(100, clock.now) == 0.0        # 超过容量的请求按容量计
+    b.take(10)
+    clock.now += 600
+    assert b.tokens < 10 and b.wait_time(10, clock.now) == 0.0
+    assert b.tokens == 10
+
+def test_unlimited_bucket_never_waits(clock):
+    b = TokenBucket(None)
+    b.take(10 ** 9)
+    assert b.unlimited and b.wait_time(10 ** 9, clock.now) == 0.0
+
+def test_settle_refunds_and_charges_tpm(clock):
+    m = _endpoint(tpm=1000)
+    pool = RateLimitedPool([m])
+    assert pool.reserve(800) == (m, 0.0)
+    pool.settle(m, 800, 300)                          # 实际用得少：退回 500
+    assert m.tpm.tokens == pytest.approx(700)
+    pool.settle(m, 300, 900)                          # 实际用得多：补扣 600
+    assert m.tpm.tokens == pytest.approx(100)
+    pool.settle(m, 100, None)                         # 没有 usage：不修正
+    assert m.tpm.tokens == pytest.approx(100)
+    assert pool.reserve(500) == (None, pytest.approx(24.0))
+
+def test_penalize_skips_member_until_cooldown_ends(clock):
+    a, b = _endpoint(), _endpoint()
+    pool = RateLimitedPool([a, b])
+    pool.penalize(a, 10)
+    assert [pool.reserve(1)[0] for _ in range(3)] == [b, b, b]
+    pool.penalize(b, 5)
+    assert pool.reserve(1) == (None, pytest.approx(5.0))
+    pool.penalize(a, 1)                               # 更短的冷却不会缩短已有的
+    assert a.blocked_until == pytest.approx(clock.now + 10)
+    assert pool.acquire(1) is b and clock.now == pytest.approx(1005.0)
+    assert pool.stats()["waits"] == 1
+
+def test_reserve_round_robins_members(clock):
+    a, b = _endpoint(rpm=60), _endpoint(rpm=60)
+    pool = RateLimitedPool([a, b])
+    assert [pool.reserve(1)[0] for _ in range(4)] == [a, b, a, b]
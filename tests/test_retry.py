@@ -0,0 +1,59 @@
+# tests/test_retry.py
+import logging
+import threading
+import time
+
+import pytest
+
+from core.logging_setup import flush_logs, job_logs, setup_logging
+from core.retry import CallInfo, LatencyWindow, _hedged
+
+class _Calls:
+    """第 1 次调用是主请求，之后是备份；每次调用按 plan 中对应的 (耗时, 异常) 执行。"""
+
+    def __init__(self, *plan):
+        self.plan, self.n, self.lock = list(plan), 0, threading.Lock()
+
+    def __call__(self, ready):
+        with self.lock:
+            idx, self.n = self.n, self.n + 1
+        ready()
+        seconds, error = self.plan[idx]
+        time.sleep(seconds)
+        if idx:
+            logging.getLogger("system").info("hedge backup ran")
+        if error is not None:
+            raise error
+        return "backup" if idx else "primary"
+
+def test_backup_wins_when_primary_is_slow():
+    info = CallInfo()
+    assert _hedged(_Calls((0.3, None), (0.01, None)), 0.05, info, LatencyWindow()) == "backup"
+    assert (info.hedged, info.hedge_won) == (1, 1)
+
+def test_primary_wins_when_backup_is_slower():
+    info = CallInfo()
+    assert _hedged(_Calls((0.1, None), (0.5, None)), 0.05, info, LatencyWindow()) == "primary"
+    assert (info.hedged, info.hedge_won) == (1, 0)
+
+def test_failed_primary_waits_for_backup():
+    info = CallInfo()
+    assert _hedged(_Calls((0.1, RuntimeError("p")), (0.2, None)), 0.05, info, LatencyWindow()) == "backup"
+    assert (info.hedged, info.hedge_won) == (1, 1)
+
+def test_both_failed_raises_primary_error():
+    with pytest.raises(RuntimeError, match="p"):
+        _hedged(_Calls((0.1, RuntimeError("p")), (0.01, ValueError("b"))), 0.05, CallInfo(), LatencyWindow())
+
+def test_fast_primary_sends_no_backup():
+    info, calls = CallInfo(), _Calls((0.0, None), (0.0, None))
+    assert _hedged(calls, 0.05, info, LatencyWindow()) == "primary"
+    time.sleep(0.1)
+    assert (calls.n, info.hedged) == (1, 0)
+
+def test_backup_logs_go_to_job_dir(tmp_path):
+    setup_logging(tmp_path / "default")
+    with job_logs(tmp_path / "job"):
+        _hedged(_Calls((0.2, None), (0.01, None)), 0.05, CallInfo(), LatencyWindow())
+    flush_logs()
+    assert "hedge backup ran" in (tmp_path / "job" / "system.log").read_text(encoding="utf-8")
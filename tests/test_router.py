@@ -0,0 +1,73 @@
+# tests/test_router.py
+import threading
+import time
+
+import pytest
+
+import llm_client
+from core.router import Route, routed_invoke
+
+class _Fake:
+    """按 provider 名模拟：queue 秒后占到槽位（调用 on_ready），再过 work 秒返回或抛出 error。"""
+
+    def __init__(self, monkeypatch, plan: dict, health: dict | None = None):
+        self.plan, self.calls, self.lock = plan, [], threading.Lock()
+        monkeypatch.setattr(llm_client, "invoke", self.invoke)
+        monkeypatch.setattr(llm_client, "provider_model", lambda name, config_dir=None: f"{name}-model")
+        monkeypatch.setattr(llm_client, "provider_health",
+                            lambda name, config_dir=None: (health or {}).get(name, {}))
+
+    def invoke(self, name, config_dir, fn, on_ready=None, **kw):
+        p = self.plan[name]
+        with self.lock:
+            self.calls.append(name)
+        time.sleep(p.get("queue", 0))
+        if on_ready is not None:
+            on_ready()
+        time.sleep(p.get("work", 0))
+        if p.get("error"):
+            raise p["error"]
+        return fn(None)
+
+def _call(route):
+    return routed_invoke(route, None, lambda client, model: model, label="t")
+
+def test_queueing_before_ready_does_not_fail_over(monkeypatch):
+    fake = _Fake(monkeypatch, {"a": {"queue": 0.3, "work": 0.02}, "b": {}})
+    assert _call(Route.parse(["a", "b"], failover_after=0.1)) == "a-model"
+    assert fake.calls == ["a"]
+
+def test_slow_primary_fails_over_after_ready(monkeypatch):
+    fake = _Fake(monkeypatch, {"a": {"work": 0.5, "error": RuntimeError("a")}, "b": {"work": 0.02}})
+    t0 = time.perf_counter()
+    assert _call(Route.parse(["a", "b"], failover_after=0.05)) == "b-model"
+    assert fake.calls == ["a", "b"]
+    assert time.perf_counter() - t0 < 0.7
+
+def test_slow_primary_still_wins_when_it_succeeds_first(monkeypatch):
+    fake = _Fake(monkeypatch, {"a": {"work": 0.1}, "b": {"work": 0.5}})
+    assert _call(Route.parse(["a", "b"], failover_after=0.05)) == "a-model"
+    assert fake.calls == ["a", "b"]
+
+def test_fast_primary_cancels_deadline(monkeypatch):
+    fake = _Fake(monkeypatch, {"a": {"work": 0.01}, "b": {}})
+    assert _call(Route.parse(["a", "b"], failover_after=0.05)) == "a-model"
+    time.sleep(0.1)
+    assert fake.calls == ["a"]
+
+def test_failure_switches_in_rank_order(monkeypatch):
+    fake = _Fake(monkeypatch, {"a": {"error": RuntimeError("a")}, "b": {"error": RuntimeError("b")}, "c": {}},
+                 health={"b": {"error_rate": 0.9}})
+    assert _call(Route.parse(["a", "b", "c"], failover_after=10)) == "c-model"
+    assert fake.calls == ["a", "c"]
+
+def test_all_failed_raises_last_error(monkeypatch):
+    _Fake(monkeypatch, {"a": {"error": ValueError("a")}, "b": {"error": KeyError("b")}})
+    with pytest.raises(KeyError):
+        _call(Route.parse(["a", "b"], failover_after=10))
+
+def test_stream_fails_over_sequentially(monkeypatch):
+    fake = _Fake(monkeypatch, {"a": {"error": RuntimeError("a")}, "b": {}})
+    route = Route.parse(["a", "b"], failover_after=0)
+    assert routed_invoke(route, None, lambda client, model: model, stream=True) == "b-model"
+    assert fake.calls == ["a", "b"]
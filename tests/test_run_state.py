@@ -0,0 +1,37 @@
+# tests/test_run_state.py
+import json
+from pathlib import Path
+
+from core.error_collector import ErrorCollector
+from core.run_state import RunState
+from services.generator_service import process_paragraph
+
+def _saved(path: Path) -> dict:
+    return json.loads(path.read_text(encoding="utf-8"))
+
+def test_fill_paragraph_does_not_leak_into_saved_state(tmp_path):
+    state = RunState(tmp_path / "run_state.json")
+    values = {"营收": 100}
+    state.put_sheet("财务", "fp1", values)
+    extracted = {"财务": values}
+
+    process_paragraph("p1", {"mode": "fill", "keys": ["财务.利润"]}, extracted, ErrorCollector(), tmp_path)
+    assert extracted["财务"]["利润"] == "-"
+
+    state.save()
+    assert _saved(tmp_path / "run_state.json")["sheets"]["财务"]["values"] == {"营收": 100}
+
+def test_reused_sheet_is_a_copy(tmp_path):
+    path = tmp_path / "run_state.json"
+    first = RunState(path)
+    first.put_sheet("财务", "fp1", {"营收": 100})
+    first.save()
+
+    second = RunState(path)
+    values = second.reuse_sheet("财务", "fp1")
+    extracted = {"财务": values}
+    process_paragraph("p1", {"mode": "fill", "keys": ["财务.利润"]}, extracted, ErrorCollector(), tmp_path)
+
+    second.save()
+    assert _saved(path)["sheets"]["财务"]["values"] == {"营收": 100}
+    assert second.reuse_sheet("财务", "fp1") == {"营收": 100}
@@ -0,0 +1,57 @@
+# tests/test_scheduler.py
+import threading
+import time
+
+from core.error_collector import ErrorCollector
+from services import scheduler
+from services.extractor_service import ExtractUnit
+from services.generator_service import process_paragraph
+
+def _run(monkeypatch, tmp_path, para_cfg, delays):
+    """抽取用假实现：每个 Sheet 一个单元，按 delays 延迟后返回 {"a": 1}；生成段落只记录看到的上下文。"""
+    seen, lock = {}, threading.Lock()
+    monkeypatch.setattr(scheduler, "load_frames", lambda xls, cfg, plan, ec: {s: None for s in delays})
+    monkeypatch.setattr(scheduler, "split_reused", lambda frames, cfg, config_dir, state: (frames, {}, {}))
+    monkeypatch.setattr(scheduler, "plan_units", lambda todo, *a, **kw: [ExtractUnit([s]) for s in todo])
+
+    def extract_unit(unit, frames, *a):
+        time.sleep(delays[unit.sheets[0]])
+        return {s: {"a": 1} for s in unit.sheets}
+
+    def para(pid, task, extracted, ec, config_dir, cache=None, *a):
+        if "prompt" not in task:
+            return process_paragraph(pid, task, extracted, ec, config_dir, cache)
+        with lock:
+            seen[pid] = {s: (v, dict(v)) for s, v in extracted.items()}
+        time.sleep(0.05)
+        return f"text:{pid}"
+
+    monkeypatch.setattr(scheduler, "extract_unit", extract_unit)
+    monkeypatch.setattr(scheduler, "process_paragraph", para)
+    plan = {"paras_skip": set(), "sheets_skip": set()}
+    extracted, gen_ctx = scheduler.run_pipelined(None, {s: {} for s in delays}, para_cfg, plan, ErrorCollector(),
+                                                 tmp_path, max_workers=4)
+    return extracted, gen_ctx, seen
+
+def test_fill_runs_in_config_order_relative_to_readers(monkeypatch, tmp_path):
+    para_cfg = {
+        "g1": {"prompt": "p.txt", "keys": ["S.a", "T.a"]},
+        "f2": {"keys": ["S.b", "新.x"]},
+        "g3": {"prompt": "p.txt", "keys": ["S.b"]},
+    }
+    extracted, gen_ctx, seen = _run(monkeypatch, tmp_path, para_cfg, {"S": 0.0, "T": 0.2})
+    ref, snapshot = seen["g1"]["S"]
+    assert "b" not in snapshot and "b" not in ref          # 之后的 fill 不写进先开始的生成看到的 dict
+    assert seen["g3"]["S"][1]["b"] == "-"                   # 之前的 fill 对之后的段落可见
+    assert extracted["S"] == {"a": 1, "b": "-"}
+    assert list(extracted) == ["S", "T", "新"]
+    assert list(gen_ctx) == ["g1", "g3"]
+
+def test_fill_does_not_wait_for_unrelated_sheets(monkeypatch, tmp_path):
+    para_cfg = {"f1": {"keys": ["S.b"]}, "g2": {"prompt": "p.txt", "keys": ["S.b"]}, "g3": {"prompt": "p.txt", "keys": ["T.a"]}}
+    t0 = time.perf_counter()
+    extracted, gen_ctx, seen = _run(monkeypatch, tmp_path, para_cfg, {"S": 0.0, "T": 0.3})
+    assert seen["g2"]["S"][1]["b"] == "-"
+    assert "T" not in seen["g2"]                            # g2 只等 S（和 f1），没有等 T
+    assert list(gen_ctx) == ["g2", "g3"]
+    assert time.perf_counter() - t0 < 0.6
@@ -0,0 +1,18 @@
+# utils/hashing.py
+from __future__ import annotations
+from pathlib import Path
+import hashlib, json
+
+def sha256_text(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def sha256_json(obj) -> str:
+    """对可 JSON 序列化的对象做稳定哈希（键排序、非 ASCII 原样保留）。"""
+    return sha256_text(json.dumps(obj, ensure_ascii=False, sort_keys=True, default=str))
+
+def sha256_file(path: Path, chunk_size: int = 1 << 20) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(chunk_size), b""):
+            h.update(block)
+    return h.hexdigest()
@@ -0,0 +1,83 @@
+# utils/table_text.py
+"""
+表格 → 提示词文本的序列化。
+- csv          原样 df.to_csv（旧行为，保留所有空行/空列/NaN/长浮点）
+- compact_csv  清洗后的 CSV
+- tsv          清洗后的制表符分隔
+- markdown     清洗后的 Markdown 表格
+清洗：去全空行/列、Unnamed 表头置空（全空则不输出表头）、NaN → 空、浮点按 float_digits 四舍五入并去尾零。
+"""
+from __future__ import annotations
+import csv, io, math, re
+import pandas as pd
+
+TABLE_FORMATS = ("csv", "compact_csv", "tsv", "markdown")
+DEFAULT_FLOAT_DIGITS = 4
+
+_UNNAMED_RE = re.compile(r"^Unnamed: \d+(_level_\d+)?$")
+_WS_RE      = re.compile(r"\s+")
+
+def _fmt_cell(v, float_digits: int) -> str:
+    if v is None or (isinstance(v, float) and math.isnan(v)) or v is pd.NaT:
+        return ""
+    if isinstance(v, bool):
+        return str(v)
+    if isinstance(v, float):
+        if v.is_integer():
+            return str(int(v))
+        s = f"{v:.{float_digits}f}".rstrip("0").rstrip(".")
+        return s if s not in ("", "-0") else "0"
+    if isinstance(v, pd.Timestamp):
+        return v.strftime("%Y-%m-%d") if v == v.normalize() else v.strftime("%Y-%m-%d %H:%M:%S")
+    return _WS_RE.sub(" ", str(v)).strip()
+
+def _fmt_header(h) -> str:
+    s = _WS_RE.sub(" ", str(h)).strip()
+    return "" if _UNNAMED_RE.match(s) or s.lower() == "nan" else s
+
+def clean_table(df: pd.DataFrame, float_digits: int | None = None) -> pd.DataFrame:
+    """返回全字符串的清洗后表格（去全空行/列、规范表头、格式化数值）。"""
+    digits = DEFAULT_FLOAT_DIGITS if float_digits is None else int(float_digits)
+    out = df.map(lambda v: _fmt_cell(v, digits)) if hasattr(df, "map") else df.applymap(lambda v: _fmt_cell(v, digits))
+    out.columns = [_fmt_header(c) for c in df.columns]
+    non_blank = out.ne("")
+    keep_cols = non_blank.any(axis=0).to_numpy() | pd.Series(out.columns).ne("").to_numpy()
+    out = out.loc[non_blank.any(axis=1), keep_cols]
+    return out.reset_index(drop=True)
+
+def render_table(df: pd.DataFrame, fmt: str = "csv") -> str:
+    """把（已清洗的）表格渲染为文本；表头全空时不输出表头行。"""
+    if fmt == "csv":
+        return df.to_csv(index=False)
+
+    header = list(df.columns) if any(df.columns) else None
+    rows   = df.values.tolist()
+
+    if fmt == "markdown":
+        def line(cells): return "| " + " | ".join(str(c).replace("|", "\\|") for c in cells) + " |"
+        lines = []
+        width = len(df.columns)
+        lines.append(line(header or [""] * width))
+        lines.append("|" + "---|" * width)
+        lines.extend(line(r) for r in rows)
+        return "\n".join(lines) + "\n"
+
+    if fmt == "tsv":
+        lines = ["\t".join(header)] if header else []
+        lines.extend("\t".join(c.replace("\t", " ") for c in r) for r in rows)
+        return "\n".join(lines) + "\n"
+
+    # compact_csv
+    buf = io.StringIO()
+    w = csv.writer(buf, lineterminator="\n")
+    if header:
+        w.writerow(header)
+    w.writerows(rows)
+    return buf.getvalue()
+
+def serialize_table(df: pd.DataFrame, fmt: str = "csv", float_digits: int | None = None) -> str:
+    if fmt not in TABLE_FORMATS:
+        raise ValueError(f"不支持的表格格式：{fmt}（可选 {', '.join(TABLE_FORMATS)}）")
+    if fmt == "csv":
+        return df.to_csv(index=False)
+    return render_table(clean_table(df, float_digits), fmt)
@@ -0,0 +1,13 @@
+# utils/tokens.py
+from __future__ import annotations
+import re
+
+# CJK 统一表意文字 / 全角标点：大致 1 字 ≈ 1 token；其余字符大致 4 字符 ≈ 1 token
+_CJK_RE = re.compile(r"[　-〿㐀-䶿一-鿿＀-￯]")
+
+def estimate_tokens(text: str) -> int:
+    """粗略估算 token 数（不依赖具体分词器，只用于预算切分/统计）。"""
+    if not text:
+        return 0
+    cjk = len(_CJK_RE.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
@@ -1,60 +1,171 @@
 # validator/docx_scan.py
 from __future__ import annotations
 from pathlib import Path
-import zipfile
-import re
+import json, logging, os, re, threading, zipfile
 from xml.etree import ElementTree as ET
 
+from utils.hashing import sha256_file
+
+SYS_LOG = logging.getLogger("system")
+
 # 匹配 {{ ... }}，只抓内部表达式（跨行也行）
 JINJA_RE = re.compile(r"{{\s*(.+?)\s*}}", flags=re.DOTALL)
 
-def _read_xml_text_ordered(z: zipfile.ZipFile, member: str) -> str:
-    """把指定部件（document/header/footer）里的 <w:t> 文本按出现顺序拼接成纯文本。"""
+W_NS = "http://schemas.openxmlformats.org/wordprocessingml/2006/main"
+_W_T = f"{{{W_NS}}}t"
+
+# 占位符索引：<project_root>/.cache/placeholders.json，{模板 sha256: [表达式, ...]}，保留最近 INDEX_KEEP 个模板版本
+INDEX_KEEP = 16
+_index_lock = threading.Lock()
+_index_mem: dict[str, list[str]] = {}
+
+class _Matcher:
+    """
+    流式匹配 {{ ... }}：逐段喂入文本，跨 <w:t>/run 边界也能匹配。
+    结果与对整段文本执行 JINJA_RE.finditer 一致（含花括号内全是空白等边界情况），表达式 strip。
+    只缓存“尚未闭合的占位符”那一段文本，内存与模板大小无关。
+    """
+
+    def __init__(self):
+        self.buf    = ""
+        self.inside = False
+        self.pos    = 0          # inside 时已检查过的位置，避免重复查找
+        self.found: list[str] = []
+
+    def feed(self, text: str):
+        if not text:
+            return
+        self.buf += text
+        while True:
+            if not self.inside:
+                i = self.buf.find("{{")
+                if i < 0:
+                    self.buf = self.buf[-1:] if self.buf.endswith("{") else ""
+                    return
+                self.buf, self.inside, self.pos = self.buf[i:], True, 3
+            # 与正则一致：前导空白先被 \s* 吃掉，表达式至少一个字符，所以从空白之后再隔一个字符开始找 "}}"
+            w = self._lead_ws()
+            if w is None:
+                return
+            j = self.buf.find("}}", max(self.pos, 3 + w))
+            if j < 0:
+                self.pos = max(3 + w, len(self.buf) - 1)
+                return
+            self.found.append(self.buf[2:j].strip())
+            self.buf, self.inside = self.buf[j + 2:], False
+
+    def _lead_ws(self) -> int | None:
+        """"{{" 之后的前导空白长度；全是空白（还不能确定）时返回 None。"""
+        body = self.buf[2:]
+        rest = body.lstrip()
+        return None if not rest else len(body) - len(rest)
+
+    def finish(self):
+        """
+        文本结束：只剩 "{{  }}"（花括号内全是空白）这种情况时，正则会在找不到更远的 "}}" 后回退为匹配空表达式，
+        这里同样补上，并继续扫描其后的文本。
+        """
+        while self.inside:
+            w = self._lead_ws()
+            if not w or not self.buf.startswith("}}", 2 + w):
+                return
+            rest = self.buf[4 + w:]
+            self.found.append("")
+            self.buf, self.inside = "", False
+            self.feed(rest)
+
+    def state(self):
+        return self.buf, self.inside, self.pos, len(self.found)
+
+    def restore(self, state):
+        self.buf, self.inside, self.pos, n = state
+        del self.found[n:]
+
+def _stream_part(z: zipfile.ZipFile, member: str, matcher: _Matcher):
+    """
+    iterparse 逐个元素处理部件（document/header/footer）：<w:t> 文本按出现顺序喂给 matcher，
+    每个元素结束后立即从父元素上摘掉，树中只留当前路径上的祖先，内存与部件大小无关。
+    """
     try:
-        with z.open(member) as f:
-            xml = f.read()
+        f = z.open(member)
     except KeyError:
-        return ""
-    try:
-        root = ET.fromstring(xml)
-    except ET.ParseError:
-        # 兜底：解析失败就退化为原字节解码（极少发生）
-        return xml.decode("utf-8", errors="ignore")
-
-    ns = {"w": "http://schemas.openxmlformats.org/wordprocessingml/2006/main"}
-    texts = []
-    for t in root.findall(".//w:t", ns):
-        # 注意 w:t 可能带 xml:space="preserve"，这里保留原文本
-        texts.append(t.text or "")
-    return "".join(texts)
+        return
+    with f:
+        saved = matcher.state()
+        try:
+            path = []            # 当前元素的祖先链（start 时入栈）
+            for event, elem in ET.iterparse(f, events=("start", "end")):
+                if event == "start":
+                    path.append(elem)
+                    continue
+                path.pop()
+                if elem.tag == _W_T:
+                    # 注意 w:t 可能带 xml:space="preserve"，这里保留原文本
+                    matcher.feed(elem.text or "")
+                elem.clear()
+                if path:
+                    path[-1].remove(elem)    # 只 clear() 会留下空元素挂在父元素上，大文档仍按元素数占内存
+        except ET.ParseError:
+            # 兜底：解析失败就退化为原字节解码（极少发生）
+            matcher.restore(saved)
+            with z.open(member) as raw:
+                matcher.feed(raw.read().decode("utf-8", errors="ignore"))
 
 def scan_placeholders(docx_path: Path) -> list[str]:
     """
-    扫描 docx 中的 Jinja 占位符，返回“花括号内部”的干净表达式列表。
-    - 先把 document.xml / 所有 header*.xml / footer*.xml 的 <w:t> 合并成纯文本
-    - 再用正则抓 {{ ... }}，不包含任何 XML 片段
+    扫描 docx 中的 Jinja 占位符，返回“花括号内部”的干净表达式列表（去重、保持出现顺序）。
+    - 依次流式读取 document.xml / 所有 header*.xml / footer*.xml 的 <w:t> 文本（部件之间视为换行）
+    - 边读边匹配 {{ ... }}，不包含任何 XML 片段
     """
     if not docx_path.exists():
         return []
 
-    pure_texts = []
+    matcher = _Matcher()
     with zipfile.ZipFile(docx_path, "r") as z:
         # 主文档
-        pure_texts.append(_read_xml_text_ordered(z, "word/document.xml"))
+        _stream_part(z, "word/document.xml", matcher)
         # 所有页眉/页脚
         for name in z.namelist():
-            if name.startswith("word/header") and name.endswith(".xml"):
-                pure_texts.append(_read_xml_text_ordered(z, name))
-            if name.startswith("word/footer") and name.endswith(".xml"):
-                pure_texts.append(_read_xml_text_ordered(z, name))
+            if name.startswith(("word/header", "word/footer")) and name.endswith(".xml"):
+                matcher.feed("\n")
+                _stream_part(z, name, matcher)
+    matcher.finish()
 
-    full_text = "\n".join(pure_texts)
-    matches = [m.group(1).strip() for m in JINJA_RE.finditer(full_text)]
     # 去重但保持稳定顺序
-    seen = set()
-    ordered_unique = []
-    for m in matches:
-        if m not in seen:
-            seen.add(m)
-            ordered_unique.append(m)
-    return ordered_unique
+    return list(dict.fromkeys(matcher.found))
+
+def placeholder_index(docx_path: Path, index_path: Path | None = None) -> list[str]:
+    """
+    带缓存的 scan_placeholders：按模板内容 sha256 查索引（进程内 + index_path 文件），模板未变时不再解压扫描。
+    index_path 为 None 时只用进程内缓存。
+    """
+    docx_path = Path(docx_path)
+    if not docx_path.exists():
+        return []
+    key = sha256_file(docx_path)
+    with _index_lock:
+        if key in _index_mem:
+            return list(_index_mem[key])
+    data = {}
+    if index_path is not None:
+        try:
+            data = json.loads(Path(index_path).read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            data = {}
+    found = data.get(key)
+    if found is None:
+        found = scan_placeholders(docx_path)
+        if index_path is not None:
+            data.pop(key, None)
+            data[key] = found
+            data = dict(list(data.items())[-INDEX_KEEP:])
+            try:
+                Path(index_path).parent.mkdir(parents=True, exist_ok=True)
+                tmp = Path(index_path).with_name(f"{Path(index_path).name}.{os.getpid()}.{threading.get_ident()}.tmp")
+                tmp.write_text(json.dumps(data, ensure_ascii=False), encoding="utf-8")
+                os.replace(tmp, index_path)
+            except OSError as e:
+                SYS_LOG.warning(f"占位符索引写入失败：{index_path}：{e}")
+    with _index_lock:
+        _index_mem[key] = list(found)
+    return list(found)
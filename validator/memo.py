@@ -0,0 +1,117 @@
+# validator/memo.py
+"""
+验证报告的缓存：项目输入未变时直接返回上次的报告，不再重新解析 YAML、扫描模板、执行规则。
+
+键 = 规则版本 RULES_VERSION（规则/检查逻辑变更时递增，旧缓存随之失效）
+   + sheet_tasks.yaml / paragraph_tasks.yaml 内容哈希
+   + prompts/ 下所有文件的 (相对路径, 大小, mtime)
+   + 模板的 (大小, mtime)
+   + Excel Sheet 列表 + 是否模拟渲染
+   + 规则会检查的 API Key 环境变量是否存在（不读取值）
+
+两级：进程内（API 重复 /validate、同进程多次运行）+ 磁盘 <project_root>/.cache/validation.json（CLI 多次运行）。
+环境变量 VALIDATE_CACHE=0 关闭。
+"""
+from __future__ import annotations
+from collections import OrderedDict
+from pathlib import Path
+import copy, json, logging, os, threading
+
+from utils.hashing import sha256_json, sha256_file
+
+SYS_LOG = logging.getLogger("system")
+
+ENABLED   = os.getenv("VALIDATE_CACHE", "1").strip().lower() not in ("0", "false", "off", "no")
+MAX_KEEP  = 8
+RULES_VERSION = 1
+_ENV_KEYS = ("DASHSCOPE_API_KEY", "OPENAI_API_KEY")
+
+_lock = threading.Lock()
+_memo: "OrderedDict[str, dict]" = OrderedDict()
+
+def _stat(p: Path):
+    try:
+        st = p.stat()
+        return [st.st_size, st.st_mtime_ns]
+    except OSError:
+        return None
+
+def _file_hash(p: Path) -> str | None:
+    try:
+        return sha256_file(p)
+    except OSError:
+        return None
+
+def validation_key(config_dir: Path, excel_sheets: list[str] | None, simulate_render: bool) -> str:
+    config_dir = Path(config_dir)
+    biz, prompts = config_dir / "business_configs", config_dir / "prompts"
+    prompt_files = sorted(
+        [p.relative_to(prompts).as_posix(), *(_stat(p) or [])]
+        for p in (prompts.rglob("*") if prompts.is_dir() else []) if p.is_file()
+    )
+    return sha256_json({
+        "rules":           RULES_VERSION,
+        "sheet_tasks":     _file_hash(biz / "sheet_tasks.yaml"),
+        "paragraph_tasks": _file_hash(biz / "paragraph_tasks.yaml"),
+        "prompts":         prompt_files,
+        "template":        _stat(config_dir / "template" / "report_template.docx"),
+        "excel_sheets":    list(excel_sheets) if excel_sheets is not None else None,
+        "simulate_render": bool(simulate_render),
+        "env":             {k: bool(os.environ.get(k)) for k in _ENV_KEYS},
+    })
+
+def _disk_path(config_dir: Path) -> Path:
+    return Path(config_dir).parent / ".cache" / "validation.json"
+
+def _restore_tags(report: dict) -> dict:
+    # JSON 往返会把 tag 元组变成列表；还原成与新计算一致的结构
+    for f in report.get("findings", []):
+        if isinstance(f.get("tag"), list):
+            f["tag"] = tuple(f["tag"])
+    return report
+
+def get(config_dir: Path, key: str) -> dict | None:
+    if not ENABLED:
+        return None
+    with _lock:
+        report = _memo.get(key)
+        if report is not None:
+            _memo.move_to_end(key)
+            return copy.deepcopy(report)
+    try:
+        data = json.loads(_disk_path(config_dir).read_text(encoding="utf-8"))
+        report = data.get(key)
+    except (OSError, ValueError):
+        return None
+    if report is None:
+        return None
+    report = _restore_tags(report)
+    _remember(key, report)
+    return copy.deepcopy(report)
+
+def _remember(key: str, report: dict):
+    with _lock:
+        _memo[key] = copy.deepcopy(report)
+        _memo.move_to_end(key)
+        while len(_memo) > MAX_KEEP * 4:
+            _memo.popitem(last=False)
+
+def put(config_dir: Path, key: str, report: dict):
+    if not ENABLED:
+        return
+    _remember(key, report)
+    path = _disk_path(config_dir)
+    try:
+        try:
+            data = json.loads(path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            data = {}
+        data.pop(key, None)
+        data[key] = report
+        data = dict(list(data.items())[-MAX_KEEP:])
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        tmp.write_text(json.dumps(data, ensure_ascii=False, default=str), encoding="utf-8")
+        os.replace(tmp, path)
+    except Exception as e:
+        SYS_LOG.warning(f"验证结果缓存写入失败：{path}：{e}")
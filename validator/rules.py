@@ -4,9 +4,13 @@ from pathlib import Path
 import re
 from typing import List, Dict, Tuple
 
-from validator.docx_scan import scan_placeholders
+from validator.docx_scan import placeholder_index
+from utils.table_text import TABLE_FORMATS
+from agents.extract_computed import parse_expr, ComputeError
+from core.router import parse_route
 
 SUPPORTED_TYPES = {"string", "number", "array[string]"}
+SUPPORTED_REDUCERS = {"first", "sum", "max", "min", "concat"}
 # 字段名/段落ID约束：禁止 '.' / 花括号 / 空白；不强制英文，尽量宽松
 ILLEGAL_CHARS_RE = re.compile(r"[.\s{}]")
 SIMPLE_ID_RE = re.compile(r"^[^\s.{}][^\s{}]*$")  # 段落ID：不含空格/点/花括号
@@ -31,6 +35,30 @@ def _is_safe_relative(path_str: str) -> bool:
         return False
     return True
 
+def _check_provider(cfg: dict, tag) -> list[dict]:
+    findings: List[Dict] = []
+    provider = cfg.get("provider")
+    if provider:
+        if not isinstance(provider, (str, list, dict)):
+            findings.append(_warn("CONFIG", f"provider 应为字符串/列表/字典：{provider}；将回退默认", tag=tag))
+            return findings
+        if isinstance(provider, dict) and any(not isinstance(w, (int, float)) or w < 0 for w in provider.values()):
+            findings.append(_warn("CONFIG", f"provider 权重应为非负数：{provider}", tag=tag))
+        for name, _ in parse_route(provider):
+            prov = str(name).lower().strip()
+            if prov not in {"qwen", "openai"}:
+                findings.append(_warn("CONFIG", f"未知 provider={name}：将回退默认", tag=tag))
+            else:
+                # 环境变量提示（不读取值）
+                need_env = "DASHSCOPE_API_KEY" if prov == "qwen" else "OPENAI_API_KEY"
+                import os
+                if not os.environ.get(need_env):
+                    findings.append(_warn("CONFIG", f"provider={prov} 未检测到 {need_env} 环境变量（可能导致运行时报 401）", tag=tag))
+    fo = cfg.get("failover_after")
+    if fo is not None and (not isinstance(fo, (int, float)) or fo < 0):
+        findings.append(_warn("CONFIG", f"failover_after 应为非负秒数：{fo}", tag=tag))
+    return findings
+
 def check_yaml_and_files(config_dir: Path, sheet_cfg: dict, para_cfg: dict) -> list[dict]:
     """对 YAML 结构 & 文件存在性做稳健校验（容错 None/类型错误）。"""
     findings: List[Dict] = []
@@ -48,8 +76,12 @@ def check_yaml_and_files(config_dir: Path, sheet_cfg: dict, para_cfg: dict) -> l
 
         # prompt
         p_rel = cfg.get("prompt")
+        compute = cfg.get("compute") or {}
+        all_computed = isinstance(compute, dict) and bool(compute) and isinstance(cfg.get("keys"), dict) \
+            and set(cfg["keys"]) <= set(compute)
         if not p_rel:
-            findings.append(_warn("CONFIG", f"sheet {sname} 缺少 prompt，将跳过抽取", tag=("sheet", sname)))
+            if not all_computed:   # 所有 key 都可直接计算时不需要 prompt
+                findings.append(_warn("CONFIG", f"sheet {sname} 缺少 prompt，将跳过抽取", tag=("sheet", sname)))
         else:
             if not _is_safe_relative(p_rel):
                 findings.append(_err("CONFIG", f"sheet {sname} 的 prompt 路径不安全（只允许相对路径且不得包含 ..）：{p_rel}", tag=("sheet", sname)))
@@ -59,6 +91,16 @@ def check_yaml_and_files(config_dir: Path, sheet_cfg: dict, para_cfg: dict) -> l
             elif p_abs.is_dir():
                 findings.append(_err("CONFIG", f"sheet {sname} 的 prompt 指向目录而非文件：{p_abs}", tag=("sheet", sname)))
 
+        # source / sheet（可选）：从其它工作簿 / 不同名的 Sheet 取数
+        src = cfg.get("source")
+        if src is not None and (not isinstance(src, str) or not src.strip()):
+            findings.append(_err("CONFIG", f"sheet {sname} 的 source 应为文件名或通配符：{src}", tag=("sheet", sname)))
+        elif src is not None and not _is_safe_relative(src):
+            findings.append(_err("CONFIG", f"sheet {sname} 的 source 路径不安全（只允许 input 目录下的相对路径且不得包含 ..）：{src}", tag=("sheet", sname)))
+        real = cfg.get("sheet")
+        if real is not None and (not isinstance(real, str) or not real.strip()):
+            findings.append(_err("CONFIG", f"sheet {sname} 的 sheet 应为工作簿中的 Sheet 名：{real}", tag=("sheet", sname)))
+
         # keys
         keys = cfg.get("keys", {})
         if not isinstance(keys, dict) or not keys:
@@ -78,18 +120,45 @@ def check_yaml_and_files(config_dir: Path, sheet_cfg: dict, para_cfg: dict) -> l
             if typ not in SUPPORTED_TYPES:
                 findings.append(_warn("CONFIG", f"不支持的类型 {typ}：按 string 处理（{sname}.{field_name}）", tag=("field", f"{sname}.{field_name}")))
 
-        # provider（可选）软校验
-        provider = cfg.get("provider")
-        if provider:
-            prov = str(provider).lower().strip()
-            if prov not in {"qwen", "openai"}:
-                findings.append(_warn("CONFIG", f"未知 provider={provider}：将回退默认", tag=("sheet", sname)))
+        # compute / names（可选）：不调用 LLM 的计算型 key
+        if not isinstance(compute, dict):
+            findings.append(_warn("CONFIG", f"sheet {sname} 的 compute 不是对象，将忽略", tag=("sheet", sname)))
+        else:
+            for field_name, expr in compute.items():
+                if field_name not in keys:
+                    findings.append(_warn("CONFIG", f"compute 中的字段未在 keys 声明：{sname}.{field_name}", tag=("field", f"{sname}.{field_name}")))
+                try:
+                    parse_expr(expr)
+                except ComputeError as e:
+                    findings.append(_err("CONFIG", f"{sname}.{field_name} 的 compute 表达式非法：{e}", tag=("field", f"{sname}.{field_name}")))
+        if cfg.get("names") is not None and not isinstance(cfg.get("names"), dict):
+            findings.append(_warn("CONFIG", f"sheet {sname} 的 names 不是对象，将忽略", tag=("sheet", sname)))
+
+        # table_format / float_digits（可选）：表格序列化方式
+        fmt = cfg.get("table_format")
+        if fmt is not None and fmt not in TABLE_FORMATS:
+            findings.append(_err("CONFIG", f"sheet {sname} 的 table_format 不支持：{fmt}（可选 {', '.join(TABLE_FORMATS)}）", tag=("sheet", sname)))
+        digits = cfg.get("float_digits")
+        if digits is not None and (not isinstance(digits, int) or digits < 0):
+            findings.append(_warn("CONFIG", f"sheet {sname} 的 float_digits 应为非负整数：{digits}", tag=("field", f"{sname}.float_digits")))
+
+        # chunking（可选）：分块预算与合并规则
+        chunking = cfg.get("chunking")
+        if chunking is not None:
+            if not isinstance(chunking, dict):
+                findings.append(_warn("CONFIG", f"sheet {sname} 的 chunking 不是对象，将忽略", tag=("field", f"{sname}.chunking")))
             else:
-                # 环境变量提示（不读取值）
-                need_env = "DASHSCOPE_API_KEY" if prov == "qwen" else "OPENAI_API_KEY"
-                import os
-                if not os.environ.get(need_env):
-                    findings.append(_warn("CONFIG", f"provider={prov} 未检测到 {need_env} 环境变量（可能导致运行时报 401）", tag=("sheet", sname)))
+                budget = chunking.get("max_tokens")
+                if budget is not None and (not isinstance(budget, int) or budget <= 0):
+                    findings.append(_warn("CONFIG", f"sheet {sname} 的 chunking.max_tokens 应为正整数：{budget}", tag=("field", f"{sname}.chunking")))
+                for field_name, reducer in (chunking.get("reducers") or {}).items():
+                    if reducer not in SUPPORTED_REDUCERS:
+                        findings.append(_warn("CONFIG", f"不支持的合并规则 {reducer}：按 first 处理（{sname}.{field_name}）", tag=("field", f"{sname}.{field_name}")))
+                    elif field_name not in keys:
+                        findings.append(_warn("CONFIG", f"chunking.reducers 中的字段未在 keys 声明：{sname}.{field_name}", tag=("field", f"{sname}.{field_name}")))
+
+        # provider（可选）软校验：单个 / 有序列表 / 加权字典
+        findings.extend(_check_provider(cfg, ("sheet", sname)))
 
     # ---------- paragraphs 基础 ----------
     if not isinstance(para_cfg, dict):
@@ -126,6 +195,7 @@ def check_yaml_and_files(config_dir: Path, sheet_cfg: dict, para_cfg: dict) -> l
                     findings.append(_err("CONFIG", f"段落 {pid} 的 prompt 文件不存在：{p_abs}", tag=("para", pid)))
                 elif p_abs.is_dir():
                     findings.append(_err("CONFIG", f"段落 {pid} 的 prompt 指向目录而非文件：{p_abs}", tag=("para", pid)))
+            findings.extend(_check_provider(task, ("para", pid)))
         else:  # fill
             if "prompt" in task:
                 findings.append(_warn("CONFIG", f"段落 {pid} 配置为 fill，但提供了 prompt（将被忽略）", tag=("para", pid)))
@@ -163,6 +233,12 @@ def check_excel_alignment(sheet_cfg: dict, excel_sheets: list[str]) -> list[dict
             findings.append(_warn("EXCEL", f"Excel 中不存在 Sheet：{sname}（将跳过）", tag=("sheet", sname)))
     return findings
 
+def check_excel_sources(issues: dict[str, tuple[str, str]]) -> list[dict]:
+    """多工作簿输入（WorkbookSet.issues）：source 无匹配、Sheet 不存在、同名 Sheet 出现在多个匹配的工作簿中。"""
+    make = {"error": _err, "warning": _warn}
+    return [make.get(level, _warn)("EXCEL", f"sheet {sname}：{msg}", tag=("sheet", sname))
+            for sname, (level, msg) in (issues or {}).items()]
+
 def check_paragraph_keys(para_cfg: dict, sheet_cfg: dict) -> list[dict]:
     findings = []
     for pid, task in (para_cfg or {}).items():
@@ -186,8 +262,9 @@ def check_paragraph_keys(para_cfg: dict, sheet_cfg: dict) -> list[dict]:
     return findings
 
 def check_template_placeholders(config_dir: Path, sheet_cfg: dict, para_cfg: dict):
-    """扫描模板占位符，并与配置交叉校验。"""
-    placeholders = scan_placeholders(config_dir / "template" / "report_template.docx")
+    """扫描模板占位符（按模板哈希复用 <project_root>/.cache/placeholders.json 中的索引），并与配置交叉校验。"""
+    placeholders = placeholder_index(config_dir / "template" / "report_template.docx",
+                                     config_dir.parent / ".cache" / "placeholders.json")
     findings = []
 
     variables_paths: set[str] = set()
@@ -2,8 +2,8 @@
 from __future__ import annotations
 from pathlib import Path
 from typing import Dict, Any, Tuple, List
-from docxtpl import DocxTemplate
-from jinja2 import Environment, StrictUndefined
+
+from io_utils.template_pool import get_template
 
 # 生成虚拟上下文：模仿运行时的 render_ctx = {**extracted, **gen_ctx}
 def build_fake_context(sheet_cfg: dict, para_cfg: dict) -> dict:
@@ -42,11 +42,10 @@ def simulate_template_render(config_dir: Path, sheet_cfg: dict, para_cfg: dict)
     fake_ctx = build_fake_context(sheet_cfg, para_cfg)
 
     try:
-        doc = DocxTemplate(tpl_path)
-        # 使用 StrictUndefined：任何未定义变量/占位符都会抛错
-        env = Environment(undefined=StrictUndefined, autoescape=False)
+        # 模板池中的独立副本；strict=True：使用 StrictUndefined 环境，任何未定义变量/占位符都会抛错
+        doc = get_template(tpl_path, strict=True)
         # ⚠️ 不保存文件，只做内存渲染
-        doc.render(fake_ctx, jinja_env=env)
+        doc.render(fake_ctx)
         return ([], {"ok": True})
     except Exception as e:
         return ([{"level": "error", "where": "RENDER", "msg": f"模板模拟渲染失败：{e}"}], {"ok": False, "error": str(e)})
@@ -4,21 +4,41 @@ from pathlib import Path
 import logging
 import pandas as pd
 
-from io_utils.loaders import load_yaml_strict, load_excel_first
+from io_utils.loaders import load_yaml_strict, load_inputs, Workbook, WorkbookSet
 from validator.rules import (
     check_yaml_and_files,
     check_excel_alignment,
+    check_excel_sources,
     check_paragraph_keys,
     check_template_placeholders,
     check_naming_conflicts,
 )
 from validator.simulate import simulate_template_render
 from validator.report import make_report, write_report_files
+from validator import memo
 from core.logging_setup import setup_logging
 
 SYS_LOG = logging.getLogger("system")
 
-def validate_configs(config_dir: Path, xls: pd.ExcelFile | None, simulate_render: bool = False) -> dict:
+def _sheet_key(xls: Workbook | WorkbookSet | None) -> list | None:
+    if xls is None:
+        return None
+    if isinstance(xls, WorkbookSet):      # 多工作簿：任务落到哪个文件、哪些任务无法定位也影响报告
+        return [list(xls.sheet_names), xls.describe(), xls.issues]
+    return list(xls.sheet_names)
+
+def validate_configs(config_dir: Path, xls: Workbook | WorkbookSet | None, simulate_render: bool = False) -> dict:
+    """项目输入（YAML / prompts / 模板 / Sheet 列表 / Key 环境变量）未变时直接返回缓存的报告（见 validator/memo.py）。"""
+    key = memo.validation_key(config_dir, _sheet_key(xls), simulate_render)
+    report = memo.get(config_dir, key)
+    if report is not None:
+        SYS_LOG.info(f"验证结果命中缓存（输入未变化）：severity={report.get('severity')}")
+        return report
+    report = _validate(config_dir, xls, simulate_render)
+    memo.put(config_dir, key, report)
+    return report
+
+def _validate(config_dir: Path, xls: Workbook | WorkbookSet | None, simulate_render: bool) -> dict:
     findings = []
     placeholders_info = {"variables": [], "paragraphs": [], "others": [], "raw": []}
     sim_info = {"enabled": bool(simulate_render), "ok": None, "error": None}
@@ -46,7 +66,9 @@ def validate_configs(config_dir: Path, xls: pd.ExcelFile | None, simulate_render
     excel_sheets = []
     if xls:
         excel_sheets = list(xls.sheet_names)
-        findings += check_excel_alignment(sheet_cfg, excel_sheets)
+        issues = getattr(xls, "issues", {})
+        findings += check_excel_sources(issues)
+        findings += check_excel_alignment({k: v for k, v in sheet_cfg.items() if k not in issues}, excel_sheets)
         findings += check_paragraph_keys(para_cfg, sheet_cfg)
 
     # ---- 命名冲突（段落ID vs Sheet 名） ----
@@ -87,13 +109,14 @@ def validate_configs_cli(
         # 初始化日志（验证阶段也输出到指定日志目录）
         setup_logging(logs_dir if logs_dir is not None else (root / "logs"))
 
+        # sheet_tasks.yaml 的 source / sheet 决定要打开哪些工作簿；解析失败时按单工作簿处理，错误由验证器报告
+        sheet_cfg = load_yaml_strict(config_dir / "business_configs" / "sheet_tasks.yaml")[0]
         xls = None
         if excel_path:
-            from pandas import ExcelFile
-            xls = ExcelFile(excel_path)
+            xls = load_inputs(config_dir / "input", sheet_cfg, snapshot_root=root, excel_path=excel_path)
         else:
             try:
-                xls = load_excel_first(config_dir / "input")
+                xls = load_inputs(config_dir / "input", sheet_cfg, snapshot_root=root)
             except Exception as _:
                 xls = None
 